@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Нагрузочные замеры хранения и запросов.
+
+Для каждого формата хранения и размера таблицы
+"users name:str age:int is_active:bool" замеряются: пакетная вставка
+(записей в секунду), вставка одной записи, выборка по ID, выборка
+диапазона, обновление и удаление одной записи (p50/p95 в мс), время
+запуска процесса до первого ответа и пиковый объем памяти (RSS).
+Каждый сценарий выполняется несколько раз, каждый раз в отдельном
+процессе во временном каталоге; в результат идут медианы метрик
+и их разброс между запусками. Результаты сохраняются в JSON
+и сравниваются с базовыми:
+
+    python -m benchmarks.run --sizes 1000 100000 --compare
+    python -m benchmarks.run --save-baseline
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+STORAGE_FORMATS = ("json", "log", "columnar")
+DEFAULT_SIZES = (1000, 100000)
+TABLE = "users"
+COLUMNS = ["name:str", "age:int", "is_active:bool"]
+SEED = 42
+
+# сколько раз повторяется чтение и изменение в сценарии
+READ_REPEATS = 200
+RANGE_REPEATS = 50
+# изменения json-таблицы перезаписывают файл целиком, поэтому
+# на больших таблицах их число уменьшается
+WRITE_BUDGET = 2_000_000
+MIN_WRITE_REPEATS = 5
+MAX_WRITE_REPEATS = 200
+
+# сколько раз выполняется каждый сценарий
+DEFAULT_REPEATS = 3
+
+# допустимое ухудшение относительно базовых результатов; если разброс
+# метрики между запусками больше, допуск расширяется до разброса
+DEFAULT_THRESHOLD = 0.25
+# разница времени, которая считается погрешностью замера
+MIN_DIFFERENCE_MS = 0.1
+
+# первый запрос в новом процессе (время запуска)
+STARTUP_CODE = """
+from src.primitive_db.database import Database
+db = Database()
+db.recover()
+db.select("users", [("ID", "=", "0")])
+"""
+
+
+def generate_rows(count, rng):
+    """
+    Возвращает поток записей [имя, возраст, активен]
+    """
+    for i in range(count):
+        yield [f"user{i}", str(rng.randint(18, 90)),
+               "True" if rng.random() < 0.5 else "False"]
+
+def percentile(samples, value):
+    samples = sorted(samples)
+    rank = max(math.ceil(value / 100 * len(samples)), 1)
+    return samples[rank - 1]
+
+def timed(func, repeats):
+    """
+    Вызывает func(i) repeats раз, возвращает (p50, p95) в мс
+    """
+    samples = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        func(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(percentile(samples, 50), 3), round(percentile(samples, 95), 3)
+
+def measure_startup():
+    """
+    Время от запуска нового процесса до ответа на первый запрос, мс
+    """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", STARTUP_CODE], check=True,
+                   env={**os.environ, "PYTHONPATH": ROOT})
+    return round((time.perf_counter() - start) * 1000, 1)
+
+def run_scenario(storage, size):
+    """
+    Выполняет сценарий в текущем каталоге и возвращает словарь метрик
+    """
+    from src.primitive_db.core import select_cacher
+    from src.primitive_db.database import Database
+
+    def select(where):
+        # замеряется выполнение запроса, а не кэш результатов select
+        select_cacher.invalidate()
+        return db.select(TABLE, where)
+
+    rng = random.Random(SEED)
+    db = Database(force=True)
+    db.create_table(TABLE, COLUMNS, storage)
+    writes = max(MIN_WRITE_REPEATS,
+                 min(MAX_WRITE_REPEATS, WRITE_BUDGET // size))
+
+    start = time.perf_counter()
+    db.insert_many(TABLE, generate_rows(size, rng))
+    insert_seconds = time.perf_counter() - start
+
+    point_ids = rng.sample(range(size), min(READ_REPEATS, size))
+    point = timed(lambda i: select([("ID", "=", str(point_ids[i]))]),
+                  len(point_ids))
+    ranges = [rng.randint(18, 85) for _ in range(RANGE_REPEATS)]
+    range_select = timed(lambda i: select(
+        [("age", "between", (str(ranges[i]), str(ranges[i] + 4)))]),
+        RANGE_REPEATS)
+    insert_one = timed(lambda i: db.insert(TABLE, [f"new{i}", "30", "True"]),
+                       writes)
+    changed_ids = rng.sample(range(size), min(2 * writes, size))
+    # новое имя всегда отличается от текущего, поэтому каждое
+    # обновление записывается, а не пропускается как пустое
+    update = timed(lambda i: db.update(
+        TABLE, {"name": f"updated{i}"}, [("ID", "=", str(changed_ids[i]))]),
+        writes)
+    delete = timed(lambda i: db.delete(
+        TABLE, [("ID", "=", str(changed_ids[writes + i]))]),
+        min(writes, len(changed_ids) - writes))
+    db.close()
+
+    return {
+        "insert_rows_per_s": round(size / insert_seconds),
+        "insert_one_ms_p50": insert_one[0],
+        "insert_one_ms_p95": insert_one[1],
+        "point_select_ms_p50": point[0],
+        "point_select_ms_p95": point[1],
+        "range_select_ms_p50": range_select[0],
+        "range_select_ms_p95": range_select[1],
+        "update_ms_p50": update[0],
+        "update_ms_p95": update[1],
+        "delete_ms_p50": delete[0],
+        "delete_ms_p95": delete[1],
+        "startup_ms": measure_startup(),
+        # ru_maxrss в Linux - в килобайтах
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+def run_child(storage, size):
+    """
+    Запускает сценарий в отдельном процессе и временном каталоге,
+    чтобы пиковая память и кэши не зависели от других сценариев
+    """
+    with tempfile.TemporaryDirectory(prefix="primitive_db_bench_") as workdir:
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmarks.run", "--scenario",
+             storage, str(size)],
+            cwd=workdir, capture_output=True, text=True,
+            env={**os.environ, "PYTHONPATH": ROOT})
+    if completed.returncode != 0:
+        raise RuntimeError(
+            f"Сценарий {storage}/{size} завершился с ошибкой:\n"
+            f"{completed.stderr}")
+    return json.loads(completed.stdout.splitlines()[-1])
+
+def relative_spread(values):
+    """
+    Разброс значений между запусками: (наибольшее - наименьшее)
+    / медиана
+    """
+    middle = statistics.median(values)
+    return round((max(values) - min(values)) / middle, 3) if middle else 0.0
+
+def summarize(runs):
+    """
+    Сводит результаты запусков сценария: медиана и разброс
+    каждой метрики
+    """
+    medians = {}
+    spreads = {}
+    for metric in runs[0]:
+        values = [run[metric] for run in runs]
+        middle = statistics.median(values)
+        medians[metric] = round(middle, 3) if isinstance(middle, float) \
+            else middle
+        spreads[metric] = relative_spread(values)
+    return medians, spreads
+
+def run_all(storages, sizes, repeats=DEFAULT_REPEATS):
+    results = {}
+    spread = {}
+    for size in sizes:
+        for storage in storages:
+            key = f"{storage}/{size}"
+            print(f"{key}...", file=sys.stderr, flush=True)
+            runs = [run_child(storage, size) for _ in range(repeats)]
+            results[key], spread[key] = summarize(runs)
+    return {"meta": dict(environment(), repeats=repeats),
+            "results": results, "spread": spread}
+
+def environment():
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {"python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": numpy_version,
+            "date": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def higher_is_better(metric):
+    return metric.endswith("_per_s")
+
+def tolerance(current, baseline, key, metric, threshold):
+    """
+    Допустимое изменение метрики: threshold или сумма разбросов
+    метрики между запусками в текущих и базовых результатах,
+    если она больше - изменение в пределах разброса считается
+    погрешностью замера
+    """
+    spread = sum(report.get("spread", {}).get(key, {}).get(metric, 0)
+                 for report in (current, baseline))
+    return max(threshold, spread)
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Сравнивает медианы результатов с базовыми. Возвращает список
+    строк сравнения и список ухудшений больше допуска (см. tolerance)
+    """
+    lines = []
+    regressions = []
+    for key, metrics in current["results"].items():
+        base_metrics = baseline["results"].get(key)
+        if base_metrics is None:
+            continue
+        for metric, value in metrics.items():
+            base = base_metrics.get(metric)
+            if not base or value is None:
+                continue
+            change = (value - base) / base
+            allowed = tolerance(current, baseline, key, metric, threshold)
+            # ухудшение - рост времени и памяти или падение пропускной
+            # способности; разница времени меньше MIN_DIFFERENCE_MS -
+            # погрешность замера
+            worse = -change if higher_is_better(metric) else change
+            noise = "_ms" in metric and abs(value - base) < MIN_DIFFERENCE_MS
+            mark = ""
+            if worse > allowed and not noise:
+                mark = "  УХУДШЕНИЕ"
+                # p95 при малом числе повторов нестабилен
+                # и выводится только для сведения
+                if not metric.endswith("_p95"):
+                    regressions.append(f"{key} {metric}")
+            elif worse < -allowed and not noise:
+                mark = "  улучшение"
+            lines.append(f"{key:16} {metric:22} {base:>10} -> {value:>10} "
+                         f"({change:+.0%}, допуск {allowed:.0%}){mark}")
+    return lines, regressions
+
+def print_results(report):
+    for key, metrics in report["results"].items():
+        print(key)
+        for metric, value in metrics.items():
+            print(f"    {metric:22} {value}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="benchmarks.run",
+        description="замеры производительности хранения и запросов")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=list(DEFAULT_SIZES),
+                        help="размеры таблиц (например 1000 100000 1000000)")
+    parser.add_argument("--storage", nargs="+", choices=STORAGE_FORMATS,
+                        default=list(STORAGE_FORMATS))
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    parser.add_argument("--baseline", default=BASELINE_PATH,
+                        help="файл базовых результатов")
+    parser.add_argument("--compare", action="store_true",
+                        help="сравнить с базовыми результатами")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="сохранить результаты как базовые")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="допустимое ухудшение (доля), по умолчанию 0.25")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS,
+                        help="сколько раз выполнять каждый сценарий "
+                             "(медиана), по умолчанию 3")
+    parser.add_argument("--scenario", nargs=2, metavar=("STORAGE", "SIZE"),
+                        help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.scenario:
+        storage, size = args.scenario
+        print(json.dumps(run_scenario(storage, int(size))))
+        return 0
+
+    report = run_all(args.storage, args.sizes, max(1, args.repeats))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+        print(f"Базовые результаты сохранены в {args.baseline}")
+    print_results(report)
+
+    if args.compare:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        lines, regressions = compare(report, baseline, args.threshold)
+        print("\nСравнение с базовыми результатами:")
+        print("\n".join(lines) or "нет общих сценариев")
+        if regressions:
+            print(f"\nУхудшения больше допуска: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,42 @@
+import threading
 import time
+from collections import OrderedDict
+from contextvars import ContextVar
 from functools import wraps
 
+from src.primitive_db import metrics
+from src.primitive_db.errors import (
+    DatabaseError,
+    OperationCancelled,
+    ValidationError,
+)
+
+# ответ на запрос подтверждения без участия пользователя ("y" или "n"),
+# None - спросить через input(). Задается, например, сервером
+# для каждого запроса по сети
+confirm_answer = ContextVar("confirm_answer", default=None)
+
+
+def describe_error(error):
+    """
+    Сообщение об ошибке команды в том виде, в котором
+    его выводит handle_db_errors
+    """
+    if isinstance(error, OperationCancelled):
+        return str(error)
+    if isinstance(error, FileNotFoundError):
+        return "Ошибка: Файл данных не найден. Возможно, база данных \
+не инициализирована."
+    if isinstance(error, KeyError):
+        return f"Ошибка: Таблица или столбец не найден. {error}"
+    if isinstance(error, ValidationError):
+        return f"Ошибка валидации: {error}"
+    if isinstance(error, DatabaseError):
+        return f"Ошибка: {error}"
+    if isinstance(error, ValueError):
+        return f"Ошибка валидации: {error}"
+    return f"Произошла непредвиденная ошибка: {error}"
+
 
 def handle_db_errors(func):
     """
@@ -10,18 +46,24 @@ def handle_db_errors(func):
     def wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
-        except FileNotFoundError:
-            print(
-"Ошибка: Файл данных не найден. Возможно, база данных не инициализирована.")
-        except KeyError as e:
-            print(f"Ошибка: Таблица или столбец не найден. {e}")
-        except ValueError as e:
-            print(f"Ошибка валидации: {e}")
         except Exception as e:
-            print(f"Произошла непредвиденная ошибка: {e}")
+            print(describe_error(e))
     return wrapper
 
 
+def ask_confirmation(action_name):
+    """
+    Запрашивает подтверждение операции (или берет готовый
+    ответ из confirm_answer). Возвращает True, если операция
+    подтверждена
+    """
+    response = confirm_answer.get()
+    if response is None:
+        response = input(
+f'Вы уверены, что хотите выполнить "{action_name}"? [y/n]: ')
+    return response.lower() == 'y'
+
+
 def confirm_action(action_name):
     """
     Декоратор для подтверждения опасных операций
@@ -29,9 +71,7 @@ def confirm_action(action_name):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            response = input(
-f'Вы уверены, что хотите выполнить "{action_name}"? [y/n]: ')
-            if response.lower() != 'y':
+            if not ask_confirmation(action_name):
                 print("Операция отменена.")
                 return None
             return func(*args, **kwargs)
@@ -41,31 +81,70 @@ f'Вы уверены, что хотите выполнить "{action_name}"? [
 
 def log_time(func):
     """
-    Декоратор для замера времени выполнения функции
+    Декоратор для замера времени выполнения функции. Время
+    записывается в гистограмму операции с именем функции
+    (см. metrics, команда stats); при выключенном сборе
+    метрик функция вызывается без замера
     """
+    operation = func.__name__
+
     @wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.monotonic()
-        result = func(*args, **kwargs)
-        end_time = time.monotonic()
-        execution_time = end_time - start_time
-        print(
-f"Функция {func.__name__} выполнилась за {execution_time:.3f} секунд")
-        return result
+        if not metrics.is_enabled():
+            return func(*args, **kwargs)
+        start_time = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics.observe(operation, time.perf_counter() - start_time)
     return wrapper
 
 
-def create_cacher():
+def create_cacher(max_size=128):
     """
-    функция для кэширования select запросов
+    функция для кэширования select запросов.
+    Хранит не более max_size результатов, вытесняя давно
+    не использованные (LRU). Результат считается устаревшим,
+    если изменилась его версия (например, подпись файла данных)
     """
-    cache = {}
+    cache = OrderedDict()
+    stats = {"hits": 0, "misses": 0, "evictions": 0}
+    # кэш общий для потоков сервера
+    lock = threading.Lock()
     
-    def cache_result(key, value_func):
-        if key in cache:
-            return cache[key]
+    def cache_result(key, value_func, version=None):
+        with lock:
+            entry = cache.get(key)
+            if entry is not None and entry[0] == version:
+                cache.move_to_end(key)
+                stats["hits"] += 1
+                return entry[1]
+            stats["misses"] += 1
         result = value_func()
-        cache[key] = result
+        with lock:
+            cache[key] = (version, result)
+            cache.move_to_end(key)
+            while len(cache) > max_size:
+                cache.popitem(last=False)
+                stats["evictions"] += 1
         return result
-    
-    return cache_result
\ No newline at end of file
+
+    def invalidate(predicate=None):
+        """
+        Удаляет из кэша ключи, для которых predicate(key) истинно,
+        или все ключи, если predicate не задан
+        """
+        with lock:
+            for key in [key for key in cache
+                        if predicate is None or predicate(key)]:
+                del cache[key]
+
+    def get_stats():
+        """
+        Возвращает счетчики попаданий, промахов и вытеснений
+        """
+        return dict(stats, size=len(cache), max_size=max_size)
+
+    cache_result.invalidate = invalidate
+    cache_result.stats = get_stats
+    return cache_result
@@ -0,0 +1,140 @@
+from src.primitive_db.errors import ColumnNotFoundError, ValidationError
+from src.primitive_db.utils import convert_value
+
+# агрегатные функции select
+AGGREGATE_FUNCTIONS = ("count", "sum", "min", "max", "avg")
+
+# функции, применимые только к числовым столбцам
+NUMERIC_FUNCTIONS = ("sum", "avg")
+
+
+def aggregate_label(function, column):
+    """
+    Название столбца результата агрегата: count(*), sum(age)
+    """
+    return f"{function}({column})"
+
+def check_aggregates(table_name, aggregates, column_types):
+    """
+    Проверяет агрегаты [(функция, столбец)]: функция известна,
+    столбец есть в таблице, * - только у count, sum и avg -
+    только для столбцов типа int
+    """
+    for function, column in aggregates:
+        if function not in AGGREGATE_FUNCTIONS:
+            raise ValidationError(f"Неизвестная агрегатная функция '{function}'. \
+Допустимые функции: {', '.join(AGGREGATE_FUNCTIONS)}")
+        if column == "*":
+            if function != "count":
+                raise ValidationError(
+                    f"Функция {function} применяется к столбцу, а не к *")
+            continue
+        if column not in column_types:
+            raise ColumnNotFoundError(
+                f"В таблице '{table_name}' нет столбца '{column}'")
+        if function in NUMERIC_FUNCTIONS and column_types[column] != "int":
+            raise ValidationError(
+                f"Функция {function} применяется к столбцам типа int")
+
+def make_step(function, column, column_type):
+    """
+    Строит функцию учета записи в состоянии агрегата
+    [количество значений, сумма или наименьшее/наибольшее значение].
+    Отсутствующие значения и значения, не приводимые к типу
+    столбца, не учитываются (как NULL в SQL)
+    """
+    if column == "*":
+        def step(state, record):
+            state[0] += 1
+    elif function == "count":
+        def step(state, record):
+            if record.get(column) is not None:
+                state[0] += 1
+    elif function in NUMERIC_FUNCTIONS:
+        def step(state, record):
+            value = convert_value(record.get(column), column_type)
+            if value is not None:
+                state[0] += 1
+                state[1] += value
+    else:
+        better = (lambda value, current: value < current) if function == "min" \
+            else (lambda value, current: value > current)
+
+        def step(state, record):
+            value = convert_value(record.get(column), column_type)
+            if value is None:
+                return
+            if not state[0] or better(value, state[1]):
+                state[1] = value
+            state[0] += 1
+    return step
+
+def final_value(function, state):
+    """
+    Результат агрегата по его состоянию. Без учтенных значений
+    count дает 0, остальные функции - None
+    """
+    count, value = state
+    if function == "count":
+        return count
+    if not count:
+        return None
+    if function == "avg":
+        return value / count
+    return value
+
+def aggregate_records(records, aggregates, group_by, column_types):
+    """
+    Вычисляет агрегаты за один проход по записям с группировкой
+    в хэш-таблице {значения столбцов group by: состояния агрегатов}.
+    Возвращает список пар (значения group by, результаты агрегатов)
+    в порядке первого появления групп. Без group by результат -
+    одна группа, даже если записей нет
+    """
+    steps = [make_step(function, column, column_types.get(column, "str"))
+             for function, column in aggregates]
+    groups = {}
+    if not group_by:
+        states = groups[()] = [[0, 0] for _ in aggregates]
+        for record in records:
+            for step, state in zip(steps, states):
+                step(state, record)
+    else:
+        for record in records:
+            key = tuple([record.get(column) for column in group_by])
+            states = groups.get(key)
+            if states is None:
+                states = groups[key] = [[0, 0] for _ in aggregates]
+            for step, state in zip(steps, states):
+                step(state, record)
+    return [(key, [final_value(function, state)
+                   for (function, _), state in zip(aggregates, states)])
+            for key, states in groups.items()]
+
+def group_records(groups, group_by, labels, columns):
+    """
+    Строит записи результата {столбец: значение} со столбцами
+    columns - столбцами group by и названиями агрегатов
+    """
+    records = []
+    for key, results in groups:
+        values = dict(zip(group_by, key))
+        values.update(zip(labels, results))
+        records.append({column: values[column] for column in columns})
+    return records
+
+def sort_groups(records, order_by, column_types):
+    """
+    Сортирует записи результата по столбцу group by (в его типе)
+    или по агрегату. Пустые значения идут последними
+    """
+    column, descending = order_by
+    column_type = column_types.get(column)
+
+    def sort_key(record):
+        value = record[column]
+        return value if column_type is None else convert_value(value, column_type)
+
+    present = [record for record in records if sort_key(record) is not None]
+    missing = [record for record in records if sort_key(record) is None]
+    return sorted(present, key=sort_key, reverse=descending) + missing
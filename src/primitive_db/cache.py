@@ -0,0 +1,138 @@
+import os
+import threading
+from collections import OrderedDict
+
+from src.primitive_db import metrics
+
+# бюджет памяти кэша таблиц по умолчанию (в байтах исходных файлов)
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def file_signature(filepath):
+    """
+    Возвращает подпись файла (время изменения, размер)
+    или None, если файла нет
+    """
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class TableCache:
+    """
+    Общий для процесса кэш разобранных файлов данных.
+    Запись считается актуальной, пока у файла не изменились
+    время модификации и размер. Объем кэша ограничен бюджетом
+    памяти, при превышении вытесняются давно не использованные
+    таблицы (LRU). Вес записи оценивается по размеру файла,
+    если он не передан явно. Кэшем одновременно пользуются
+    потоки сервера, поэтому его структура защищена блокировкой
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._used_bytes = 0
+        self._lock = threading.RLock()
+
+    def get(self, filepath, loader, weight=None):
+        """
+        Возвращает данные файла из кэша, при промахе или
+        изменении файла на диске загружает их через loader()
+        """
+        signature = file_signature(filepath)
+        with self._lock:
+            entry = self._entries.get(filepath)
+            if entry is not None and signature is not None \
+                    and entry[0] == signature:
+                self._entries.move_to_end(filepath)
+                metrics.count("cache_hits")
+                return entry[1]
+
+        data = loader()
+        metrics.count("cache_misses")
+        if signature is None:
+            self.invalidate(filepath)
+        else:
+            metrics.count("bytes_read",
+                          signature[1] if weight is None else weight)
+            self._store(filepath, signature, data, weight)
+        return data
+
+    def peek(self, filepath):
+        """
+        Возвращает закэшированные данные, только если они
+        соответствуют текущему состоянию файла, иначе None
+        """
+        entry = self._entries.get(filepath)
+        if entry is None or entry[0] != file_signature(filepath):
+            return None
+        return entry[1]
+
+    def put(self, filepath, data, weight=None):
+        """
+        Сохраняет в кэш данные, только что записанные в файл
+        (сквозная запись)
+        """
+        signature = file_signature(filepath)
+        if signature is None:
+            self.invalidate(filepath)
+        else:
+            self._store(filepath, signature, data, weight)
+
+    def invalidate(self, filepath):
+        """
+        Удаляет файл из кэша
+        """
+        with self._lock:
+            entry = self._entries.pop(filepath, None)
+            if entry is not None:
+                self._used_bytes -= entry[2]
+
+    def resize(self, max_bytes):
+        """
+        Меняет бюджет памяти кэша, вытесняя лишние записи
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """
+        Полностью очищает кэш
+        """
+        with self._lock:
+            self._entries.clear()
+            self._used_bytes = 0
+
+    def stats(self):
+        """
+        Возвращает количество таблиц в кэше и занятый объем
+        """
+        with self._lock:
+            return {"entries": len(self._entries),
+                    "used_bytes": self._used_bytes,
+                    "max_bytes": self.max_bytes}
+
+    def _store(self, filepath, signature, data, weight=None):
+        weight = signature[1] if weight is None else weight
+        with self._lock:
+            self.invalidate(filepath)
+            if weight > self.max_bytes:
+                # файл больше всего бюджета - не кэшируем
+                return
+            self._entries[filepath] = (signature, data, weight)
+            self._used_bytes += weight
+            self._evict()
+
+    def _evict(self):
+        while self._used_bytes > self.max_bytes:
+            _, (_, _, old_weight) = self._entries.popitem(last=False)
+            self._used_bytes -= old_weight
+
+
+table_cache = TableCache(
+    int(os.environ.get("PRIMITIVE_DB_CACHE_BYTES", DEFAULT_CACHE_BYTES)))
+metrics.register_source("table_cache", table_cache.stats)
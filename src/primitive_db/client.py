@@ -0,0 +1,83 @@
+import json
+import socket
+
+from src.primitive_db import errors
+from src.primitive_db.server import DEFAULT_HOST, DEFAULT_PORT
+
+
+class Client:
+    """
+    Клиент сервера базы данных. Отправляет команды в том же
+    виде, что и в интерактивном режиме, и возвращает их результат
+    в виде значений (записи select - словарями) или текстом:
+
+        with Client(port=8765) as client:
+            rows = client.execute("select from users where age > 30")
+            print(client.execute_text("info users"))
+
+    Ошибка команды выбрасывается исключением того же класса
+    из errors, что и в Database (прочие - DatabaseError).
+    Соединение хранит свой сеанс: транзакция, начатая командой
+    begin, действует до commit/rollback в этом же соединении
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None):
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._file = self._socket.makefile("rwb")
+        self.closed = False
+
+    def execute(self, command, confirm=False):
+        """
+        Выполняет команду на сервере и возвращает ее результат
+        (см. engine.perform_command). confirm - ответ на запрос
+        подтверждения (delete, drop_table): без confirm=True такие
+        команды отменяются
+        """
+        return self._request(command, confirm, False)["result"]
+
+    def execute_text(self, command, confirm=False):
+        """
+        Выполняет команду и возвращает ее вывод, как в интерактивном
+        режиме
+        """
+        return self._request(command, confirm, True)["output"]
+
+    def _request(self, command, confirm, text):
+        if self.closed:
+            raise ConnectionError("Соединение с сервером закрыто")
+        request = json.dumps({"command": command, "confirm": confirm,
+                              "text": text}, ensure_ascii=False)
+        self._file.write(request.encode("utf-8") + b"\n")
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            self.close()
+            raise ConnectionError("Сервер закрыл соединение")
+        response = json.loads(line)
+        if not response["ok"]:
+            if "error_type" not in response:
+                raise ValueError(response["error"])
+            error_class = getattr(errors, response["error_type"], None)
+            if not (isinstance(error_class, type)
+                    and issubclass(error_class, errors.DatabaseError)):
+                error_class = errors.DatabaseError
+            raise error_class(response["error"])
+        if response.get("closed"):
+            self.close()
+        return response
+
+    def close(self):
+        """
+        Закрывает соединение. Незафиксированная транзакция
+        соединения отменяется сервером
+        """
+        if not self.closed:
+            self.closed = True
+            self._file.close()
+            self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
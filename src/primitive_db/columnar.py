@@ -0,0 +1,345 @@
+import json
+import mmap
+import os
+import shutil
+from array import array
+
+from src.primitive_db.rows import column_values, row_type
+
+# Колоночный формат таблицы - каталог data/<таблица>.col:
+# meta.json   - {"rows": количество записей, "columns": {столбец: тип}}
+# <столбец>.i64 - int: массив int64 (машинный порядок байт)
+# <столбец>.bit - bool: битовая карта, бит i - значение записи i
+# <столбец>.off - str: массив int64 из rows + 1 смещений в файле .str
+# <столбец>.str - str: значения в UTF-8 подряд
+# Значения читаются через mmap, каждый столбец - независимо от остальных
+
+META_FILE = "meta.json"
+
+
+def get_meta_path(table_dir):
+    """
+    Возвращает путь к файлу описания колоночной таблицы
+    """
+    return os.path.join(table_dir, META_FILE)
+
+def read_meta(table_dir):
+    """
+    Читает описание колоночной таблицы
+    """
+    with open(get_meta_path(table_dir), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _write_meta(table_dir, meta):
+    meta_path = get_meta_path(table_dir)
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, meta_path)
+
+def _column_files(table_dir, column, column_type):
+    base = os.path.join(table_dir, column)
+    if column_type == "int":
+        return [base + ".i64"]
+    if column_type == "bool":
+        return [base + ".bit"]
+    return [base + ".off", base + ".str"]
+
+def table_size(table_dir, meta=None):
+    """
+    Возвращает суммарный размер файлов столбцов в байтах
+    """
+    meta = meta or read_meta(table_dir)
+    return sum(os.path.getsize(path)
+               for column, column_type in meta["columns"].items()
+               for path in _column_files(table_dir, column, column_type)
+               if os.path.exists(path))
+
+def _encode_int(value, column):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(
+            f"Значение '{value}' столбца '{column}' не является целым числом")
+
+def _encode_bool(value, column):
+    if value.__class__ is bool:
+        return value
+    text = str(value).lower()
+    if text not in ("true", "false"):
+        raise ValueError(
+            f"Значение '{value}' столбца '{column}' не является boolean")
+    return text == "true"
+
+def check_records(column_types, records):
+    """
+    Проверяет, что значения записей кодируются в типы столбцов
+    так же, как при записи в файлы. Выбрасывает ValueError
+    """
+    for column, column_type in column_types.items():
+        if column_type == "int":
+            for value in column_values(records, column, None):
+                _encode_int(value, column)
+        elif column_type == "bool":
+            for value in column_values(records, column, None):
+                _encode_bool(value, column)
+
+def _trim_columns(table_dir, meta):
+    """
+    Обрезает файлы столбцов до количества записей из описания:
+    хвосты, дописанные прерванной вставкой, отбрасываются
+    """
+    rows = meta["rows"]
+    for column, column_type in meta["columns"].items():
+        files = _column_files(table_dir, column, column_type)
+        if column_type == "int":
+            sizes = [rows * 8]
+        elif column_type == "bool":
+            sizes = [(rows + 7) // 8]
+        else:
+            with open(files[0], 'rb') as f:
+                f.seek(rows * 8)
+                sizes = [(rows + 1) * 8, array('q', f.read(8))[0]]
+        for path, size in zip(files, sizes):
+            if os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+def _write_columns(table_dir, column_types, records, start, append):
+    """
+    Записывает значения столбцов для records, начиная с позиции start
+    (количество уже записанных строк) - дописывая или с нуля.
+    Новые файлы сбрасываются на диск
+    """
+    mode = 'ab' if append else 'wb'
+    for column, column_type in column_types.items():
+        files = _column_files(table_dir, column, column_type)
+        if column_type == "int":
+            values = array('q', (_encode_int(value, column) for value
+                                 in column_values(records, column, None)))
+            with open(files[0], mode) as f:
+                values.tofile(f)
+                _sync(f, append)
+        elif column_type == "bool":
+            _write_bitmap(files[0], start,
+                          [_encode_bool(value, column) for value
+                           in column_values(records, column, None)], append)
+        else:
+            encoded = [str(value).encode('utf-8')
+                       for value in column_values(records, column, '')]
+            # файл смещений всегда начинается с нуля, при дописывании
+            # продолжаем от последнего смещения
+            offset = 0
+            if append:
+                with open(files[0], 'rb') as f:
+                    f.seek(-8, os.SEEK_END)
+                    offset = array('q', f.read(8))[0]
+            offsets = array('q', [] if append else [0])
+            for value in encoded:
+                offset += len(value)
+                offsets.append(offset)
+            with open(files[0], mode) as f:
+                offsets.tofile(f)
+                _sync(f, append)
+            with open(files[1], mode) as f:
+                f.write(b"".join(encoded))
+                _sync(f, append)
+
+def _sync(f, append):
+    # дописанные файлы сбрасываются на диск в контрольной точке WAL
+    if not append:
+        f.flush()
+        os.fsync(f.fileno())
+
+def _write_bitmap(path, start, values, append):
+    """
+    Записывает биты значений начиная с бита start. Неполный
+    последний байт существующей карты дописывается на месте
+    """
+    bitmap = bytearray()
+    first_byte = 0
+    if append and start % 8:
+        with open(path, 'rb') as f:
+            f.seek(start // 8)
+            bitmap.extend(f.read(1))
+        first_byte = start // 8
+    elif append:
+        first_byte = start // 8
+    for i, value in enumerate(values, start=start % 8 if append else 0):
+        if i // 8 >= len(bitmap):
+            bitmap.append(0)
+        if value:
+            bitmap[i // 8] |= 1 << (i % 8)
+    if not append:
+        with open(path, 'wb') as f:
+            f.write(bitmap)
+            _sync(f, append)
+        return
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        f.seek(first_byte)
+        f.write(bitmap)
+        f.truncate()
+
+def write_table(table_dir, column_types, records):
+    """
+    Записывает колоночную таблицу с нуля. Столбцы пишутся
+    во временный каталог, который затем подменяет прежний
+    """
+    tmp_dir = table_dir + ".tmp"
+    old_dir = table_dir + ".old"
+    for path in (tmp_dir, old_dir):
+        if os.path.exists(path):
+            shutil.rmtree(path)
+    os.makedirs(tmp_dir)
+    try:
+        _write_columns(tmp_dir, column_types, records, 0, append=False)
+        _write_meta(tmp_dir, {"rows": len(records), "columns": column_types})
+    except Exception:
+        shutil.rmtree(tmp_dir)
+        raise
+
+    if os.path.exists(table_dir):
+        os.rename(table_dir, old_dir)
+    os.rename(tmp_dir, table_dir)
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+
+def recover_tables(data_dir):
+    """
+    Восстанавливает каталоги колоночных таблиц после сбоя во время
+    перезаписи: если каталога таблицы нет, на его место возвращается
+    полностью записанный новый или прежний каталог. Оставшиеся
+    временные каталоги удаляются
+    """
+    if not os.path.isdir(data_dir):
+        return
+    names = os.listdir(data_dir)
+    for suffix in (".tmp", ".old"):
+        for name in names:
+            if not name.endswith(".col" + suffix):
+                continue
+            path = os.path.join(data_dir, name)
+            table_dir = path[:-len(suffix)]
+            if not os.path.exists(table_dir) \
+                    and os.path.exists(get_meta_path(path)):
+                os.rename(path, table_dir)
+            elif os.path.exists(path):
+                shutil.rmtree(path)
+
+def append_rows(table_dir, records):
+    """
+    Дописывает записи в конец файлов столбцов, не перечитывая таблицу
+    """
+    if not records:
+        return
+    meta = read_meta(table_dir)
+    _trim_columns(table_dir, meta)
+    _write_columns(table_dir, meta["columns"], records, meta["rows"],
+                   append=True)
+    meta["rows"] += len(records)
+    _write_meta(table_dir, meta)
+
+
+def _map_file(path):
+    """
+    Отображает файл в память только для чтения.
+    Пустой файл не отображается - возвращаются пустые байты
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class BitmapColumn:
+    """
+    Столбец bool поверх битовой карты
+    """
+
+    def __init__(self, bitmap, rows):
+        self._bitmap = bitmap
+        self._rows = rows
+
+    def __len__(self):
+        return self._rows
+
+    def __getitem__(self, position):
+        return bool(self._bitmap[position // 8] >> (position % 8) & 1)
+
+    def __iter__(self):
+        bitmap = self._bitmap
+        for position in range(self._rows):
+            yield bool(bitmap[position // 8] >> (position % 8) & 1)
+
+
+class StringColumn:
+    """
+    Столбец str поверх массива смещений и байтов UTF-8.
+    Значение декодируется только при обращении к нему
+    """
+
+    def __init__(self, offsets, data, rows):
+        self._offsets = offsets
+        self._data = data
+        self._rows = rows
+
+    def __len__(self):
+        return self._rows
+
+    def __getitem__(self, position):
+        start = self._offsets[position]
+        return self._data[start:self._offsets[position + 1]].decode('utf-8')
+
+    def __iter__(self):
+        offsets = self._offsets
+        data = self._data
+        for position in range(self._rows):
+            yield data[offsets[position]:offsets[position + 1]].decode('utf-8')
+
+
+class ColumnarReader:
+    """
+    Чтение колоночной таблицы. Файлы столбцов отображаются
+    в память при первом обращении к столбцу
+    """
+
+    def __init__(self, table_dir):
+        self.table_dir = table_dir
+        meta = read_meta(table_dir)
+        self.rows = meta["rows"]
+        self.column_types = meta["columns"]
+        self._columns = {}
+
+    def column(self, name):
+        """
+        Возвращает значения столбца в их типах: int - memoryview
+        над int64, bool - битовая карта, str - декодирование по запросу
+        """
+        if name not in self._columns:
+            column_type = self.column_types[name]
+            files = _column_files(self.table_dir, name, column_type)
+            if column_type == "int":
+                mapped = _map_file(files[0])
+                values = memoryview(mapped).cast('q') if mapped else []
+            elif column_type == "bool":
+                values = BitmapColumn(_map_file(files[0]), self.rows)
+            else:
+                mapped = _map_file(files[0])
+                offsets = memoryview(mapped).cast('q') if mapped else [0]
+                values = StringColumn(offsets, _map_file(files[1]), self.rows)
+            self._columns[name] = values
+        return self._columns[name]
+
+    def records(self, positions=None, columns=None):
+        """
+        Собирает записи для указанных позиций (по умолчанию - все)
+        и столбцов - строки схемы выбранных столбцов (см. rows.Row)
+        со значениями в типах столбцов, без разбора строк
+        """
+        columns = list(self.column_types) if columns is None else columns
+        positions = range(self.rows) if positions is None else positions
+        row_class = row_type({name: self.column_types[name] for name in columns})
+        values = [self.column(name) for name in columns]
+        return [row_class([column[position] for column in values])
+                for position in positions]
@@ -1,10 +1,131 @@
-from prettytable import PrettyTable
+import heapq
+import os
+from itertools import islice
+from operator import ge, gt, le, lt
 
-from src.decorators import confirm_action, create_cacher, handle_db_errors, log_time
-from src.primitive_db.utils import load_table_data, save_table_data
+from src.decorators import create_cacher
+from src.primitive_db import metrics
+from src.primitive_db.aggregate import (
+    aggregate_label,
+    aggregate_records,
+    check_aggregates,
+    group_records,
+    sort_groups,
+)
+from src.primitive_db.errors import (
+    ColumnNotFoundError,
+    NoDataError,
+    TableExistsError,
+    TableNotFoundError,
+    ValidationError,
+)
+from src.primitive_db.index import (
+    INDEX_KINDS,
+    add_index,
+    estimate_index_rows,
+    has_index,
+    has_table_indexes,
+    load_table_indexes,
+    lookup_index,
+    remove_index,
+    save_table_indexes,
+    scan_ordered,
+    update_indexes,
+)
+from src.primitive_db.join import get_max_rows, hash_join, keyed
+from src.primitive_db.locks import locked_table, table_lock
+from src.primitive_db.profiler import stage
+from src.primitive_db.rows import row_factory
+from src.primitive_db.utils import (
+    allocate_ids,
+    commit_table_changes,
+    commit_table_log_file,
+    convert_table_storage,
+    convert_value,
+    count_rows,
+    detect_storage,
+    format_log_put,
+    get_column_types,
+    get_table_columns,
+    get_table_path,
+    get_table_signature,
+    in_transaction,
+    is_table_loaded,
+    load_table_data,
+    open_table_columns,
+    read_import_rows,
+    write_export_rows,
+)
+from src.primitive_db.vector import (
+    as_positions,
+    cached_batch,
+    column_batch,
+    compare,
+    row_batch,
+    union_positions,
+)
+
+# кэш результатов select, общий для всех запросов процесса
+select_cacher = create_cacher(max_size=128)
+metrics.register_source("select_cache", select_cacher.stats)
+
+# размер пачки строк при пакетной вставке и импорте
+BATCH_SIZE = 10000
+
+# доля записей, подходящих под условие, если индекс не дает оценки
+# (постоянные оценки, как в классических оптимизаторах запросов)
+DEFAULT_SELECTIVITY = {"=": 0.1, "!=": 0.9, ">": 1 / 3, ">=": 1 / 3,
+                       "<": 1 / 3, "<=": 1 / 3, "between": 0.25}
+
+# операторы сравнения, выполняемые над типизированными значениями
+COMPARATORS = {">": gt, ">=": ge, "<": lt, "<=": le}
+
+
+def normalize_where_clause(where_clause):
+    """
+    Приводит условие where к виду, не зависящему от порядка
+    условий, для использования в ключе кэша
+    """
+    if where_clause is None:
+        return None
+    return tuple(sorted(map(normalize_condition, where_clause), key=repr))
+
+def normalize_condition(condition):
+    if isinstance(condition, dict):
+        return ("or", tuple(sorted(map(normalize_where_clause, condition["or"]),
+                                   key=repr)))
+    column, operator, value = condition
+    return (column, operator, value if isinstance(value, tuple) else str(value))
+
+def where_conditions(where_clause):
+    """
+    Перебирает условия (column, operator, value) из where,
+    включая условия групп {"or": [список условий, ...]}
+    """
+    for condition in where_clause or ():
+        if isinstance(condition, dict):
+            for branch in condition["or"]:
+                yield from where_conditions(branch)
+        else:
+            yield condition
+
+def require_table(metadata, table_name):
+    """
+    Проверяет, что таблица есть в метаданных
+    """
+    if table_name not in metadata:
+        raise TableNotFoundError(f"Таблица '{table_name}' не существует")
+
+def invalidate_select_cache(table_name):
+    """
+    Сбрасывает закэшированные результаты select для таблицы
+    (и соединений с ее участием)
+    """
+    select_cacher.invalidate(
+        lambda key: key[0] == table_name
+        or (isinstance(key[0], tuple) and table_name in key[0]))
 
 
-@handle_db_errors
 def create_table(metadata, table_name, columns):
     """
     Создает новую таблицу в метаданных
@@ -22,7 +143,7 @@ def create_table(metadata, table_name, columns):
 
     # проверяем, существует ли таблица
     if table_name in metadata:
-        raise ValueError(f'Таблица "{table_name}" уже существует.')
+        raise TableExistsError(f'Таблица "{table_name}" уже существует.')
     
     # проверяем корректность типов и формируем список столбцов
     valid_types = {'int', 'str', 'bool'}
@@ -30,21 +151,19 @@ def create_table(metadata, table_name, columns):
 
     for column in columns:
         if ':' not in column:
-            raise ValueError(
+            raise ValidationError(
                 f'Некорректный формат столбца: {column}')
         col_name, col_type = column.split(':', 1)
         if col_type not in valid_types:
-            raise ValueError(f'Некорректный тип данных: {col_type}. \
+            raise ValidationError(f'Некорректный тип данных: {col_type}. \
 Допустимые типы: int, str, bool')
         
         table_columns.append(f'{col_name}:{col_type}')
     
-    # Добавляем таблицу в метаданные
-    metadata[table_name] = table_columns
+    # Добавляем таблицу в метаданные, next_id - счетчик для новых ID
+    metadata[table_name] = {"columns": table_columns, "next_id": 0}
     return metadata
 
-@handle_db_errors
-@confirm_action("Удаление таблицы")
 def drop_table(metadata, table_name):
     """
     Удаляет таблицу из метаданных и БД
@@ -57,11 +176,11 @@ def drop_table(metadata, table_name):
         dict: обновленные метаданные
     """
     if table_name not in metadata:
-        raise KeyError(
-f'Таблица "{table_name}" не существует.'
-            )
+        raise TableNotFoundError(f'Таблица "{table_name}" не существует.')
     
     del metadata[table_name]
+    save_table_indexes(table_name, {})
+    invalidate_select_cache(table_name)
     return metadata
 
 def list_tables(metadata):
@@ -70,80 +189,76 @@ def list_tables(metadata):
     """
     return list(metadata.keys())
 
-@handle_db_errors
-def validate_data_types(metadata, table_name, values):
+def validate_value(name, expected_type, value):
     """
-    Проверяет соответствие типов данных схеме таблицы
+    Проверяет значение столбца name по его типу и возвращает его
+    в том виде, в котором оно хранится (int - десятичная запись
+    числа, bool - "True"/"False"), или выбрасывает ValidationError
     """
-    if table_name not in metadata:
-        raise KeyError(
-f"Таблица '{table_name}' не существует"
-            )
-    
-    table_meta = metadata[table_name] 
-
-    columns = [col for col in table_meta if\
-                col.split(":")[0] != 'ID']
-    
-    if len(values) != len(columns):
-        raise ValueError(f"Ожидается {len(columns)} значений, \
- получено {len(values)}")
-    
-    for i, (value, column_meta) in enumerate(zip(values, columns)):
-        # тип данных столбца, полученный при создании таблицы
-        type = column_meta.split(":")[1] 
-        # название столбца, полученное при ее создании
-        name = column_meta.split(":")[0] 
-        expected_type = type
-        
-        if expected_type == 'int' and not isinstance(int(value), int):
-            raise ValueError(
+    value = str(value)
+    if expected_type == 'int':
+        typed = convert_value(value.strip(), 'int')
+        if typed is None:
+            raise ValidationError(
                 f"Столбец '{name}' должен иметь тип integer"
                 )
-        elif expected_type == 'text' and not isinstance(value, str):
-            raise ValueError(
-                f"Столбец '{name}' должен быть text"
-                )
-        elif expected_type == 'bool' and value\
-              not in ["True", "False", True, False]:
-            raise ValueError(
+        return str(typed)
+    if expected_type == 'bool':
+        typed = convert_value(value.strip(), 'bool')
+        if typed is None:
+            raise ValidationError(
                 f"Столбец '{name}' должен быть boolean"
                 )
+        return str(typed)
+    return value
+
+def make_row_validator(metadata, table_name):
+    """
+    Строит функцию проверки строки значений по схеме таблицы.
+    Функция возвращает значения в том виде, в котором они хранятся
+    (int - десятичная запись числа, bool - "True"/"False"),
+    или выбрасывает ValidationError
+    """
+    require_table(metadata, table_name)
+    
+    columns = [col.split(":") for col in get_table_columns(metadata, table_name)
+               if col.split(":")[0] != 'ID']
+
+    def validate(values):
+        if len(values) != len(columns):
+            raise ValidationError(f"Ожидается {len(columns)} значений, \
+ получено {len(values)}")
+
+        return [validate_value(name, expected_type, value)
+                for value, (name, expected_type) in zip(values, columns)]
+
+    return validate
+
+def validate_data_types(metadata, table_name, values):
+    """
+    Проверяет соответствие типов данных схеме таблицы
+    Возвращает значения в том виде, в котором они хранятся
+    """
+    return make_row_validator(metadata, table_name)(values)
         
-@handle_db_errors
-@log_time
+@locked_table(exclusive=True)
 def insert(metadata, table_name, values):
     """
-    Создает новую запись в таблице
+    Создает новую запись в таблице и возвращает ее ID
     """
-    if table_name not in metadata:
-        raise KeyError(
-            f"Таблица '{table_name}' не существует"
-            )
-    
-    # загружаем текущие данные
-    table_data = load_table_data(table_name)
+    require_table(metadata, table_name)
     
     # проверяем типы данных
-    validate_data_types(metadata, table_name, values)
+    values = validate_data_types(metadata, table_name, values)
 
     # данные о столбцах
-    table_meta = metadata[table_name]
+    table_meta = get_table_columns(metadata, table_name)
+    # cписок столбцов кроме ID
+    columns = [col.split(":")[0]\
+               for col in table_meta if col.split(":")[0] != 'ID']
     
-    # генерируем ID
-    # проверим, добавляем ли мы данные впервые
-    if not table_data:
-        new_id = 0
-        # cписок столбцов кроме ID
-        columns = [col.split(":")[0]\
-                   for col in table_meta if col.split(":")[0] != 'ID']
-    else:
-        new_id = max(item['ID'] for item in table_data) + 1
-        # каждая запись в списке - это словарь, представляющий строку
-        # ключи - все столбцы
-        columns = list(table_data[0].keys())
-        # cписок столбцов кроме ID
-        columns = [value for value in columns if value != 'ID']
+    # генерируем ID по счетчику таблицы, не просматривая записи
+    new_id = allocate_ids(metadata, table_name)
     
     # создаем новую запись
     new_record = {'ID': new_id}
@@ -152,162 +267,1205 @@ def insert(metadata, table_name, values):
         ):
         new_record[column_name] = str(value)       
     
-    table_data.append(new_record)
-    
-    # сохраняем данные
-    save_table_data(table_name, table_data)
+    # журнальная и колоночная таблицы без индексов не загружаются вовсе
+    storage = detect_storage(table_name)
+    indexed = has_table_indexes(table_name)
+    table_data = None
+    if storage == "json" or indexed:
+        table_data = load_table_data(table_name)
+        # индексы должны соответствовать данным до изменения
+        load_table_indexes(table_name, table_data)
+
+    # сохраняем данные через WAL: в журнальном и колоночном
+    # форматах дописывается только новая запись
+    commit_table_changes(table_name, [new_record], table_data=table_data)
+    metrics.count("rows_written")
+    if indexed:
+        update_indexes(
+            table_name, load_table_data(table_name), new_records=[new_record])
+    invalidate_select_cache(table_name)
     
     return new_id
 
-@handle_db_errors
-@log_time
-def select(table_name, where_clause=None):
+@locked_table(exclusive=True)
+def insert_rows(metadata, table_name, rows):
+    """
+    Добавляет в таблицу много записей за одну запись на диск.
+    rows - итерируемый поток списков значений, читается пачками
+    по BATCH_SIZE строк: каждая пачка проверяется по схеме и получает
+    блок ID. Если хотя бы одна строка некорректна, таблица не меняется.
+    Возвращает список (первый ID, последний ID, количество)
+    """
+    validate = make_row_validator(metadata, table_name)
+    columns = [col.split(":")[0] for col in get_table_columns(metadata, table_name)
+               if col.split(":")[0] != 'ID']
+    storage = detect_storage(table_name)
+    indexed = has_table_indexes(table_name)
+    table_data = None
+    if storage == "json" or indexed:
+        table_data = load_table_data(table_name)
+        load_table_indexes(table_name, table_data)
+
+    # новые записи держим в памяти, только если они нужны для сохранения
+    # json-файла, файлов столбцов, обновления индексов или транзакции,
+    # иначе пишем во временный журнал
+    new_records = []
+    staging_path = f"{get_table_path(table_name, 'log')}.import"
+    staging = open(staging_path, 'w', encoding='utf-8') \
+        if storage == "log" and not in_transaction() else None
+    keep_records = staging is None or indexed
+
+    first_id = None
+    count = 0
+    rows = iter(rows)
+    try:
+        while True:
+            batch = list(islice(rows, BATCH_SIZE))
+            if not batch:
+                break
+            converted = []
+            for row_number, values in enumerate(batch, start=count + 1):
+                try:
+                    converted.append(validate(values))
+                except ValueError as e:
+                    raise ValidationError(f"Строка {row_number}: {e}") from e
+
+            batch_first_id = allocate_ids(metadata, table_name, len(converted))
+            if first_id is None:
+                first_id = batch_first_id
+            records = [{'ID': batch_first_id + i, **dict(zip(columns, values))}
+                       for i, values in enumerate(converted)]
+            if staging is not None:
+                staging.write("".join(format_log_put(record) + "\n"
+                                      for record in records))
+            if keep_records:
+                new_records.extend(records)
+            count += len(records)
+
+        if staging is not None:
+            staging.close()
+        if count:
+            if staging is not None:
+                commit_table_log_file(table_name, staging_path)
+            else:
+                commit_table_changes(table_name, new_records,
+                                     table_data=table_data)
+            metrics.count("rows_written", count)
+            if indexed:
+                update_indexes(table_name, load_table_data(table_name),
+                               new_records=new_records)
+            invalidate_select_cache(table_name)
+    finally:
+        if staging is not None:
+            staging.close()
+            # после фиксации файл уже удален
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+
+    if not count:
+        raise ValidationError("Не передано ни одной записи")
+    return [first_id, first_id + count - 1, count]
+
+def import_table(metadata, table_name, filepath):
+    """
+    Импортирует записи в таблицу из файла CSV или JSONL
+    Возвращает список (первый ID, последний ID, количество)
+    """
+    require_table(metadata, table_name)
+    columns = [col.split(":")[0] for col in get_table_columns(metadata, table_name)
+               if col.split(":")[0] != 'ID']
+    try:
+        rows = read_import_rows(filepath, columns)
+    except (OSError, ValueError) as e:
+        raise ValidationError(f"Ошибка импорта: {e}") from e
+    return insert_rows(metadata, table_name, rows)
+
+def make_condition_check(column, operator, value, column_types):
+    """
+    Строит функцию проверки записи по одному условию.
+    Равенство и неравенство сравнивают значения записей в памяти
+    со значением условия, приведенным equality_value, остальные
+    операторы - значения, приведенные к типу столбца
+    """
+    if operator in ("=", "!="):
+        expected = equality_value(column, value, column_types)
+        if operator == "=":
+            return lambda record: record.get(column) == expected
+        return lambda record: record.get(column) != expected
+
+    column_type = "int" if column == "ID" else column_types.get(column, "str")
+    matches = make_typed_check(column, operator, value, column_type)
+
+    def check(record):
+        typed = convert_value(record.get(column), column_type)
+        return typed is not None and matches(typed)
+    return check
+
+def equality_value(column, value, column_types):
+    """
+    Значение условия = или != в том виде, в котором значения столбца
+    хранятся в записях в памяти: для ID и столбцов int и bool -
+    значение, приведенное к типу столбца ("true", "True" и True
+    дают True, "042" и 42 - 42), для столбцов str - строка.
+    Значение, не приводимое к типу, остается строкой и совпадает
+    только с такой же строкой, записанной в файл вручную (для ID -
+    None, ни с чем не совпадает). Одно и то же значение сравнивается
+    с записями при просмотре и ищется в индексе (по str от него),
+    поэтому результат не зависит от наличия индекса
+    """
+    if column == "ID":
+        return convert_value(value, "int")
+    column_type = column_types.get(column, "str")
+    if column_type == "str":
+        return str(value)
+    typed = convert_value(value, column_type)
+    return str(value) if typed is None else typed
+
+def typed_condition_value(column, operator, value, column_type):
+    """
+    Приводит значение условия сравнения к типу столбца
+    (для between - пару границ). Выбрасывает ValidationError,
+    если значение не приводится к типу
+    """
+    if operator == "between":
+        low, high = (convert_value(bound, column_type) for bound in value)
+        if low is None or high is None:
+            raise ValidationError(f"Границы between для столбца '{column}' \
+должны иметь тип {column_type}")
+        return low, high
+
+    expected = convert_value(value, column_type)
+    if expected is None:
+        raise ValidationError(
+            f"Значение для столбца '{column}' должно иметь тип {column_type}")
+    return expected
+
+def make_typed_check(column, operator, value, column_type):
+    """
+    Строит функцию проверки по одному условию для значения,
+    уже приведенного к типу столбца
+    """
+    if operator in ("=", "!="):
+        expected = convert_value(value, column_type)
+        if operator == "=":
+            return lambda typed: typed == expected
+        return lambda typed: typed != expected
+
+    expected = typed_condition_value(column, operator, value, column_type)
+    if operator == "between":
+        low, high = expected
+        return lambda typed: low <= typed <= high
+    compare_values = COMPARATORS[operator]
+    return lambda typed: compare_values(typed, expected)
+
+def all_of(first, second):
+    return lambda record: first(record) and second(record)
+
+def any_of(first, second):
+    return lambda record: first(record) or second(record)
+
+def make_predicate(conditions, column_types):
+    """
+    Строит функцию проверки записи по списку условий, соединенных
+    and: (column, operator, value) или группа {"or": [список условий,
+    ...]}. Проверки соединяются через and и or, поэтому проверка
+    прекращается на первом невыполненном условии, а в группе or -
+    на первом выполненном варианте
+    """
+    checks = []
+    for condition in conditions:
+        if isinstance(condition, dict):
+            variants = [make_predicate(branch, column_types)
+                        for branch in condition["or"]]
+            check = variants[-1]
+            for variant in reversed(variants[:-1]):
+                check = any_of(variant, check)
+        else:
+            check = make_condition_check(*condition, column_types)
+        checks.append(check)
+    predicate = checks[-1]
+    for check in reversed(checks[:-1]):
+        predicate = all_of(check, predicate)
+    return predicate
+
+def compare_batch(batch, operator, expected, positions=None):
+    """
+    Применяет условие к пачке значений столбца,
+    возвращает позиции подходящих значений
+    """
+    if operator == "between":
+        low, high = expected
+        return compare(batch, "<=", high, compare(batch, ">=", low, positions))
+    return compare(batch, operator, expected, positions)
+
+def where_positions(conditions, condition_positions, positions=None):
+    """
+    Вычисляет условия where над столбцами целиком.
+    condition_positions(condition, positions) возвращает позиции,
+    удовлетворяющие условию, среди positions (None - все записи).
+    Каждое следующее условие, соединенное and, проверяется лишь
+    для позиций, прошедших предыдущие; результат группы or -
+    объединение позиций ее вариантов
+    """
+    for condition in conditions:
+        if isinstance(condition, dict):
+            matched = []
+            for branch in condition["or"]:
+                branch_positions = where_positions(
+                    branch, condition_positions, positions)
+                if branch_positions is positions:
+                    # вариант выполняется для всех позиций
+                    matched = positions
+                    break
+                matched = union_positions(matched, branch_positions)
+            positions = matched
+        else:
+            positions = condition_positions(condition, positions)
+        if positions is not None and not len(positions):
+            return []
+    return positions
+
+def filter_positions(table_name, table_data, conditions, column_types):
+    """
+    Проверяет условия where по столбцам таблицы целиком: столбец
+    собирается в пачку значений (для сравнений >, <, between -
+    приведенных к типу столбца), и условие вычисляется над всей пачкой.
+    Пачки запоминаются до изменения таблицы. Возвращает список позиций
+    подходящих записей или None, если столбец нельзя обработать
+    целиком (нет значения или оно не приводится к типу) - тогда
+    записи проверяются построчно
+    """
+    def condition_type(column, operator):
+        # равенство сравнивает значения записей, как и построчная проверка
+        if operator in ("=", "!="):
+            return None
+        return "int" if column == "ID" else column_types.get(column, "str")
+
+    version = (get_table_signature(table_name), id(table_data), len(table_data))
+    batches = {}
+    for column, operator, _ in where_conditions(conditions):
+        column_type = condition_type(column, operator)
+        if (column, column_type) in batches:
+            continue
+        batch = cached_batch(
+            (table_name, column, column_type), version,
+            lambda: row_batch(table_data, column, column_type))
+        if batch is None:
+            return None
+        batches[(column, column_type)] = batch
+
+    def condition_positions(condition, positions):
+        column, operator, value = condition
+        column_type = condition_type(column, operator)
+        if column_type is None:
+            expected = equality_value(column, value, column_types)
+            if expected is None:
+                return [] if operator == "=" else positions
+        else:
+            expected = typed_condition_value(column, operator, value, column_type)
+        return compare_batch(batches[(column, column_type)], operator,
+                             expected, positions)
+
+    positions = where_positions(conditions, condition_positions)
+    return as_positions(positions, len(table_data))
+
+def find_index_condition(table_name, table_data, where_clause):
+    """
+    Возвращает первое условие where, которое обслуживается
+    индексом, или None. Группы or индексом не обслуживаются
+    """
+    for condition in where_clause or ():
+        if not isinstance(condition, dict) \
+                and has_index(table_name, table_data, condition[0],
+                              condition[1]):
+            return condition
+    return None
+
+def uses_column_scan(table_name, where_clause, columns=None, limit=None):
+    """
+    Проверяет, выбираются ли записи по файлам столбцов: колоночная
+    таблица без индексов, записи которой не загружены, а запрос
+    читает не все столбцы или не все записи (есть условие where,
+    список столбцов или limit)
+    """
+    narrowed = where_clause or columns is not None or limit is not None
+    return bool(narrowed) and detect_storage(table_name) == "columnar" \
+        and not has_table_indexes(table_name) \
+        and not is_table_loaded(table_name)
+
+def iter_records(table_name, table_data, where_clause, column_types=None):
+    """
+    Возвращает итератор записей, удовлетворяющих условию where.
+    Условие, для которого есть индекс (равенство по ID или по
+    индексированному столбцу, диапазон по упорядоченному индексу),
+    выбирает записи из индекса, остальные условия проверяются
+    по мере чтения выбранных записей
+    """
+    if not where_clause:
+        return iter(table_data)
+    column_types = column_types or {}
+
+    remaining = order_conditions(
+        table_name, table_data, where_clause, column_types)
+    candidates = table_data
+    condition = find_index_condition(table_name, table_data, remaining)
+    if condition is not None:
+        column, operator, value = condition
+        if operator == "=":
+            value = equality_value(column, value, column_types)
+        candidates = lookup_index(table_name, table_data, column, value,
+                                  operator)
+        remaining.remove(condition)
+
+    metrics.count("rows_scanned", len(candidates))
+    if not remaining:
+        return iter(candidates)
+    if candidates is table_data:
+        # полный просмотр таблицы - проверяем условия по столбцам
+        positions = filter_positions(
+            table_name, table_data, remaining, column_types)
+        if positions is not None:
+            return map(table_data.__getitem__, positions)
+    predicate = make_predicate(remaining, column_types)
+    return filter(predicate, candidates)
+
+def scan_columns(table_name, where_clause, column_types, columns=None,
+                 start=0, stop=None):
+    """
+    Выбирает записи колоночной таблицы по условию where, читая
+    только столбцы из условий. Условия вычисляются над столбцами
+    целиком, каждое следующее - лишь для позиций, прошедших
+    предыдущие; столбцы записей (columns, по умолчанию все)
+    декодируются только для подходящих записей с номерами
+    от start до stop
+    """
+    reader = open_table_columns(table_name)
+    metrics.count("rows_scanned", reader.rows)
+    batches = {}
+
+    def condition_positions(condition, positions):
+        column, operator, value = condition
+        if column not in reader.column_types:
+            # у записей нет такого столбца: подходят только под "!="
+            return positions if operator == "!=" else []
+        column_type = reader.column_types[column]
+        if operator in ("=", "!="):
+            expected = equality_value(column, value, reader.column_types)
+            if expected is None or expected.__class__ is str \
+                    and column_type != "str":
+                # в файлах столбцов значения только своего типа
+                return [] if operator == "=" else positions
+        else:
+            expected = typed_condition_value(column, operator, value, column_type)
+        if column not in batches:
+            batches[column] = column_batch(reader.column(column), column_type)
+        return compare_batch(batches[column], operator, expected, positions)
+
+    positions = None
+    if where_clause:
+        positions = where_positions(
+            order_conditions(table_name, None, where_clause, column_types),
+            condition_positions)
+    positions = range(reader.rows) if positions is None \
+        else as_positions(positions, reader.rows)
+    return reader.records(positions[start:stop], columns)
+
+def filter_records(table_name, table_data, where_clause, column_types=None):
+    """
+    Возвращает список записей, удовлетворяющих условию where
+    """
+    if not where_clause:
+        return table_data
+    return list(iter_records(table_name, table_data, where_clause, column_types))
+
+def sort_records(records, order_by, limit=None, column_types=None):
+    """
+    Сортирует записи по столбцу. С limit выполняется частичная
+    сортировка через кучу. Значения, не приводимые к типу столбца,
+    идут последними
+    """
+    column, descending = order_by
+    column_types = column_types or {}
+    column_type = "int" if column == "ID" else column_types.get(column, "str")
+
+    def sort_key(record):
+        typed = convert_value(record.get(column), column_type)
+        if typed is None:
+            return (0, 0) if descending else (1, 0)
+        return (1, typed) if descending else (0, typed)
+
+    if limit is not None:
+        select_top = heapq.nlargest if descending else heapq.nsmallest
+        return select_top(limit, records, key=sort_key)
+    return sorted(records, key=sort_key, reverse=descending)
+
+def get_select_column_types(metadata, table_name, order_by=None,
+                            columns=None):
+    """
+    Проверяет таблицу, столбцы и столбец сортировки запроса select
+    Возвращает словарь {столбец: тип}
+    """
+    require_table(metadata, table_name)
+    column_types = get_column_types(metadata, table_name)
+    required = list(columns or ())
+    if order_by is not None:
+        required.append(order_by[0])
+    for column in required:
+        if column not in column_types:
+            raise ColumnNotFoundError(
+                f"В таблице '{table_name}' нет столбца '{column}'")
+    return column_types
+
+def project_records(records, columns):
+    """
+    Оставляет в записях только столбцы columns
+    (None - все столбцы, записи не копируются)
+    """
+    if columns is None:
+        return records
+    return ({column: record[column] for column in columns if column in record}
+            for record in records)
+
+def iter_select(metadata, table_name, where_clause=None, order_by=None,
+                limit=None, offset=None, columns=None):
+    """
+    Возвращает итератор записей таблицы с фильтрацией, сортировкой,
+    пропуском offset записей, ограничением количества и выбором
+    столбцов. Записи выдаются по мере чтения, без построения списка
+    результатов, и чтение останавливается после offset + limit
+    подходящих записей; список строится только для сортировки
+    без упорядоченного индекса
+    """
+    column_types = get_select_column_types(metadata, table_name, order_by,
+                                           columns)
+    offset = offset or 0
+    stop = None if limit is None else offset + limit
+    if uses_column_scan(table_name, where_clause, columns, limit):
+        # записи таблицы не загружены - фильтруем по файлам столбцов
+        # и декодируем только нужные столбцы выдаваемых записей
+        if order_by is None:
+            return iter(scan_columns(table_name, where_clause, column_types,
+                                     columns, offset, stop))
+        sort_columns = None if columns is None \
+            else list(dict.fromkeys([*columns, order_by[0]]))
+        records = scan_columns(table_name, where_clause, column_types,
+                               sort_columns)
+        with stage("sort"):
+            records = sort_records(records, order_by, stop, column_types)
+        return project_records(islice(records, offset, None), columns)
+
+    with stage("load"):
+        table_data = load_table_data(table_name)
+
+    if order_by is None:
+        records = iter_records(table_name, table_data, where_clause,
+                               column_types)
+        return project_records(islice(records, offset, stop), columns)
+
+    # если условие не обслуживается индексом, а по столбцу сортировки
+    # есть упорядоченный индекс, читаем записи в порядке индекса
+    # и останавливаемся после offset + limit подходящих
+    ordered = None
+    if find_index_condition(table_name, table_data, where_clause) is None:
+        ordered = scan_ordered(table_name, table_data, *order_by)
+    if ordered is None:
+        records = filter_records(
+            table_name, table_data, where_clause, column_types)
+        with stage("sort"):
+            ordered = sort_records(records, order_by, stop, column_types)
+    elif where_clause:
+        predicate = make_predicate(order_conditions(
+            table_name, table_data, where_clause, column_types),
+            column_types)
+        ordered = filter(predicate, ordered)
+    return project_records(islice(ordered, offset, stop), columns)
+
+@locked_table(exclusive=False)
+def select(metadata, table_name, where_clause=None, order_by=None, limit=None,
+           offset=None, columns=None):
     """
-    Читает записи из таблицы с возможностью фильтрации
-    с кэшированием результатов
+    Читает записи из таблицы с возможностью фильтрации, сортировки,
+    ограничения количества и выбора столбцов с кэшированием результатов
     """
-    # ключ для кэша на основе параметров запроса
-    cache_key = f"select_{table_name}_{str(where_clause)}"
-    select_cacher = create_cacher()
+    # ключ для кэша на основе параметров запроса, версия - подпись
+    # файла данных, чтобы учесть изменения таблицы на диске
+    cache_key = (table_name, normalize_where_clause(where_clause),
+                 order_by, limit, offset or 0,
+                 None if columns is None else tuple(columns))
 
     def fetch_data():
         """Внутренняя функция 
         для получения данных (вызывается если нет данных в кэше)"""
-        table_data = load_table_data(table_name)
-        
-        if where_clause is None:
-            return table_data
-        
-        # Фильтруем данные
-        filtered_data = []
-        for record in table_data:
-            match = True
-            for column, value in where_clause.items():
-                if record.get(column) != str(value):
-                    match = False
-                    #break
-            if match:
-                filtered_data.append(record)
-                
-        return filtered_data
+        if not where_clause and order_by is None and limit is None \
+                and not offset and columns is None:
+            # вся таблица - отдаем загруженный список без копирования
+            get_select_column_types(metadata, table_name)
+            with stage("load"):
+                return load_table_data(table_name)
+        with stage("filter"):
+            return list(iter_select(metadata, table_name, where_clause,
+                                    order_by, limit, offset, columns))
     
     # используем кэшер для получения данных
-    return select_cacher(cache_key, fetch_data)
+    records = select_cacher(
+        cache_key, fetch_data, version=get_table_signature(table_name))
+    metrics.count("rows_returned", len(records))
+    return records
+
+def condition_selectivity(table_name, table_data, condition, column_types):
+    """
+    Оценивает долю записей, удовлетворяющих условию: по индексу,
+    если он есть, для равенства логических столбцов - 1/2, иначе
+    по постоянной доле DEFAULT_SELECTIVITY. Для группы or - доля
+    записей, удовлетворяющих хотя бы одному варианту (варианты
+    считаются независимыми)
+    """
+    if isinstance(condition, dict):
+        rejected = 1.0
+        for branch in condition["or"]:
+            rejected *= 1 - where_selectivity(
+                table_name, table_data, branch, column_types)
+        return 1 - rejected
+
+    column, operator, value = condition
+    if table_data:
+        estimate = estimate_index_rows(table_name, table_data, column, value,
+                                       operator)
+        if estimate is not None:
+            return estimate / len(table_data)
+    if operator in ("=", "!=") and column_types.get(column) == "bool":
+        return 0.5
+    return DEFAULT_SELECTIVITY[operator]
+
+def where_selectivity(table_name, table_data, conditions, column_types):
+    """
+    Оценивает долю записей, удовлетворяющих всем условиям
+    (условия считаются независимыми)
+    """
+    selectivity = 1.0
+    for condition in conditions:
+        selectivity *= condition_selectivity(
+            table_name, table_data, condition, column_types)
+    return selectivity
+
+def order_conditions(table_name, table_data, conditions, column_types):
+    """
+    Упорядочивает условия, соединенные and, по возрастанию оценки
+    доли подходящих записей: проверка прекращается на первом
+    невыполненном условии, поэтому первыми проверяются условия,
+    отсекающие больше записей, а первым условием с индексом
+    выбирается самое избирательное. Варианты групп or упорядочиваются
+    по убыванию оценки - проверка группы прекращается на первом
+    выполненном варианте. Порядок условий с равной оценкой сохраняется
+    """
+    if len(conditions) == 1 and not isinstance(conditions[0], dict):
+        return list(conditions)
+
+    def ordered(condition):
+        if not isinstance(condition, dict):
+            return condition
+        branches = [order_conditions(table_name, table_data, branch,
+                                     column_types)
+                    for branch in condition["or"]]
+        branches.sort(key=lambda branch: -where_selectivity(
+            table_name, table_data, branch, column_types))
+        return {"or": branches}
+
+    return sorted(map(ordered, conditions),
+                  key=lambda condition: condition_selectivity(
+                      table_name, table_data, condition, column_types))
+
+@locked_table(exclusive=False)
+def explain_access(metadata, table_name, where_clause=None, order_by=None,
+                   limit=None, offset=None, columns=None, column_scan=True):
+    """
+    Описывает выборку записей, не выполняя ее: формат хранения,
+    количество записей таблицы, выбираемые столбцы, способ доступа
+    (индекс, упорядоченный индекс, просмотр файлов столбцов или
+    полный просмотр), нужна ли сортировка, и оценку количества
+    выдаваемых записей (условия считаются независимыми).
+    column_scan - может ли выборка идти по файлам столбцов
+    (только select). Возвращает словарь
+    """
+    column_types = get_select_column_types(metadata, table_name, order_by,
+                                           columns)
+    sort = order_by is not None
+    if column_scan and uses_column_scan(table_name, where_clause, columns,
+                                        limit):
+        table_data = None
+        rows = open_table_columns(table_name).rows
+        access = "просмотр файлов столбцов"
+    else:
+        table_data = load_table_data(table_name)
+        rows = len(table_data)
+        where_clause = order_conditions(
+            table_name, table_data, where_clause or [], column_types)
+        condition = find_index_condition(table_name, table_data, where_clause)
+        if condition is not None:
+            column, operator, _ = condition
+            access = f"индекс по столбцу {column} ({operator})"
+        elif sort and has_index(table_name, table_data, order_by[0], "<"):
+            access = f"упорядоченный индекс по столбцу {order_by[0]}"
+            sort = False
+        elif where_clause:
+            access = "полный просмотр с фильтрацией"
+        else:
+            access = "полный просмотр"
+
+    estimate = rows * where_selectivity(
+        table_name, table_data, where_clause or (), column_types)
+    estimate = max(estimate - (offset or 0), 0)
+    if limit is not None:
+        estimate = min(estimate, limit)
+    return {"table": table_name, "storage": detect_storage(table_name),
+            "rows": rows, "columns": columns, "access": access, "sort": sort,
+            "estimated_rows": round(estimate)}
+
+def check_aggregate_query(metadata, table_name, aggregates, group_by=None,
+                          order_by=None, columns=None):
+    """
+    Проверяет запрос с агрегатами: столбцы group by и агрегатов есть
+    в таблице, столбцы результата и сортировки - столбцы group by или
+    агрегаты. Возвращает (типы столбцов, названия агрегатов, столбцы
+    результата, столбцы, читаемые из записей)
+    """
+    group_by = list(group_by or ())
+    column_types = get_select_column_types(metadata, table_name, None,
+                                           group_by)
+    check_aggregates(table_name, aggregates, column_types)
+    labels = [aggregate_label(function, column)
+              for function, column in aggregates]
+    columns = list(columns or group_by + labels)
+    for column in columns + ([order_by[0]] if order_by else []):
+        if column not in group_by and column not in labels:
+            raise ValidationError(f"Столбец '{column}' должен входить \
+в group by или быть агрегатом")
+    needed = list(dict.fromkeys(
+        group_by + [column for _, column in aggregates if column != "*"]))
+    return column_types, labels, columns, needed
+
+def counts_from_metadata(aggregates, group_by, where_clause):
+    """
+    Проверяет, что запрос - только count(*) по всей таблице
+    и отвечается количеством записей без просмотра
+    """
+    return not where_clause and not group_by \
+        and all(aggregate == ("count", "*") for aggregate in aggregates)
+
+@locked_table(exclusive=False)
+def aggregate(metadata, table_name, aggregates, group_by=None,
+              where_clause=None, order_by=None, limit=None, offset=None,
+              columns=None):
+    """
+    Вычисляет агрегаты [(функция, столбец)] - count, sum, min, max,
+    avg - по записям, подходящим под условие where, с группировкой
+    по столбцам group_by. Записи читаются потоком за один проход
+    (у колоночной таблицы - только нужные столбцы), группы
+    собираются в хэш-таблице. count(*) без условия и группировки
+    берется из количества записей таблицы без просмотра. Сортировка,
+    offset и limit применяются к группам, результаты кэшируются,
+    как и у select. Возвращает список записей {столбец: значение}
+    """
+    column_types, labels, columns, needed = check_aggregate_query(
+        metadata, table_name, aggregates, group_by, order_by, columns)
+    group_by = list(group_by or ())
+    cache_key = (table_name, "aggregate", tuple(aggregates), tuple(group_by),
+                 normalize_where_clause(where_clause), order_by, limit,
+                 offset or 0, tuple(columns))
+
+    def fetch_data():
+        if counts_from_metadata(aggregates, group_by, where_clause):
+            groups = [((), [count_rows(table_name)] * len(aggregates))]
+        else:
+            # выбор столбцов нужен, только если он сокращает чтение
+            # (колоночная таблица), записи остальных форматов уже разобраны
+            projection = needed if uses_column_scan(
+                table_name, where_clause, needed) else None
+            with stage("filter"):
+                records = iter_select(metadata, table_name, where_clause,
+                                      columns=projection)
+                groups = aggregate_records(records, aggregates, group_by,
+                                           column_types)
+        records = group_records(groups, group_by, labels, columns)
+        if order_by is not None:
+            with stage("sort"):
+                records = sort_groups(records, order_by, column_types)
+        start = offset or 0
+        return records[start:None if limit is None else start + limit]
+
+    records = select_cacher(
+        cache_key, fetch_data, version=get_table_signature(table_name))
+    metrics.count("rows_returned", len(records))
+    return records
+
+@locked_table(exclusive=False)
+def explain_aggregate(metadata, table_name, aggregates, group_by=None,
+                      where_clause=None, order_by=None, limit=None,
+                      offset=None, columns=None):
+    """
+    Описывает вычисление агрегатов, не выполняя его (см. explain_access):
+    способ доступа к записям, агрегаты и группировку. Оценка
+    количества записей для запроса с group by - количество
+    подходящих записей (верхняя граница числа групп)
+    """
+    _, labels, _, needed = check_aggregate_query(
+        metadata, table_name, aggregates, group_by, order_by, columns)
+    if counts_from_metadata(aggregates, group_by, where_clause):
+        plan = {"table": table_name, "storage": detect_storage(table_name),
+                "rows": count_rows(table_name), "columns": None,
+                "access": "количество записей без просмотра таблицы",
+                "sort": False, "estimated_rows": 1}
+    else:
+        plan = explain_access(metadata, table_name, where_clause,
+                              columns=needed or None)
+        plan["sort"] = order_by is not None
+    if not group_by:
+        plan["estimated_rows"] = 1
+    plan["estimated_rows"] = max(plan["estimated_rows"] - (offset or 0), 0)
+    if limit is not None:
+        plan["estimated_rows"] = min(plan["estimated_rows"], limit)
+    plan["aggregates"] = labels
+    plan["group_by"] = list(group_by or ())
+    return plan
+
+def join_column_types(metadata, tables):
+    """
+    Типы столбцов соединяемых таблиц с именами "<таблица>.<столбец>"
+    """
+    return {f"{table}.{column}": column_type for table in tables
+            for column, column_type in get_column_types(metadata, table).items()}
+
+def qualify_column(column, tables, column_types):
+    """
+    Приводит имя столбца к виду "<таблица>.<столбец>". Имя без
+    таблицы допускается, если столбец есть только в одной таблице
+    """
+    if column in column_types:
+        return column
+    matches = [f"{table}.{column}" for table in tables
+               if f"{table}.{column}" in column_types]
+    if not matches:
+        raise ColumnNotFoundError(
+            f"В таблицах {', '.join(tables)} нет столбца '{column}'")
+    if len(matches) > 1:
+        raise ValidationError(f"Столбец '{column}' есть в нескольких таблицах, \
+укажите <таблица>.{column}")
+    return matches[0]
+
+def rename_where_columns(where_clause, rename):
+    """
+    Условие where с именами столбцов, замененными на rename(имя)
+    """
+    return [{"or": [rename_where_columns(branch, rename)
+                    for branch in condition["or"]]}
+            if isinstance(condition, dict)
+            else (rename(condition[0]), *condition[1:])
+            for condition in where_clause]
+
+def column_table(column):
+    return column.partition(".")[0]
+
+def split_join_where(where_clause, tables):
+    """
+    Разделяет условия and соединения: условия по столбцам одной
+    таблицы проверяются при ее просмотре (имена столбцов - без
+    таблицы), остальные - на соединенных записях.
+    Возвращает ({таблица: условия}, остальные условия)
+    """
+    pushed = {table: [] for table in tables}
+    remaining = []
+    for condition in where_clause or ():
+        referenced = {column_table(column)
+                      for column, _, _ in where_conditions([condition])}
+        if len(referenced) == 1:
+            pushed[referenced.pop()] += rename_where_columns(
+                [condition], lambda column: column.partition(".")[2])
+        else:
+            remaining.append(condition)
+    return pushed, remaining
 
-@handle_db_errors
+def join_index_usable(table_name, column):
+    """
+    Проверяет, можно ли искать записи таблицы по столбцу соединения
+    через индекс вместо построения хэш-таблицы: ID или столбец
+    с индексом, а записи таблицы уже загружены или загружаются
+    целиком (не колоночная таблица)
+    """
+    if detect_storage(table_name) == "columnar" \
+            and not is_table_loaded(table_name):
+        return False
+    if column == "ID":
+        return True
+    return has_table_indexes(table_name) and has_index(
+        table_name, load_table_data(table_name), column, "=")
+
+def plan_join(tables, on_columns):
+    """
+    Выбирает способ соединения по количеству записей таблиц
+    (из метаданных, без просмотра): если у большей таблицы, затем
+    у меньшей, есть индекс по столбцу соединения, записи другой
+    таблицы просматриваются и ищутся в индексе. Иначе hash join:
+    хэш-таблица строится по меньшей таблице, большая просматривается
+    потоком. Возвращает словарь {"method", "rows", "lookup" | "build",
+    "probe"}
+    """
+    rows = {table: count_rows(table) for table in tables}
+    larger, smaller = sorted(tables, key=rows.get, reverse=True)
+    for table, other in ((larger, smaller), (smaller, larger)):
+        if join_index_usable(table, on_columns[table]):
+            return {"method": "index", "rows": rows, "lookup": table,
+                    "probe": other}
+    return {"method": "hash", "rows": rows, "build": smaller, "probe": larger}
+
+def resolve_join(metadata, table_name, join_table, on, where_clause=None,
+                 order_by=None, columns=None):
+    """
+    Проверяет соединение и приводит имена столбцов условия on, where,
+    сортировки и выбираемых столбцов к виду "<таблица>.<столбец>".
+    Возвращает словарь с типами столбцов, столбцами on по таблицам,
+    условиями where по таблицам и остальными условиями
+    """
+    tables = (table_name, join_table)
+    for table in tables:
+        require_table(metadata, table)
+    if join_table == table_name:
+        raise ValidationError("Соединение таблицы с самой собой не поддерживается")
+    column_types = join_column_types(metadata, tables)
+
+    def qualify(column):
+        return qualify_column(column, tables, column_types)
+
+    on = tuple(map(qualify, on))
+    on_columns = {column_table(column): column.partition(".")[2]
+                  for column in on}
+    if len(on_columns) != 2:
+        raise ValidationError(
+            "Условие on должно связывать столбцы двух соединяемых таблиц")
+    where_clause = rename_where_columns(where_clause or [], qualify)
+    pushed, remaining = split_join_where(where_clause, tables)
+    order_by = None if order_by is None else (qualify(order_by[0]), order_by[1])
+    columns = None if columns is None else [qualify(column) for column in columns]
+
+    # столбцы, которые нужно прочитать из каждой таблицы
+    needed = None
+    if columns is not None:
+        referenced = columns + [column for column, _, _
+                                in where_conditions(remaining)]
+        if order_by is not None:
+            referenced.append(order_by[0])
+        needed = {table: list(dict.fromkeys(
+            [on_columns[table]] + [column.partition(".")[2]
+                                   for column in referenced
+                                   if column_table(column) == table]))
+            for table in tables}
+    return {"tables": tables, "column_types": column_types, "on": on,
+            "on_columns": on_columns, "where": where_clause, "pushed": pushed,
+            "remaining": remaining, "order_by": order_by, "columns": columns,
+            "needed": needed}
+
+def iter_join(metadata, join, plan):
+    """
+    Выдает соединенные записи {"<таблица>.<столбец>": значение}
+    потоком по плану соединения plan_join
+    """
+    pushed, on_columns, needed = join["pushed"], join["on_columns"], join["needed"]
+
+    def side_records(table):
+        # выбор столбцов нужен, только если он сокращает чтение
+        # (колоночная таблица), записи остальных форматов уже разобраны
+        projection = None if needed is None else needed[table]
+        if not uses_column_scan(table, pushed[table], projection):
+            projection = None
+        return iter_select(metadata, table, pushed[table] or None,
+                           columns=projection)
+
+    probe = plan["probe"]
+    if plan["method"] == "index":
+        table = plan["lookup"]
+        table_data = load_table_data(table)
+        column_types = get_column_types(metadata, table)
+        check = None
+        if pushed[table]:
+            check = make_predicate(order_conditions(
+                table, table_data, pushed[table], column_types), column_types)
+
+        def pairs():
+            for key, record in keyed(side_records(probe), on_columns[probe]):
+                for match in lookup_index(table, table_data, on_columns[table],
+                                          key, "="):
+                    if check is None or check(match):
+                        yield match, record
+    else:
+        table = plan["build"]
+
+        def pairs():
+            return hash_join(
+                keyed(side_records(table), on_columns[table]),
+                keyed(side_records(probe), on_columns[probe]),
+                get_max_rows(), plan["rows"][table])
+
+    first, second = join["tables"]
+    for found, record in pairs():
+        left, right = (found, record) if table == first else (record, found)
+        joined = {f"{first}.{column}": value for column, value in left.items()}
+        joined.update((f"{second}.{column}", value)
+                      for column, value in right.items())
+        yield joined
+
+def join_select(metadata, table_name, join_table, on, where_clause=None,
+                order_by=None, limit=None, offset=None, columns=None):
+    """
+    Соединяет записи двух таблиц по равенству столбцов on (пара имен
+    столбцов, с таблицей через точку или без нее, если имя
+    однозначно) и выдает записи {"<таблица>.<столбец>": значение}
+    с фильтрацией, сортировкой, offset, limit и выбором столбцов.
+    Условия where по одной таблице проверяются при ее просмотре.
+    Соединение выполняется через индекс по столбцу соединения или
+    hash join с хэш-таблицей по меньшей таблице (см. plan_join), при
+    нехватке памяти - с разбиением на диск (см. join.hash_join).
+    Результаты кэшируются до изменения любой из таблиц
+    """
+    join = resolve_join(metadata, table_name, join_table, on, where_clause,
+                        order_by, columns)
+    tables = join["tables"]
+    order_by = join["order_by"]
+    cache_key = (tables, "join", join["on"],
+                 normalize_where_clause(join["where"]), order_by, limit,
+                 offset or 0,
+                 None if join["columns"] is None else tuple(join["columns"]))
+    start = offset or 0
+    stop = None if limit is None else start + limit
+
+    def fetch_data():
+        # блокировки таблиц берутся в порядке имен, чтобы встречные
+        # соединения не ждали друг друга
+        first, second = sorted(tables)
+        with table_lock(first), table_lock(second):
+            with stage("filter"):
+                plan = plan_join(tables, join["on_columns"])
+                records = iter_join(metadata, join, plan)
+                if join["remaining"]:
+                    records = filter(make_predicate(
+                        join["remaining"], join["column_types"]), records)
+                if order_by is not None:
+                    with stage("sort"):
+                        records = sort_records(records, order_by, stop,
+                                               join["column_types"])
+                return list(project_records(islice(records, start, stop),
+                                            join["columns"]))
+
+    records = select_cacher(
+        cache_key, fetch_data,
+        version=tuple(get_table_signature(table) for table in tables))
+    metrics.count("rows_returned", len(records))
+    return records
+
+def explain_join(metadata, table_name, join_table, on, where_clause=None,
+                 order_by=None, limit=None, offset=None, columns=None):
+    """
+    Описывает соединение, не выполняя его: способ соединения, таблицы,
+    количество их записей и оценку количества записей результата.
+    Соединение оценивается как соединение по внешнему ключу: каждой
+    записи большей таблицы соответствует одна запись меньшей, поэтому
+    оценка - количество записей большей таблицы, умноженное на доли
+    записей, подходящих под условия where
+    """
+    join = resolve_join(metadata, table_name, join_table, on, where_clause,
+                        order_by, columns)
+    tables = join["tables"]
+    first, second = sorted(tables)
+    with table_lock(first), table_lock(second):
+        plan = plan_join(tables, join["on_columns"])
+        rows = plan["rows"]
+        if plan["method"] == "index":
+            table = plan["lookup"]
+            access = f"поиск по индексу {table}.{join['on_columns'][table]} \
+для записей {plan['probe']}"
+        else:
+            table = plan["build"]
+            access = f"hash join: хэш-таблица по {table}, \
+просмотр {plan['probe']}"
+            if rows[table] > get_max_rows():
+                access += " (с разбиением на диск)"
+        estimate = max(rows.values())
+        for table in tables:
+            estimate *= where_selectivity(table, None, join["pushed"][table],
+                                          get_column_types(metadata, table))
+    estimate *= where_selectivity(None, None, join["remaining"],
+                                  join["column_types"])
+    estimate = max(estimate - (offset or 0), 0)
+    if limit is not None:
+        estimate = min(estimate, limit)
+    return {"table": table_name, "storage": detect_storage(table_name),
+            "rows": rows[table_name], "columns": join["columns"],
+            "access": access, "sort": order_by is not None,
+            "estimated_rows": round(estimate),
+            "join": {"table": join_table,
+                     "storage": detect_storage(join_table),
+                     "rows": rows[join_table]}}
+
+@locked_table(exclusive=False)
+def export_table(metadata, table_name, filepath, where_clause=None):
+    """
+    Выгружает записи таблицы в файл CSV или JSONL потоком,
+    не строя список результатов. Возвращает количество записей
+    """
+    rows = iter_select(metadata, table_name, where_clause)
+    column_types = get_column_types(metadata, table_name)
+    count = write_export_rows(filepath, column_types, rows)
+    metrics.count("rows_returned", count)
+    return count
+
+@locked_table(exclusive=True)
 def update(metadata, table_name, set_clause, where_clause):
     """
-    Обновляет записи в таблице
+    Обновляет записи в таблице и возвращает список ID
+    подходящих под условие записей
     """
-    table_data = load_table_data(table_name)
-    updated_data = []
-    updated_ids = []
+    require_table(metadata, table_name)
+    with stage("load"):
+        table_data = load_table_data(table_name)
+    column_types = get_column_types(metadata, table_name)
+    columns = list(column_types)
     
-    if list(where_clause.keys())[0] not in \
-        list(table_data[0].keys()):
-        raise ValueError(
+    if any(column not in columns
+           for column, _, _ in where_conditions(where_clause)):
+        raise ColumnNotFoundError(
 "В таблице отсутствует столбец " \
 "с названием из условия where"
             )
 
-    if list(set_clause.keys())[0] not in \
-        list(table_data[0].keys()):
-        raise ValueError(
+    if any(column not in columns for column in set_clause):
+        raise ColumnNotFoundError(
 "В таблице отсутствует столбец " \
 "с названием из условия set"
             )
+    # значения set проверяются по типам столбцов так же, как при
+    # вставке, до того как что-либо записано в журнал
+    set_values = {column: validate_value(column, column_types[column], value)
+                  for column, value in set_clause.items()}
     
-    for record in table_data:
-        match = True
-        for column, value in where_clause.items():
-            if record.get(column) != str(value):
-                match = False
-        
-        if match:
-            # создаем копию записи и обновляем ее
-            updated_record = record.copy()
-            updated_ids.append(str(updated_record["ID"]))
-            for set_column, set_value in set_clause.items():
-                updated_record[set_column] = str(set_value)
-            updated_data.append(updated_record)
-        else:
-            updated_data.append(record)
+    with stage("filter"):
+        matched_records = filter_records(
+            table_name, table_data, where_clause, column_types)
+    updated_ids = [record["ID"] for record in matched_records]
+    old_records = []
+    changed_records = []
+
+    make_row = row_factory(column_types)
+    for record in matched_records:
+        # создаем копию записи и обновляем ее
+        updated_record = record.copy()
+        updated_record.update(set_values)
+        updated_record = make_row(updated_record)
+        if updated_record != record:
+            old_records.append(record)
+            changed_records.append(updated_record)
     
-    if updated_data != table_data:
-        save_table_data(table_name, updated_data)
+    if changed_records:
+        with stage("save"):
+            commit_table_changes(table_name, changed_records,
+                                 table_data=table_data)
+            update_indexes(table_name, load_table_data(table_name),
+                           old_records=old_records,
+                           new_records=changed_records)
+        metrics.count("rows_written", len(changed_records))
+        invalidate_select_cache(table_name)
     
-    return ", ".join(updated_ids)
+    return updated_ids
 
-@handle_db_errors
-@confirm_action("Удаление значений")
-def delete(table_name, where_clause):
+@locked_table(exclusive=True)
+def delete(metadata, table_name, where_clause):
     """
-    Удаляет записи из таблицы
+    Удаляет записи из таблицы и возвращает список ID удаленных записей
     """
-    table_data = load_table_data(table_name)
-    
-    # фильтруем записи для удаления
-    records_to_keep = []
-    deleted_ids = []
+    require_table(metadata, table_name)
+    with stage("load"):
+        table_data = load_table_data(table_name)
+    column_types = get_column_types(metadata, table_name)
     
-    for record in table_data:
-        match = True
-        for column, value in where_clause.items():
-            if record.get(column) != value:
-                match = False
-        
-        if not match:
-            records_to_keep.append(record)
-        else:
-            deleted_ids.append(str(record["ID"]))
+    # находим записи для удаления
+    with stage("filter"):
+        deleted_records = filter_records(
+            table_name, table_data, where_clause, column_types)
+    deleted_ids = [record["ID"] for record in deleted_records]
     
     if deleted_ids:
-        save_table_data(table_name, records_to_keep)
-        return ", ".join(deleted_ids)
+        with stage("save"):
+            commit_table_changes(table_name, deleted_ids=deleted_ids,
+                                 table_data=table_data)
+            update_indexes(table_name, load_table_data(table_name),
+                           old_records=deleted_records)
+        metrics.count("rows_written", len(deleted_ids))
+        invalidate_select_cache(table_name)
+        return deleted_ids
     else:
-        raise KeyError(
+        raise NoDataError(
 "В таблице отсутствуют подходящие данные для удаления"
             )
 
-@handle_db_errors
-def display_table(data, table_name, metadata):
+@locked_table(exclusive=True)
+def convert_table(metadata, table_name, storage):
     """
-    Отображает данные в виде таблицы
+    Переводит таблицу в другой формат хранения (json, log, columnar)
+    Возвращает количество записей
     """
-    if not data:
-        raise KeyError("Нет данных для отображения")
-        return
-    
-    # Получаем названия столбцов из метаданных
-    if table_name in metadata:
-        table_meta = metadata[table_name]
-        columns = [col.split(":")[0] for col \
-                   in table_meta if col.split(":")[0]]
-    else:
-        # Если метаданных нет
-        raise KeyError(
-"В файле метаданных отсутствует описание таблицы")
-    
-    table = PrettyTable()
-    table.field_names = columns
-    
-    for record in data:
-        row = [record.get(col, '') for col in columns]
-        table.add_row(row)
-    
-    print(table)
+    require_table(metadata, table_name)
 
-@handle_db_errors
-def info(table_name, metadata):
+    count = convert_table_storage(
+        table_name, storage, get_column_types(metadata, table_name))
+    invalidate_select_cache(table_name)
+    return count
+
+@locked_table(exclusive=True)
+def create_index(metadata, table_name, column, kind="hash"):
     """
-    Выводит информацию о таблице
+    Создает индекс по столбцу таблицы: hash - для условий равенства,
+    sorted - также для диапазонов и сортировки.
+    Возвращает количество различных значений в индексе
     """
-    if table_name not in metadata:
-        raise KeyError(f"Таблица '{table_name}' не существует")
-    
-    table_meta = metadata[table_name]
-    table_data = load_table_data(table_name)
-    
-    print(f"Информация о таблице '{table_name}':")
-    print(f"Количество записей: {len(table_data)}")
-    print(f"Названия столбцов и типы данных: {table_meta}")
\ No newline at end of file
+    require_table(metadata, table_name)
+
+    column_types = get_column_types(metadata, table_name)
+    if column not in column_types:
+        raise ColumnNotFoundError(
+            f"В таблице '{table_name}' нет столбца '{column}'")
+    if column == "ID":
+        raise ValidationError("Поиск по ID выполняется по индексу по умолчанию")
+    if kind not in INDEX_KINDS:
+        raise ValidationError(f"Некорректный вид индекса: {kind}. \
+Допустимые виды: {', '.join(INDEX_KINDS)}")
+
+    column_type = column_types[column] if kind == "sorted" else None
+    return add_index(table_name, column, load_table_data(table_name),
+                     column_type)
+
+@locked_table(exclusive=True)
+def drop_index(metadata, table_name, column):
+    """
+    Удаляет индекс по столбцу таблицы
+    """
+    require_table(metadata, table_name)
+
+    remove_index(table_name, column, load_table_data(table_name))
+    return column
+
+def info(metadata, table_name):
+    """
+    Возвращает информацию о таблице: количество записей,
+    столбцы с типами и индексы {столбец: вид}
+    """
+    require_table(metadata, table_name)
+
+    table_meta = get_table_columns(metadata, table_name)
+    with table_lock(table_name):
+        # количество записей известно без чтения таблицы,
+        # записи нужны только для проверки индексов
+        rows = count_rows(table_name)
+        indexes = {}
+        if has_table_indexes(table_name):
+            indexes = load_table_indexes(table_name,
+                                         load_table_data(table_name))
+
+    return {"table": table_name, "rows": rows,
+            "columns": list(table_meta), "indexes": dict(indexes)}
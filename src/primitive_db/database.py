@@ -0,0 +1,412 @@
+import os
+from contextlib import contextmanager
+
+from src.decorators import ask_confirmation, confirm_answer, log_time
+from src.primitive_db import core, metrics
+from src.primitive_db.errors import (
+    OperationCancelled,
+    TransactionError,
+    ValidationError,
+)
+from src.primitive_db.prepared import QUERY_RUNNERS, PreparedStatement
+from src.primitive_db.profiler import profiling, stage
+from src.primitive_db.utils import (
+    STORAGE_FORMATS,
+    begin_transaction,
+    checkpoint_wal,
+    commit_drop_table,
+    commit_transaction,
+    compact_table_log,
+    create_table_storage,
+    get_metadata_version,
+    get_table_columns,
+    in_transaction,
+    load_metadata,
+    release_ids,
+    replay_wal,
+    rollback_transaction,
+)
+
+# команды, для которых доступны explain и profile
+EXPLAIN_TYPES = ("select", "update", "delete")
+
+# каталоги данных, для которых в этом процессе уже применен журнал WAL
+_recovered_dirs = set()
+
+
+class Database:
+    """
+    Программный интерфейс базы данных без вывода на экран:
+    методы возвращают значения и выбрасывают типизированные
+    исключения из errors (DatabaseError и его наследники).
+
+        db = Database(force=True)
+        db.create_table("users", ["name:str", "age:int"])
+        db.insert("users", ["Sergei", 28])
+        db.select("users", where=[("age", ">", "25")])
+
+    Условие where - список условий, соединенных and:
+    (столбец, оператор, значение) или группа {"or": [список условий,
+    ...]}; для between значение - пара границ. Опасные операции (drop_table,
+    delete) без force требуют подтверждения: в интерактивном режиме
+    (interactive=True) оно запрашивается у пользователя, иначе берется
+    готовый ответ из confirm_answer (его задает, например, сервер
+    по запросу клиента), а без ответа выбрасывается OperationCancelled.
+    При создании первого объекта в процессе к файлам данных применяются
+    изменения из журнала WAL, оставшиеся после сбоя (см. recover).
+    Метаданные хранятся в объекте и перечитываются, только если файл
+    метаданных изменился.
+    Время выполнения операций записывается в статистику (stats)
+    """
+
+    def __init__(self, force=False, interactive=False):
+        self.force = force
+        self.interactive = interactive
+        self._metadata = None
+        self._version = None
+        if os.path.abspath("data") not in _recovered_dirs:
+            self.recover()
+
+    @property
+    def metadata(self):
+        """
+        Метаданные базы, актуальные на момент обращения
+        """
+        version = get_metadata_version()
+        if self._metadata is None or version != self._version:
+            self._metadata = load_metadata()
+            self._version = version
+        return self._metadata
+
+    def refresh(self):
+        """
+        Сбрасывает метаданные: при следующем обращении они перечитываются
+        """
+        self._metadata = None
+
+    def confirm(self, action_name, force=None):
+        """
+        Подтверждение опасной операции. Выбрасывает OperationCancelled,
+        если операция не подтверждена
+        """
+        if self.force if force is None else force:
+            return
+        if not self.interactive and confirm_answer.get() is None:
+            raise OperationCancelled(f'Операция "{action_name}" требует \
+подтверждения: передайте force=True')
+        if not ask_confirmation(action_name):
+            raise OperationCancelled("Операция отменена.")
+
+    def _require_no_transaction(self, command):
+        if in_transaction():
+            raise TransactionError(f"Команда {command} недоступна внутри \
+транзакции. Выполните commit или rollback.")
+
+    # схема
+
+    def list_tables(self):
+        return core.list_tables(self.metadata)
+
+    @log_time
+    def create_table(self, table_name, columns, storage="json"):
+        """
+        Создает таблицу со столбцами ["имя:тип", ...] и возвращает
+        список ее столбцов (вместе с ID)
+        """
+        self._require_no_transaction("create_table")
+        if storage not in STORAGE_FORMATS:
+            raise ValidationError(f'Некорректный формат хранения: \
+{storage}. Допустимые форматы: {", ".join(STORAGE_FORMATS)}')
+        # версия нужна, чтобы не затереть изменения схемы другим процессом
+        version = get_metadata_version()
+        metadata = core.create_table(load_metadata(), table_name, columns)
+        try:
+            create_table_storage(metadata, table_name, storage, version)
+        finally:
+            self.refresh()
+        return get_table_columns(metadata, table_name)
+
+    @log_time
+    def drop_table(self, table_name, force=None):
+        """
+        Удаляет таблицу вместе с данными
+        """
+        self._require_no_transaction("drop_table")
+        version = get_metadata_version()
+        metadata = load_metadata()
+        core.require_table(metadata, table_name)
+        self.confirm("Удаление таблицы", force)
+        metadata = core.drop_table(metadata, table_name)
+        try:
+            commit_drop_table(metadata, table_name, version)
+        finally:
+            self.refresh()
+
+    @log_time
+    def compact_table(self, table_name):
+        """
+        Сжимает журнал таблицы, возвращает количество записей
+        """
+        self._require_no_transaction("compact_table")
+        core.require_table(self.metadata, table_name)
+        return compact_table_log(table_name)
+
+    @log_time
+    def convert_table(self, table_name, storage):
+        """
+        Переводит таблицу в другой формат хранения,
+        возвращает количество записей
+        """
+        self._require_no_transaction("convert_table")
+        return core.convert_table(self.metadata, table_name, storage)
+
+    @log_time
+    def create_index(self, table_name, column, kind="hash"):
+        """
+        Создает индекс, возвращает количество различных значений
+        """
+        self._require_no_transaction("create_index")
+        return core.create_index(self.metadata, table_name, column, kind)
+
+    def drop_index(self, table_name, column):
+        self._require_no_transaction("drop_index")
+        return core.drop_index(self.metadata, table_name, column)
+
+    def info(self, table_name):
+        """
+        Возвращает словарь с количеством записей, столбцами и индексами
+        """
+        return core.info(self.metadata, table_name)
+
+    # данные
+
+    @log_time
+    def insert(self, table_name, values):
+        """
+        Добавляет запись и возвращает ее ID
+        """
+        return core.insert(self.metadata, table_name, values)
+
+    @log_time
+    def insert_many(self, table_name, rows):
+        """
+        Добавляет записи одной пакетной вставкой, возвращает
+        список (первый ID, последний ID, количество)
+        """
+        return core.insert_rows(self.metadata, table_name, rows)
+
+    @log_time
+    def import_table(self, table_name, filepath):
+        """
+        Загружает записи из файла CSV или JSONL
+        """
+        return core.import_table(self.metadata, table_name, filepath)
+
+    @log_time
+    def select(self, table_name, where=None, order_by=None, limit=None,
+               offset=None, columns=None):
+        """
+        Возвращает список записей (rows.Row или словари с выбранными
+        столбцами), доступных как словари. order_by - пара
+        (столбец, по убыванию ли), columns - список выбираемых
+        столбцов (по умолчанию все)
+        """
+        return core.select(self.metadata, table_name, where, order_by, limit,
+                           offset, columns)
+
+    def iter_select(self, table_name, where=None, order_by=None, limit=None,
+                    offset=None, columns=None):
+        """
+        Возвращает итератор записей, читаемых по мере обхода
+        """
+        return core.iter_select(self.metadata, table_name, where, order_by,
+                                limit, offset, columns)
+
+    @log_time
+    def aggregate(self, table_name, aggregates, group_by=None, where=None,
+                  order_by=None, limit=None, offset=None, columns=None):
+        """
+        Вычисляет агрегаты [(функция, столбец)] - count, sum, min,
+        max, avg; столбец count может быть "*" - с группировкой
+        по столбцам group_by. Возвращает список записей
+        {столбец group by или "функция(столбец)": значение}
+        """
+        return core.aggregate(self.metadata, table_name, aggregates,
+                              group_by, where, order_by, limit, offset,
+                              columns)
+
+    @log_time
+    def join(self, table_name, join_table, on, where=None, order_by=None,
+             limit=None, offset=None, columns=None):
+        """
+        Соединяет записи двух таблиц по равенству столбцов on - пары
+        ("users.ID", "orders.user_id"); имя столбца без таблицы
+        допускается, если оно однозначно. Возвращает список записей
+        {"<таблица>.<столбец>": значение} (см. core.join_select)
+        """
+        return core.join_select(self.metadata, table_name, join_table, on,
+                                where, order_by, limit, offset, columns)
+
+    @log_time
+    def update(self, table_name, values, where):
+        """
+        Записывает values {столбец: значение} в записи, подходящие
+        под условие, возвращает список их ID
+        """
+        return core.update(self.metadata, table_name, values, where)
+
+    @log_time
+    def delete(self, table_name, where, force=None):
+        """
+        Удаляет записи, подходящие под условие, возвращает их ID
+        """
+        core.require_table(self.metadata, table_name)
+        self.confirm("Удаление значений", force)
+        return core.delete(self.metadata, table_name, where)
+
+    @log_time
+    def export_table(self, table_name, filepath, where=None):
+        """
+        Выгружает записи в файл CSV или JSONL, возвращает их количество
+        """
+        return core.export_table(self.metadata, table_name, filepath, where)
+
+    # команды в текстовом виде
+
+    def prepare(self, statement):
+        """
+        Подготавливает команду с параметрами ? (см. PreparedStatement)
+        """
+        return PreparedStatement(statement, self)
+
+    def execute(self, statement, params=()):
+        """
+        Выполняет команду select, insert, update, delete или export
+        в текстовом виде с параметрами ? и возвращает ее результат
+        """
+        return self.prepare(statement).execute(params)
+
+    def explain(self, statement, params=()):
+        """
+        Описывает выполнение команды select, update или delete,
+        не выполняя ее: способ доступа к записям, количество записей
+        таблицы и оценку количества подходящих записей (см.
+        core.explain_access). Возвращает словарь
+        """
+        statement = self.prepare(statement)
+        return self._explain(statement, statement.bind(params))
+
+    def _explain(self, statement, query):
+        if statement.kind not in EXPLAIN_TYPES:
+            raise ValidationError(f"explain и profile поддерживают команды \
+{', '.join(EXPLAIN_TYPES)}")
+        if query.get("aggregates") is not None:
+            return {"statement": statement.kind,
+                    **core.explain_aggregate(
+                        self.metadata, query["table"], query["aggregates"],
+                        query["group_by"], query["where"], query["order_by"],
+                        query["limit"], query["offset"], query["columns"])}
+        if query.get("join") is not None:
+            return {"statement": statement.kind,
+                    **core.explain_join(
+                        self.metadata, query["table"], query["join"]["table"],
+                        query["join"]["on"], query["where"], query["order_by"],
+                        query["limit"], query["offset"], query["columns"])}
+        return {"statement": statement.kind,
+                **core.explain_access(
+                    self.metadata, query["table"], query["where"],
+                    query.get("order_by"), query.get("limit"),
+                    query.get("offset"), query.get("columns"),
+                    column_scan=statement.kind == "select")}
+
+    def profile(self, statement, params=(), force=None):
+        """
+        Выполняет команду select, update или delete и возвращает пару
+        (результат, профиль): профиль содержит описание explain,
+        фактическое количество записей и время этапов
+        (см. profiler.STAGES)
+        """
+        with profiling() as profile:
+            with stage("plan"):
+                statement = self.prepare(statement)
+                query = statement.bind(params)
+            profile.plan = self._explain(statement, query)
+            result = QUERY_RUNNERS[statement.kind](self, query, force)
+        profile.actual_rows = len(result)
+        return result, profile
+
+    # транзакции
+
+    def begin(self):
+        begin_transaction()
+
+    @log_time
+    def commit(self):
+        """
+        Фиксирует транзакцию, возвращает список измененных таблиц
+        """
+        return commit_transaction()
+
+    def rollback(self):
+        """
+        Отменяет транзакцию, возвращает список таблиц,
+        изменения которых отброшены
+        """
+        return rollback_transaction()
+
+    def in_transaction(self):
+        return in_transaction()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Блок в транзакции: фиксируется при выходе,
+        отменяется при исключении
+        """
+        begin_transaction()
+        try:
+            yield self
+        except BaseException:
+            rollback_transaction()
+            raise
+        commit_transaction()
+
+    # обслуживание
+
+    @staticmethod
+    def stats():
+        """
+        Возвращает статистику процесса: время операций (p50/p95/p99),
+        счетчики записей, байтов и попаданий в кэш, состояние кэшей
+        """
+        return metrics.snapshot()
+
+    @staticmethod
+    def recover():
+        """
+        Применяет изменения из журнала WAL, не записанные в файлы
+        данных (после сбоя). Выполняется автоматически при создании
+        первого объекта Database в процессе. Возвращает количество
+        изменений
+        """
+        recovered = replay_wal()
+        _recovered_dirs.add(os.path.abspath("data"))
+        return recovered
+
+    def close(self):
+        """
+        Отменяет незафиксированную транзакцию, возвращает
+        неиспользованные зарезервированные ID и записывает
+        контрольную точку журнала. Возвращает список таблиц
+        отмененной транзакции
+        """
+        tables = rollback_transaction() if in_transaction() else []
+        release_ids()
+        checkpoint_wal()
+        return tables
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,42 +1,67 @@
+import json
 import shlex
+from itertools import islice
 
 import prompt
+from prettytable import PrettyTable
 
-from src.primitive_db.core import (
-    create_table,
-    delete,
-    display_table,
-    drop_table,
-    info,
-    insert,
-    list_tables,
-    select,
-    update,
-)
-from src.primitive_db.parser import parse_set_clause, parse_values, parse_where_clause
+from src.decorators import handle_db_errors
+from src.primitive_db import metrics
+from src.primitive_db.database import Database
+from src.primitive_db.errors import TableNotFoundError, ValidationError
+from src.primitive_db.parser import scan_values
+from src.primitive_db.planner import STATEMENT_TYPES, compile_statement
+from src.primitive_db.profiler import STAGES, profiling, stage
 from src.primitive_db.utils import (
-    load_metadata,
-    save_metadata,
-    save_table_data,
+    count_rejected_wal_entries,
+    get_rejected_wal_path,
+    get_table_columns,
 )
 
 HELP_TEXT = """***Процесс работы с таблицей***
 Функции:
 <command> create_table <имя_таблицы> 
-<столбец1:тип> <столбец2:тип> .. - создать таблицу
+<столбец1:тип> <столбец2:тип> .. [storage=json|log|columnar] - создать таблицу
+<command> compact_table <имя_таблицы> - сжать журнал таблицы
+<command> convert_table <имя_таблицы> <json|log|columnar> - перевести таблицу
+в другой формат хранения
+<command> create_index <имя_таблицы> <столбец> [hash|sorted] - создать индекс
+по столбцу (sorted - для диапазонов и сортировки)
+<command> drop_index <имя_таблицы> <столбец> - удалить индекс по столбцу
 <command> list_tables - показать список всех таблиц
 <command> drop_table <имя_таблицы> - удалить таблицу
+<command> begin - начать транзакцию
+<command> commit - зафиксировать изменения транзакции
+<command> rollback - отменить изменения транзакции
 <command> exit - выход из программы
 <command> help - справочная информация"""
 
-def print_help():
-    print("""
+def print_help(echo=print):
+    echo("""
 ***Операции с данными***
 Функции:
 <command> insert into <имя_таблицы> values \
 (<значение1>, <значение2>, ...) - создать запись.
+<command> insert into <имя_таблицы> values (...), (...), ... \
+- создать несколько записей за одну запись на диск.
+<command> import <имя_таблицы> <файл.csv|файл.jsonl> - загрузить записи из файла.
+<command> export <имя_таблицы> [where <условие>] to <файл.csv|файл.jsonl> \
+- выгрузить записи в файл.
+<command> page_size <n> - выводить select страницами по n записей (0 - выключить).
 <command> select from <имя_таблицы> where \
 <столбец> = <значение> - прочитать записи по условию.
+(операторы: =, !=, >, <, >=, <=, <столбец> between <a> and <b>;
+условия соединяются and и or, группируются скобками)
+<command> select from <имя_таблицы> [where ...] order by <столбец> \
+[asc|desc] [limit <n>] - прочитать записи в порядке столбца.
+<command> select <столбец1>, <столбец2>, ... from <имя_таблицы> [where ...] \
+[limit <n>] [offset <m>] - прочитать столбцы n записей, пропустив первые m.
+<command> select <столбец>, count(*), sum(<столбец>), avg(<столбец>), \
+min(<столбец>), max(<столбец>) from <имя_таблицы> [where ...] \
+[group by <столбец>, ...] - агрегаты по группам записей.
+<command> select [<таблица>.<столбец>, ...] from <таблица1> join <таблица2> \
+on <таблица1>.<столбец> = <таблица2>.<столбец> [where ...] - соединить записи
+двух таблиц по равенству столбцов.
 <command> select from <имя_таблицы> \
 - прочитать все записи.
 <command> update <имя_таблицы> set <столбец1> = \
@@ -44,199 +69,525 @@ def print_help():
 = <значение_условия> - обновить запись.
 <command> delete from <имя_таблицы> \
 where <столбец> = <значение> - удалить запись.
+<command> prepare <имя> as <команда с параметрами ?> - подготовить команду.
+<command> execute <имя> [(<значение1>, ...)[, (...)]] - выполнить подготовленную
+команду (несколько наборов значений insert/update/delete - одним пакетом).
 <command> info <имя_таблицы> - вывести информацию о таблице.
+<command> explain <select|update|delete ...> - показать план команды
+(способ доступа к записям, оценку количества записей) без выполнения.
+<command> profile <select|update|delete ...> - выполнить команду и показать
+план, фактическое количество записей и время этапов.
+<command> stats [json [<файл>]|on|off|reset] - статистика времени операций
+и счетчиков (json - в формате JSON, on/off - включить или выключить сбор).
 <command> exit - выход из программы
 <command> help- справочная информация
 """)
     
 
-def run():
+def print_inserted(result, table_name, echo=print):
     """
-    Основной цикл программы
+    Выводит результат пакетной вставки
     """
-    print("Добро пожаловать в систему управления базой данных!")
-    print(HELP_TEXT)
-    
+    first_id, last_id, count = result
+    echo(f'В таблицу "{table_name}" добавлено записей: {count} \
+(ID={first_id}..{last_id}).')
+
+
+def display_table(data, table_name, metadata, page_size=None, columns=None,
+                  echo=print):
+    """
+    Отображает данные в виде таблицы (столбцы columns, по умолчанию
+    все столбцы таблицы). Если задан page_size, данные (список или
+    итератор) выводятся страницами по page_size записей, следующая
+    страница читается только по запросу пользователя.
+    Возвращает количество показанных записей
+    """
+    # Получаем названия столбцов из метаданных
+    if table_name not in metadata:
+        # Если метаданных нет
+        raise TableNotFoundError(
+"В файле метаданных отсутствует описание таблицы")
+    if columns is None:
+        columns = [col.split(":")[0] for col \
+                   in get_table_columns(metadata, table_name) if col.split(":")[0]]
+
+    data = iter(data or [])
+    shown = 0
     while True:
-        try:
-            user_input = prompt.string('Введите команду: ')
-            
-            if not user_input:
-                continue
-                
-            # разбиваем команду на аргументы с помощью shlex. 
-            # Получаем список
-            args = shlex.split(user_input)
-            command = args[0]
+        page = list(islice(data, page_size))
+        if not page:
+            break
+
+        with stage("project"):
+            rows = [[record.get(col, '') for col in columns] for record in page]
+
+        with stage("render"):
+            table = PrettyTable()
+            table.field_names = columns
+            table.add_rows(rows)
+            echo(table.get_string())
+        shown += len(page)
+
+        if page_size is None or len(page) < page_size:
+            break
+        response = input(
+f'Показано записей: {shown}. Показать следующие {page_size}? [y/n]: ')
+        if response.lower() != 'y':
+            break
+
+    if not shown:
+        echo("Нет данных для отображения.")
+    return shown
+
+def print_info(table_info, echo=print):
+    """
+    Выводит информацию о таблице
+    """
+    echo(f"Информация о таблице '{table_info['table']}':")
+    echo(f"Количество записей: {table_info['rows']}")
+    echo(f"Названия столбцов и типы данных: {table_info['columns']}")
+    index_list = ["ID"] + [f"{column} ({kind})"
+                           for column, kind in table_info["indexes"].items()]
+    echo(f"Индексы: {', '.join(index_list)}")
+
+
+def print_stats(stats, echo=print):
+    """
+    Выводит статистику: время операций, счетчики и состояние кэшей
+    """
+    echo(f'Сбор метрик: {"включен" if stats["enabled"] else "выключен"}.')
+    if stats["operations"]:
+        table = PrettyTable()
+        table.field_names = ["операция", "вызовов", "среднее, мс", "p50, мс",
+                             "p95, мс", "p99, мс", "макс, мс"]
+        for operation, summary in stats["operations"].items():
+            table.add_row([operation, summary["count"], summary["mean_ms"],
+                           summary["p50_ms"], summary["p95_ms"],
+                           summary["p99_ms"], summary["max_ms"]])
+        echo(table.get_string())
+    for name, value in stats["counters"].items():
+        echo(f"{name}: {value}")
+    for name, value in stats.items():
+        if isinstance(value, dict) and name not in ("operations", "counters"):
+            echo(f"{name}: {', '.join(f'{k}={v}' for k, v in value.items())}")
+
+
+def print_plan(plan, profile=None, echo=print):
+    """
+    Выводит план команды (explain) и, если передан профиль,
+    фактическое количество записей и время этапов (profile)
+    """
+    echo(f"План команды {plan['statement']}:")
+    echo(f"Таблица: {plan['table']} (формат {plan['storage']}, \
+записей: {plan['rows']})")
+    echo(f"Доступ к записям: {plan['access']}")
+    if plan.get("columns"):
+        echo(f"Столбцы: {', '.join(plan['columns'])}")
+    if plan.get("join"):
+        join = plan["join"]
+        echo(f"Соединение с таблицей: {join['table']} (формат \
+{join['storage']}, записей: {join['rows']})")
+    if plan.get("aggregates"):
+        grouping = f" с группировкой по {', '.join(plan['group_by'])}" \
+            if plan["group_by"] else ""
+        echo(f"Агрегаты: {', '.join(plan['aggregates'])}{grouping}")
+    if plan["sort"]:
+        echo("Сортировка: да")
+    echo(f"Оценка количества записей: {plan['estimated_rows']}")
+    if profile is None:
+        return
+    echo(f"Фактическое количество записей: {profile.actual_rows}")
+    table = PrettyTable()
+    table.field_names = ["этап", "время, мс"]
+    table.align["этап"] = "l"
+    for name in STAGES:
+        if name in profile.stages:
+            table.add_row([name, round(profile.stages[name] * 1000, 3)])
+    table.add_row(["всего", round(profile.total() * 1000, 3)])
+    echo(table.get_string())
+
+
+def _silent(text):
+    """
+    Вывод сеанса без текстового вывода: сообщения отбрасываются
+    """
+
+def execute_select(db, query, session):
+    # select name, age from users where age > 28 order by age desc
+    # limit 5 offset 10
+    table_name = query["table"]
+    columns = query["columns"]
+    echo = session["echo"]
+    if query["aggregates"] is not None:
+        # select is_active, count(*), avg(age) from users group by is_active
+        records = db.aggregate(
+            table_name, query["aggregates"], query["group_by"], query["where"],
+            query["order_by"], query["limit"], query["offset"],
+            query["columns"])
+    elif query.get("join") is not None:
+        # select from users join orders on users.ID = orders.user_id
+        join = query["join"]
+        records = db.join(
+            table_name, join["table"], join["on"], query["where"],
+            query["order_by"], query["limit"], query["offset"],
+            query["columns"])
+        # столбцы результата - с именем таблицы (users.name)
+        columns = list(records[0]) if records else None
+    elif session["page_size"] and echo is not None:
+        # постраничный вывод читает записи по мере показа
+        return display_table(
+            db.iter_select(table_name, query["where"], query["order_by"],
+                           query["limit"], query["offset"], query["columns"]),
+            table_name, db.metadata, session["page_size"], columns, echo)
+    else:
+        records = db.select(
+            table_name, query["where"], query["order_by"], query["limit"],
+            query["offset"], query["columns"])
+
+    if echo is not None:
+        display_table(records, table_name, db.metadata, None, columns, echo)
+    return records
+
+def execute_insert(db, query, session):
+    # insert into users values ("Sergei", 28)[, (...)]
+    table_name, rows = query["table"], query["rows"]
+    echo = session["echo"] or _silent
+    if len(rows) == 1:
+        new_id = db.insert(table_name, rows[0])
+        echo(f'Запись с ID={new_id} успешно добавлена в таблицу "{table_name}".')
+        return new_id
+    result = db.insert_many(table_name, rows)
+    print_inserted(result, table_name, echo)
+    return result
+
+def execute_update(db, query, session):
+    # update users set age = 29 where name = "Sergei"
+    table_name = query["table"]
+    updated = db.update(table_name, query["set"], query["where"])
+    (session["echo"] or _silent)(f'Запись с ID={", ".join(map(str, updated))} \
+в таблице {table_name} успешно обновлена.')
+    return updated
+
+def execute_delete(db, query, session):
+    # delete from users where ID = 1
+    table_name = query["table"]
+    deleted = db.delete(table_name, query["where"])
+    (session["echo"] or _silent)(f'Запись(и) с ID={", ".join(map(str, deleted))} \
+успешно удалена(ы) из таблицы {table_name}.')
+    return deleted
+
+def execute_export(db, query, session):
+    # export users where age > 30 to users.csv
+    count = db.export_table(query["table"], query["file"], query["where"])
+    (session["echo"] or _silent)(f'Из таблицы "{query["table"]}" выгружено \
+записей: {count} в файл {query["file"]}.')
+    return count
+
+# выполнение плана команды по ее виду
+STATEMENT_HANDLERS = {
+    "select": execute_select,
+    "insert": execute_insert,
+    "update": execute_update,
+    "delete": execute_delete,
+    "export": execute_export,
+}
+
+
+@handle_db_errors
+def recover_database():
+    """
+    Применяет изменения, не записанные в файлы данных при прошлом
+    запуске, и сообщает о записях журнала, которые не удалось применить
+    """
+    recovered = Database.recover()
+    if recovered:
+        print(f"Восстановлено изменений из журнала WAL: {recovered}.")
+    rejected = count_rejected_wal_entries()
+    if rejected:
+        print(f"Не удалось применить записей журнала WAL: {rejected}. "
+              f"Они сохранены в {get_rejected_wal_path()}.")
+
+
+def new_session(interactive=True):
+    """
+    Создает состояние сеанса работы с базой: настройки,
+    действующие между командами одного пользователя или соединения.
+    Постраничный вывод и запрос подтверждений у пользователя
+    доступны только в интерактивном сеансе
+    """
+    # база (в интерактивном сеансе - с запросом подтверждений);
+    # размер страницы при выводе select, None - вывод целиком;
+    # подготовленные команды сеанса по именам; функция текстового
+    # вывода результатов команд, None - без текстового вывода
+    return {"db": Database(interactive=interactive), "page_size": None,
+            "interactive": interactive, "prepared": {}, "echo": print}
+
+
+def execute_command(user_input, session):
+    """
+    Выполняет одну команду в сеансе session, выводя результат
+    и ошибки. Возвращает False, если сеанс нужно завершить
+    (команда exit), иначе True
+    """
+    if not user_input or not user_input.strip():
+        return True
+    return run_command(user_input, session) is not False
+
+
+@handle_db_errors
+def run_command(user_input, session):
+    """
+    Выполняет команду (см. perform_command). Ошибки выводит
+    декоратор handle_db_errors
+    """
+    return perform_command(user_input, session)[1]
+
+
+def perform_command(user_input, session):
+    """
+    Разбирает команду и выполняет ее методами Database. Возвращает
+    пару (результат, продолжать ли сеанс): результат - значение,
+    которое вернул метод Database (записи select, ID записей insert,
+    update и delete, количества записей и т.п.), или None.
+    Текст результата выводится функцией session["echo"], если она
+    задана. Неверный формат команды - ValidationError, ошибки
+    Database не перехватываются
+    """
+    db = session["db"]
+    echo = session["echo"] or _silent
+    command = user_input.split(None, 1)[0]
+
+    if command in STATEMENT_TYPES:
+        # команды с данными выполняются по плану из кэша планов
+        plan, params = compile_statement(user_input)
+        return STATEMENT_HANDLERS[plan.kind](db, plan.bind(params), session), True
+
+    # разбиваем команду на аргументы с помощью shlex. 
+    # Получаем список
+    args = shlex.split(user_input)
+    result = None
+
+    if command == "exit":
+        result = db.close()
+        if result:
+            echo("Незафиксированная транзакция отменена.")
+        echo("Выход из программы.")
+        return result, False
+
+    elif command == "begin":
+        db.begin()
+        echo("Транзакция начата.")
+
+    elif command == "commit":
+        result = db.commit()
+        echo(f"Транзакция зафиксирована, измененные таблицы: \
+{', '.join(result) or 'нет'}.")
+
+    elif command == "rollback":
+        result = db.rollback()
+        echo(f"Транзакция отменена, отброшены изменения таблиц: \
+{', '.join(result) or 'нет'}.")
+        
+    elif command == "help":
+        print_help(echo)
+        
+    elif command == "list_tables":
+        result = db.list_tables()
+        if result:
+            for table in result:
+                echo(f"- {table}")
+        else:
+            echo("Таблицы отсутствуют.")
             
-            # актуальные метаданные для дальнейшей обработки
-            metadata = load_metadata()
+    elif command == "create_table":
+        if len(args) < 3:
+            raise ValidationError("Недостаточно аргументов. Правильный формат \
+команды: create_table <имя_таблицы> <столбец1:тип> ...")
+        
+        table_name = args[1]
+        # опция storage=<формат> задает формат хранения данных
+        options = [arg for arg in args[2:] if arg.startswith('storage=')]
+        columns = [arg for arg in args[2:] if arg not in options]
+        storage = options[-1].split('=', 1)[1] if options else "json"
+
+        result = db.create_table(table_name, columns, storage)
+        echo(f'Таблица "{table_name}" успешно создана\
+ со столбцами: {", ".join(result)}')
             
-            if command == "exit":
-                print("Выход из программы.")
-                break
-                
-            elif command == "help":
-                print_help()
-                
-            elif command == "list_tables":
-                tables = list_tables(metadata)
-                if tables:
-                    for table in tables:
-                        print(f"- {table}")
-                else:
-                    print("Таблицы отсутствуют.")
-                    
-            elif command == "create_table":
-                if len(args) < 3:
-                    print("Недостаточно аргументов. Правильный формат команды: \
-create_table <имя_таблицы> <столбец1:тип> ...")
-                    continue
-                
-                table_name = args[1]
-                columns = args[2:]
-                
-                try:
-                    metadata = create_table(metadata, table_name, columns)
-                    save_metadata(metadata)
-                    column_list = ", ".join(metadata[table_name])
-                    print(f'Таблица "{table_name}" успешно создана\
- со столбцами: {column_list}')
-                except ValueError as e:
-                    print(f"Ошибка: {e}")
-                    
-            elif command == "drop_table":
-                if len(args) != 2:
-                    print("Неверное количество аргументов. \
+    elif command == "drop_table":
+        if len(args) != 2:
+            raise ValidationError("Неверное количество аргументов. \
 Правильный формат команды: drop_table <имя_таблицы>")
-                    continue
-                
-                table_name = args[1]
-
-                try:#если таблицы нет выведет ValueError с текстом Ошибка: 
-                    #Таблица table_name не существует.
-                    metadata = drop_table(metadata, table_name) 
-                    save_metadata(metadata)
-                    save_table_data(table_name, data=[], data_dir="data")
-                    print(f'Таблица "{table_name}" успешно удалена.')
-                except ValueError as e:
-                    print(f"Ошибка: {e}")
-
-
-            elif user_input.startswith('insert into'):
-                parts = user_input.split(' ', 3)
-                if len(parts) < 4:
-                    print("Ошибка: Неверный формат команды insert")
-                    continue
-                
-                table_name = parts[2]
-                values_str = parts[3]
-                
-                if not values_str.startswith('values'):
-                    print("Ошибка: Ожидается ключевое слово values")
-                    continue
-                
-                values_str = values_str[6:].strip()  # убираем "values"
-                values = parse_values(values_str)
-                
-                try:
-                    new_id = insert(metadata, table_name, values)
-                    print(
-f'Запись с ID={new_id} успешно добавлена в таблицу "{table_name}".')
-                except Exception as e:
-                    print(f"Ошибка: {e}")
-                    
-            elif user_input.startswith('select from'):
-                # select from users where age = 28
-
-                # если не правильный вариант без условия where
-                if len(args) < 3:
-                    print("Ошибка: Неверный формат команды select")
-                    continue
-
-                # если прописано условие where
-                if len(args) > 3 and len(args) < 7:
-                    print("Ошибка: Неверный формат команды select")
-                    continue
-
-                table_name = args[2]
-
-                if len(args) == 7:
-                    where_args = args[4:7]
-                    where_clause = parse_where_clause(where_args)
-                    display_list = select(table_name, where_clause)
-                else:
-                    display_list = select(table_name)
-
-                display_table(display_list, table_name, metadata)
-            
-            elif user_input.startswith('update'):
-                # update users set age = 29 where name = "Sergei"
-            
-                if len(args) < 10:
-                    print("Ошибка: Неверный формат команды update")
-                    continue
+        
+        db.drop_table(args[1])
+        echo(f'Таблица "{args[1]}" успешно удалена.')
 
-                if 'set' not in args or 'where' not in args:
-                    print("Ошибка: Ожидаются set и where условия")
-                    continue
-                
-                table_name = args[1]
-                where_args = args[7:10]
-
-                set_clause = parse_set_clause(args)
-                where_clause = parse_where_clause(where_args)
-
-                try:
-                    updated_id = update(metadata, table_name, set_clause, where_clause)
-                    print(
-f'Запись с ID={updated_id} в таблице {table_name} успешно обновлена.')
-                except Exception as e:
-                    print(f"Ошибка: {e}")
-                    
-            elif user_input.startswith('delete from'):
-                # delete from users where ID = 1
-                
-                if len(args) < 7:
-                    print("Ошибка: Неверный формат команды delete")
-                    continue
-                
-                if "where" not in args:
-                    print("Ошибка: Ожидается ключевое слово where")
-                    continue
+    elif command == "compact_table":
+        if len(args) != 2:
+            raise ValidationError("Неверное количество аргументов. \
+Правильный формат команды: compact_table <имя_таблицы>")
 
-                if "where" not in args[3:7]:
-                    print("Ошибка: Неверный формат команды delete")
-                    continue
+        result = db.compact_table(args[1])
+        echo(f'Журнал таблицы "{args[1]}" сжат, записей: {result}.')
 
-                table_name = args[2]
-                where_args = args[4:7]
-                
-                where_clause = parse_where_clause(where_args)
-                
-                try:
-                    deleted = delete(table_name, where_clause)
-                    if deleted:
-                        print(
-f'Запись(и) с ID={deleted} успешно удалена(ы) из таблицы {table_name}.')
-                    else:
-                        print(
-'Удаление не было выполнено.')
-                except Exception as e:
-                    print(f"Ошибка: {e}")
-                    
-            elif user_input.startswith('info'):
-                # info users
-                parts = user_input.split(' ', 1)
-                if len(parts) < 2:
-                    print("Ошибка: Укажите имя таблицы")
-                    continue
-                
-                table_name = parts[1].strip()
-                info(table_name, metadata)
-                        
+    elif command == "convert_table":
+        if len(args) != 3:
+            raise ValidationError("Неверное количество аргументов. \
+Правильный формат команды: convert_table <имя_таблицы> <json|log|columnar>")
+
+        table_name, storage = args[1], args[2]
+        result = db.convert_table(table_name, storage)
+        echo(f'Таблица "{table_name}" переведена в формат \
+{storage}, записей: {result}.')
+
+    elif command in ("create_index", "drop_index"):
+        max_args = 4 if command == "create_index" else 3
+        if not 3 <= len(args) <= max_args:
+            raise ValidationError(f"Неверное количество аргументов. \
+Правильный формат команды: {command} <имя_таблицы> <столбец>\
+{' [hash|sorted]' if command == 'create_index' else ''}")
+
+        table_name, column = args[1], args[2]
+        if command == "create_index":
+            kind = args[3] if len(args) == 4 else "hash"
+            result = db.create_index(table_name, column, kind)
+            echo(f'Индекс по столбцу "{column}" таблицы \
+"{table_name}" создан, различных значений: {result}.')
+        else:
+            db.drop_index(table_name, column)
+            echo(f'Индекс по столбцу "{column}" таблицы \
+"{table_name}" удален.')
+
+    elif command == "page_size":
+        # page_size 20 - постраничный вывод, page_size 0 - выключить
+        if len(args) != 2 or not args[1].isdigit():
+            raise ValidationError("Правильный формат команды: page_size <число>")
+        if not session["interactive"]:
+            raise ValidationError("Постраничный вывод доступен только \
+в интерактивном режиме.")
+        page_size = int(args[1]) or None
+        session["page_size"] = page_size
+        echo(f'Постраничный вывод: \
+{f"по {page_size} записей" if page_size else "выключен"}.')
+
+    elif command == "prepare":
+        # prepare adults as select from users where age > ?
+        parts = user_input.split(None, 3)
+        if len(parts) != 4 or parts[2].lower() != "as":
+            raise ValidationError("Правильный формат команды: \
+prepare <имя> as <команда с параметрами ?>")
+        statement = db.prepare(parts[3])
+        session["prepared"][parts[1]] = statement
+        result = statement.param_count
+        echo(f'Команда "{parts[1]}" подготовлена, \
+параметров: {statement.param_count}.')
+
+    elif command == "execute":
+        # execute adults (30) или execute add_user ("Anna", 31), ("Bob", 40)
+        parts = user_input.split(None, 2)
+        if len(parts) < 2:
+            raise ValidationError("Правильный формат команды: \
+execute <имя> [(<значение1>, ...)[, (...)]]")
+        statement = session["prepared"].get(parts[1])
+        if statement is None:
+            raise ValidationError(f'Команда "{parts[1]}" не подготовлена.')
+        rows = scan_values(parts[2]) if len(parts) == 3 else [[]]
+        if len(rows) > 1 and statement.kind in ("insert", "update", "delete"):
+            # несколько наборов значений - одним пакетом
+            result = statement.executemany(rows)
+            if statement.kind == "insert":
+                print_inserted(result, statement.plan.table, echo)
+            else:
+                echo(f"Пакет выполнен, наборов значений: {len(result)}.")
+            return result, True
+        result = [STATEMENT_HANDLERS[statement.kind](db, query, session)
+                  for query in [statement.bind(values) for values in rows]]
+        if len(result) == 1:
+            result = result[0]
+
+    elif command in ("explain", "profile"):
+        # explain select from users where age > 30 - план без выполнения,
+        # profile <команда> - выполнение с замером этапов
+        parts = user_input.split(None, 1)
+        if len(parts) != 2:
+            raise ValidationError(f"Правильный формат команды: {command} \
+<select|update|delete ...>")
+        if command == "explain":
+            result = db.explain(parts[1])
+            print_plan(result, echo=echo)
+            return result, True
+        records, profile = db.profile(parts[1])
+        if session["echo"] is not None:
+            if profile.plan["statement"] == "select":
+                with profiling(profile):
+                    display_table(
+                        records, profile.plan["table"], db.metadata,
+                        columns=list(records[0]) if records and (
+                            profile.plan.get("aggregates") is not None
+                            or profile.plan.get("join") is not None)
+                        else profile.plan["columns"], echo=echo)
+            else:
+                echo(f'Обработано записей: {len(records)}, \
+ID: {", ".join(map(str, records))}.')
+            print_plan(profile.plan, profile, echo)
+        result = {"records": records, "profile": profile.as_dict()}
+
+    elif command == "stats":
+        # stats, stats json [файл], stats on|off, stats reset
+        option = args[1] if len(args) > 1 else None
+        if option is None:
+            result = db.stats()
+            print_stats(result, echo)
+        elif option == "json" and len(args) <= 3:
+            text = metrics.dump_json(args[2] if len(args) == 3 else None)
+            if len(args) == 3:
+                echo(f"Статистика записана в файл {args[2]}.")
             else:
-                print(f'Функции "{user_input}" нет. Попробуйте снова.')
+                result = json.loads(text)
+                echo(text)
+        elif option in ("on", "off") and len(args) == 2:
+            metrics.set_enabled(option == "on")
+            echo(f'Сбор метрик {"включен" if option == "on" else "выключен"}.')
+        elif option == "reset" and len(args) == 2:
+            metrics.reset()
+            echo("Статистика сброшена.")
+        else:
+            raise ValidationError("Правильный формат команды: \
+stats [json [<файл>]|on|off|reset]")
+
+    elif command == "import":
+        # import users users.csv
+        if len(args) != 3:
+            raise ValidationError("Неверное количество аргументов. \
+Правильный формат команды: import <имя_таблицы> <файл.csv|файл.jsonl>")
+
+        result = db.import_table(args[1], args[2])
+        print_inserted(result, args[1], echo)
+            
+    elif user_input.startswith('info'):
+        # info users
+        parts = user_input.split(' ', 1)
+        if len(parts) < 2:
+            raise ValidationError("Укажите имя таблицы")
+        
+        result = db.info(parts[1].strip())
+        print_info(result, echo)
                 
-        except Exception as e:
-            print(f"Некорректное значение: {e}. Попробуйте снова.")
\ No newline at end of file
+    else:
+        raise ValidationError(f'Функции "{user_input}" нет. Попробуйте снова.')
+    return result, True
+
+
+def run():
+    """
+    Основной цикл программы
+    """
+    print("Добро пожаловать в систему управления базой данных!")
+    recover_database()
+    print(HELP_TEXT)
+
+    session = new_session()
+    while True:
+        user_input = prompt.string('Введите команду: ')
+        if not execute_command(user_input, session):
+            break
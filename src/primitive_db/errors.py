@@ -0,0 +1,56 @@
+class DatabaseError(Exception):
+    """
+    Базовая ошибка базы данных
+    """
+
+    def __str__(self):
+        # сообщение без кавычек, которые добавляет KeyError
+        return Exception.__str__(self)
+
+
+class TableNotFoundError(DatabaseError, KeyError):
+    """
+    Таблица не существует
+    """
+
+
+class ColumnNotFoundError(DatabaseError, KeyError):
+    """
+    В таблице нет столбца (или индекса по столбцу)
+    """
+
+
+class NoDataError(DatabaseError, KeyError):
+    """
+    Нет записей, подходящих под условие
+    """
+
+
+class TableExistsError(DatabaseError, ValueError):
+    """
+    Таблица (или индекс) уже существует
+    """
+
+
+class ValidationError(DatabaseError, ValueError):
+    """
+    Некорректные значения, типы, условие или формат команды
+    """
+
+
+class TransactionError(DatabaseError, ValueError):
+    """
+    Операция недопустима в текущем состоянии транзакции
+    """
+
+
+class ConflictError(DatabaseError, ValueError):
+    """
+    Данные изменены другим процессом после того, как были прочитаны
+    """
+
+
+class OperationCancelled(DatabaseError):
+    """
+    Опасная операция не подтверждена
+    """
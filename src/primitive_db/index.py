@@ -0,0 +1,467 @@
+import json
+import os
+from bisect import bisect_left, bisect_right, insort
+
+from src.primitive_db.cache import table_cache
+from src.primitive_db.errors import ColumnNotFoundError, TableExistsError
+from src.primitive_db.utils import (
+    convert_value,
+    detect_storage,
+    get_index_path,
+    get_staged_table,
+    get_table_signature,
+)
+
+# виды индексов: hash - только равенство,
+# sorted - равенство, диапазоны и сортировка
+INDEX_KINDS = ("hash", "sorted")
+
+# индексы, загруженные в память: путь к файлу индексов ->
+# {"signature": подпись файла данных,
+#  "indexes": {столбец: {значение: [ID]}},
+#  "ordered": {столбец: тип} для упорядоченных индексов,
+#  "keys": {столбец: отсортированный список (типизированное, исходное)},
+#  "unordered": {столбец: значения, не приводимые к типу столбца}}
+_loaded_indexes = {}
+
+# результат проверки порядка ID: (каталог, таблица) -> (подпись, результат)
+_id_order_checked = {}
+
+
+def build_index(table_data, column):
+    """
+    Строит хеш-индекс столбца: значение -> список ID записей
+    """
+    entries = {}
+    for record in table_data:
+        entries.setdefault(str(record.get(column)), []).append(record["ID"])
+    return entries
+
+def build_sorted_keys(entries, column_type):
+    """
+    Строит отсортированный список ключей упорядоченного индекса.
+    Значения, не приводимые к типу столбца, возвращаются отдельно
+    """
+    keys = []
+    unordered = []
+    for raw in entries:
+        typed = convert_value(raw, column_type)
+        if typed is None:
+            unordered.append(raw)
+        else:
+            keys.append((typed, raw))
+    keys.sort()
+    return keys, unordered
+
+def find_by_id(table_data, record_id, ordered=True):
+    """
+    Находит запись по ID двоичным поиском: записи хранятся
+    в порядке возрастания ID, так как новые ID всегда больше
+    существующих. Полный просмотр выполняется, только если
+    порядок нарушен (ordered=False, файл правили вручную)
+    """
+    try:
+        record_id = int(record_id)
+    except (TypeError, ValueError):
+        return None
+    position = bisect_left(table_data, record_id, key=lambda row: row["ID"])
+    if position < len(table_data) and table_data[position]["ID"] == record_id:
+        return table_data[position]
+    if ordered:
+        return None
+    for record in table_data:
+        if record["ID"] == record_id:
+            return record
+    return None
+
+def find_by_ids(table_data, record_ids, ordered=True):
+    """
+    Возвращает записи с указанными ID в порядке их хранения
+    """
+    records = [find_by_id(table_data, record_id, ordered)
+               for record_id in record_ids]
+    records = [record for record in records if record is not None]
+    return sorted(records, key=lambda row: row["ID"])
+
+def range_bounds(keys, operator, value, key=None):
+    """
+    Возвращает границы среза отсортированного списка keys,
+    удовлетворяющего условию "<ключ> <operator> value"
+    """
+    if operator == "between":
+        low, high = value
+        return (bisect_left(keys, low, key=key),
+                bisect_right(keys, high, key=key))
+    if operator == ">":
+        return bisect_right(keys, value, key=key), len(keys)
+    if operator == ">=":
+        return bisect_left(keys, value, key=key), len(keys)
+    if operator == "<":
+        return 0, bisect_left(keys, value, key=key)
+    if operator == "<=":
+        return 0, bisect_right(keys, value, key=key)
+    raise ValueError(f"Оператор {operator} не поддерживается индексом")
+
+def _typed_condition_value(operator, value, column_type):
+    if operator == "between":
+        low, high = (convert_value(bound, column_type) for bound in value)
+        return None if low is None or high is None else (low, high)
+    return convert_value(value, column_type)
+
+def _is_id_ordered(table_name, table_data, data_dir="data"):
+    """
+    Проверяет, что записи идут по возрастанию ID. Результат
+    запоминается до следующего изменения файла данных
+    """
+    signature = get_table_signature(table_name, data_dir)
+    checked = _id_order_checked.get((data_dir, table_name))
+    if checked is not None and checked[0] == signature:
+        return checked[1]
+    result = all(table_data[i]["ID"] < table_data[i + 1]["ID"]
+                 for i in range(len(table_data) - 1))
+    _id_order_checked[(data_dir, table_name)] = (signature, result)
+    return result
+
+def _find_record(table_name, table_data, record_id, data_dir="data"):
+    """
+    Находит запись по ID. Если двоичный поиск ее не нашел, полный
+    просмотр выполняется только при нарушенном порядке ID
+    """
+    record = find_by_id(table_data, record_id)
+    if record is None and not _is_id_ordered(table_name, table_data, data_dir):
+        record = find_by_id(table_data, record_id, ordered=False)
+    return record
+
+def _find_records(table_name, table_data, record_ids, data_dir="data"):
+    """
+    Находит записи по ID из индекса (см. _find_record)
+    """
+    records = find_by_ids(table_data, record_ids)
+    if len(records) < len(record_ids) \
+            and not _is_id_ordered(table_name, table_data, data_dir):
+        records = find_by_ids(table_data, record_ids, ordered=False)
+    return records
+
+def _remember(index_path, signature, indexes, ordered):
+    loaded = {"signature": signature, "indexes": indexes,
+              "ordered": ordered, "keys": {}, "unordered": {}}
+    for column, column_type in ordered.items():
+        loaded["keys"][column], loaded["unordered"][column] = \
+            build_sorted_keys(indexes[column], column_type)
+    _loaded_indexes[index_path] = loaded
+    return loaded
+
+def _load(table_name, table_data, data_dir="data"):
+    """
+    Возвращает загруженные в память индексы таблицы или None,
+    если индексов нет. Индексы, построенные для другой версии
+    файла данных (например, после ручного изменения файла),
+    перестраиваются. Для таблицы, измененной в незафиксированной
+    транзакции, индексы не используются: они соответствуют файлу
+    данных и перестраиваются после фиксации
+    """
+    if get_staged_table(table_name, data_dir) is not None:
+        return None
+    index_path = get_index_path(table_name, data_dir)
+    signature = get_table_signature(table_name, data_dir)
+
+    loaded = _loaded_indexes.get(index_path)
+    if loaded is not None and loaded["signature"] == signature:
+        return loaded
+
+    if not os.path.exists(index_path):
+        _loaded_indexes.pop(index_path, None)
+        return None
+
+    def read_index_file():
+        with open(index_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    stored = table_cache.get(index_path, read_index_file)
+    stored_signature = stored["signature"]
+    if stored_signature is not None:
+        stored_signature = tuple(stored_signature)
+    ordered = stored.get("ordered", {})
+
+    if stored_signature == signature:
+        return _remember(index_path, signature, stored["indexes"], ordered)
+
+    indexes = {column: build_index(table_data, column)
+               for column in stored["indexes"]}
+    save_table_indexes(table_name, indexes, ordered, data_dir)
+    return _loaded_indexes[index_path]
+
+def has_table_indexes(table_name, data_dir="data"):
+    """
+    Проверяет, есть ли у таблицы индексы (кроме встроенного по ID)
+    """
+    return get_index_path(table_name, data_dir) in _loaded_indexes \
+        or os.path.exists(get_index_path(table_name, data_dir))
+
+def load_table_indexes(table_name, table_data, data_dir="data"):
+    """
+    Возвращает виды индексов таблицы {столбец: "hash" | "sorted"}
+    """
+    loaded = _load(table_name, table_data, data_dir)
+    if loaded is None:
+        return {}
+    return {column: "sorted" if column in loaded["ordered"] else "hash"
+            for column in loaded["indexes"]}
+
+def save_table_indexes(table_name, indexes, ordered=None, data_dir="data"):
+    """
+    Сохраняет индексы таблицы вместе с подписью файла данных,
+    для которого они построены. Если индексов нет, файл удаляется
+    """
+    index_path = get_index_path(table_name, data_dir)
+    if not indexes:
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        table_cache.invalidate(index_path)
+        _loaded_indexes.pop(index_path, None)
+        return
+
+    ordered = ordered or {}
+    signature = _write_index_file(table_name, indexes, ordered, data_dir)
+    _remember(index_path, signature, indexes, ordered)
+
+def _write_index_file(table_name, indexes, ordered, data_dir="data"):
+    """
+    Записывает файл индексов через временный файл.
+    Возвращает подпись файла данных, для которой записаны индексы
+    """
+    index_path = get_index_path(table_name, data_dir)
+    signature = get_table_signature(table_name, data_dir)
+    stored = {"signature": signature, "indexes": indexes, "ordered": ordered}
+    os.makedirs(data_dir, exist_ok=True)
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(stored, f, ensure_ascii=False)
+    os.replace(tmp_path, index_path)
+    table_cache.put(index_path, stored)
+    return signature
+
+def add_index(table_name, column, table_data, column_type=None,
+              data_dir="data"):
+    """
+    Создает индекс по столбцу и сохраняет его на диск.
+    Если указан тип столбца column_type, индекс упорядоченный.
+    Возвращает количество различных значений в индексе
+    """
+    loaded = _load(table_name, table_data, data_dir)
+    indexes = dict(loaded["indexes"]) if loaded else {}
+    ordered = dict(loaded["ordered"]) if loaded else {}
+    if column in indexes:
+        raise TableExistsError(
+            f'Индекс по столбцу "{column}" таблицы "{table_name}" уже существует.')
+    indexes[column] = build_index(table_data, column)
+    if column_type is not None:
+        ordered[column] = column_type
+    save_table_indexes(table_name, indexes, ordered, data_dir)
+    return len(indexes[column])
+
+def remove_index(table_name, column, table_data, data_dir="data"):
+    """
+    Удаляет индекс по столбцу
+    """
+    loaded = _load(table_name, table_data, data_dir)
+    if loaded is None or column not in loaded["indexes"]:
+        raise ColumnNotFoundError(
+            f'Индекс по столбцу "{column}" таблицы "{table_name}" не существует.')
+    indexes = dict(loaded["indexes"])
+    ordered = dict(loaded["ordered"])
+    del indexes[column]
+    ordered.pop(column, None)
+    save_table_indexes(table_name, indexes, ordered, data_dir)
+
+def has_index(table_name, table_data, column, operator="=", data_dir="data"):
+    """
+    Проверяет, может ли условие "<column> <operator> ..." быть
+    обслужено индексом. ID индексирован всегда
+    """
+    if operator == "!=":
+        return False
+    if column == "ID":
+        return operator == "=" \
+            or _is_id_ordered(table_name, table_data, data_dir)
+    loaded = _load(table_name, table_data, data_dir)
+    if loaded is None or column not in loaded["indexes"]:
+        return False
+    return operator == "=" or column in loaded["ordered"]
+
+def lookup_index(table_name, table_data, column, value, operator="=",
+                 data_dir="data"):
+    """
+    Возвращает записи, удовлетворяющие условию "<column> <operator> value",
+    используя индекс. Если подходящего индекса нет, возвращает None.
+    Для равенства value - значение в том виде, в котором оно хранится
+    в записях в памяти (см. core.equality_value), ключ индекса - str
+    от него. Поиск по ID всегда выполняется без полного просмотра
+    """
+    if column == "ID":
+        if operator == "=":
+            record = _find_record(table_name, table_data, value, data_dir)
+            return [record] if record is not None else []
+        if operator == "!=" \
+                or not _is_id_ordered(table_name, table_data, data_dir):
+            return None
+        typed = _typed_condition_value(operator, value, "int")
+        if typed is None:
+            return []
+        start, stop = range_bounds(table_data, operator, typed,
+                                   key=lambda row: row["ID"])
+        return table_data[start:stop]
+
+    loaded = _load(table_name, table_data, data_dir)
+    if loaded is None or column not in loaded["indexes"]:
+        return None
+    entries = loaded["indexes"][column]
+
+    if operator == "=":
+        return _find_records(table_name, table_data,
+                             entries.get(str(value), []), data_dir)
+
+    if column not in loaded["ordered"] or operator == "!=":
+        return None
+    typed = _typed_condition_value(
+        operator, value, loaded["ordered"][column])
+    if typed is None:
+        return []
+    keys = loaded["keys"][column]
+    start, stop = range_bounds(keys, operator, typed, key=lambda key: key[0])
+    record_ids = [record_id for _, raw in keys[start:stop]
+                  for record_id in entries[raw]]
+    return _find_records(table_name, table_data, record_ids, data_dir)
+
+def estimate_index_rows(table_name, table_data, column, value, operator="=",
+                        data_dir="data"):
+    """
+    Оценивает по индексу количество записей, удовлетворяющих
+    условию "<column> <operator> value", не выбирая их: для равенства -
+    среднее число записей на значение индекса, для диапазона
+    по упорядоченному индексу - по доле значений индекса в диапазоне.
+    Если индекса нет, возвращает None
+    """
+    if column == "ID":
+        if operator == "=":
+            return 1
+        if operator == "!=" \
+                or not _is_id_ordered(table_name, table_data, data_dir):
+            return None
+        typed = _typed_condition_value(operator, value, "int")
+        if typed is None:
+            return 0
+        start, stop = range_bounds(table_data, operator, typed,
+                                   key=lambda row: row["ID"])
+        return stop - start
+
+    loaded = _load(table_name, table_data, data_dir)
+    if loaded is None or column not in loaded["indexes"]:
+        return None
+    entries = loaded["indexes"][column]
+    if not entries:
+        return 0
+    if operator == "=":
+        return len(table_data) / len(entries)
+
+    if column not in loaded["ordered"] or operator == "!=":
+        return None
+    typed = _typed_condition_value(
+        operator, value, loaded["ordered"][column])
+    if typed is None:
+        return 0
+    start, stop = range_bounds(loaded["keys"][column], operator, typed,
+                               key=lambda key: key[0])
+    return len(table_data) * (stop - start) / len(entries)
+
+def scan_ordered(table_name, table_data, column, descending=False,
+                 data_dir="data"):
+    """
+    Возвращает генератор записей в порядке значений столбца
+    по упорядоченному индексу или None, если такого индекса нет.
+    Значения, не приводимые к типу столбца, идут последними
+    """
+    if column == "ID":
+        if not _is_id_ordered(table_name, table_data, data_dir):
+            return None
+        return iter(reversed(table_data) if descending else table_data)
+
+    loaded = _load(table_name, table_data, data_dir)
+    if loaded is None or column not in loaded["ordered"]:
+        return None
+    entries = loaded["indexes"][column]
+    keys = loaded["keys"][column]
+    raw_keys = [raw for _, raw in (reversed(keys) if descending else keys)]
+    raw_keys.extend(loaded["unordered"][column])
+
+    def generate():
+        for raw in raw_keys:
+            yield from _find_records(table_name, table_data,
+                                     entries.get(raw, []), data_dir)
+
+    return generate()
+
+def update_indexes(table_name, table_data, old_records=(), new_records=(),
+                   data_dir="data"):
+    """
+    Поддерживает индексы в актуальном состоянии после изменения таблицы:
+    old_records - удаленные записи и прежние версии измененных,
+    new_records - добавленные записи и новые версии измененных.
+    Вызывается после записи файла данных, индексы должны быть загружены
+    до изменения. Для таблиц в формате json индексы сразу сохраняются
+    на диск, для журнальных таблиц - только в памяти (файл индексов
+    перестраивается при следующем запуске или после сжатия журнала).
+    Изменения транзакции в индексах не отражаются
+    """
+    if get_staged_table(table_name, data_dir) is not None:
+        return
+    index_path = get_index_path(table_name, data_dir)
+    loaded = _loaded_indexes.get(index_path)
+    if loaded is None:
+        if not os.path.exists(index_path):
+            return
+        # индексы еще не загружались - загрузка перестроит их по данным
+        _load(table_name, table_data, data_dir)
+        return
+
+    for column, entries in loaded["indexes"].items():
+        column_type = loaded["ordered"].get(column)
+        for record in old_records:
+            raw = str(record.get(column))
+            ids = entries.get(raw)
+            if ids and record["ID"] in ids:
+                ids.remove(record["ID"])
+                if not ids:
+                    del entries[raw]
+                    if column_type is not None:
+                        _remove_sorted_key(loaded, column, raw, column_type)
+        for record in new_records:
+            raw = str(record.get(column))
+            if raw not in entries:
+                entries[raw] = []
+                if column_type is not None:
+                    _add_sorted_key(loaded, column, raw, column_type)
+            entries[raw].append(record["ID"])
+
+    if detect_storage(table_name, data_dir) == "log":
+        loaded["signature"] = get_table_signature(table_name, data_dir)
+    else:
+        loaded["signature"] = _write_index_file(
+            table_name, loaded["indexes"], loaded["ordered"], data_dir)
+
+def _add_sorted_key(loaded, column, raw, column_type):
+    typed = convert_value(raw, column_type)
+    if typed is None:
+        loaded["unordered"][column].append(raw)
+    else:
+        insort(loaded["keys"][column], (typed, raw))
+
+def _remove_sorted_key(loaded, column, raw, column_type):
+    typed = convert_value(raw, column_type)
+    if typed is None:
+        loaded["unordered"][column].remove(raw)
+        return
+    keys = loaded["keys"][column]
+    position = bisect_left(keys, (typed, raw))
+    if position < len(keys) and keys[position] == (typed, raw):
+        del keys[position]
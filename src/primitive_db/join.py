@@ -0,0 +1,129 @@
+import json
+import os
+import tempfile
+
+from src.primitive_db import metrics
+
+# сколько записей строящей стороны hash join хранится в памяти;
+# при превышении обе стороны разбиваются на части на диске
+DEFAULT_JOIN_ROWS = 200_000
+
+# наибольшее количество частей при разбиении на диск
+MAX_PARTITIONS = 256
+
+_state = {"max_rows": int(os.environ.get("PRIMITIVE_DB_JOIN_ROWS",
+                                         DEFAULT_JOIN_ROWS))}
+
+
+def join_key(value):
+    """
+    Ключ соединения: хранимое значение в строковом виде, как при
+    сравнении "=" в условии where (ID 5 и "5" совпадают).
+    Отсутствующее значение ни с чем не соединяется (None)
+    """
+    return None if value is None else str(value)
+
+def keyed(records, column):
+    """
+    Пары (ключ соединения, запись) для записей со значением column
+    """
+    for record in records:
+        key = join_key(record.get(column))
+        if key is not None:
+            yield key, record
+
+def partition_count(build_rows, max_rows):
+    """
+    Количество частей разбиения, при котором часть строящей
+    стороны в среднем занимает половину бюджета памяти
+    """
+    return min(max(2, -(-2 * build_rows // max_rows)), MAX_PARTITIONS)
+
+def hash_join(build, probe, max_rows=None, build_rows=0):
+    """
+    Соединяет пары (ключ, запись): строит хэш-таблицу по build
+    и просматривает probe потоком, выдавая пары (запись build,
+    запись probe) с равными ключами. Если в хэш-таблице оказывается
+    больше max_rows записей, обе стороны разбиваются по хэшу ключа
+    на части во временных файлах и соединяются по частям (grace
+    hash join). build_rows - оценка размера build для числа частей
+    """
+    table = {}
+    stored = 0
+    build = iter(build)
+    for key, record in build:
+        matches = table.get(key)
+        if matches is None:
+            table[key] = [record]
+        else:
+            matches.append(record)
+        stored += 1
+        if max_rows is not None and stored > max_rows:
+            held = ((key, record) for key, records in table.items()
+                    for record in records)
+            yield from spill_join(
+                held, build, probe,
+                partition_count(max(build_rows, stored), max_rows))
+            return
+
+    for key, record in probe:
+        matches = table.get(key)
+        if matches is not None:
+            for match in matches:
+                yield match, record
+
+def write_partitions(pairs, directory, side, partitions):
+    """
+    Раскладывает пары (ключ, запись) по файлам частей
+    (JSON Lines) по хэшу ключа, возвращает пути файлов
+    """
+    paths = [os.path.join(directory, f"{side}{i}.jsonl")
+             for i in range(partitions)]
+    files = [open(path, 'w', encoding='utf-8') for path in paths]
+    written = 0
+    try:
+        for key, record in pairs:
+            files[hash(key) % partitions].write(
+                json.dumps([key, dict(record)], ensure_ascii=False) + "\n")
+            written += 1
+    finally:
+        for f in files:
+            f.close()
+    metrics.count("rows_spilled", written)
+    return paths
+
+def read_partition(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            key, record = json.loads(line)
+            yield key, record
+
+def spill_join(held, build, probe, partitions):
+    """
+    Соединение с разбиением на диск: уже построенная часть
+    хэш-таблицы (held), остаток build и probe раскладываются
+    по частям, затем каждая пара частей соединяется в памяти.
+    Временные файлы удаляются по завершении
+    """
+    with tempfile.TemporaryDirectory(prefix="primitive_db_join_") as directory:
+        def build_pairs():
+            yield from held
+            yield from build
+
+        build_paths = write_partitions(
+            build_pairs(), directory, "build", partitions)
+        probe_paths = write_partitions(probe, directory, "probe", partitions)
+        for build_path, probe_path in zip(build_paths, probe_paths):
+            # часть с перекосом ключей может превысить бюджет:
+            # повторное разбиение по тому же ключу ее бы не уменьшило
+            yield from hash_join(read_partition(build_path),
+                                 read_partition(probe_path))
+
+def get_max_rows():
+    return _state["max_rows"]
+
+def set_max_rows(max_rows):
+    """
+    Меняет бюджет памяти hash join (записей строящей стороны)
+    """
+    _state["max_rows"] = max(1, int(max_rows))
@@ -0,0 +1,90 @@
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+# блокировки, удерживаемые потоками процесса: (поток, путь) -> [дескриптор,
+# исключительная, глубина вложенности]. Повторный захват того же файла
+# в потоке не блокируется, а увеличивает глубину. Каждый поток открывает
+# файл блокировки отдельно, поэтому потоки одного процесса (например,
+# соединения сервера) исключают друг друга так же, как разные процессы
+_held = {}
+_guard = threading.Lock()
+
+
+@contextmanager
+def file_lock(path, exclusive=False):
+    """
+    Блокировка файла path между процессами (fcntl.flock): разделяемая
+    для чтения - ее одновременно держат многие процессы, исключительная
+    для записи - только один. Вложенный захват блокировки, уже
+    удерживаемой потоком, ничего не ждет. Повышение разделяемой
+    блокировки до исключительной не поддерживается (RuntimeError):
+    flock снимает разделяемую блокировку, прежде чем захватить
+    исключительную, и между ними таблицу мог бы изменить другой
+    процесс, а прочитанные под разделяемой блокировкой данные
+    устарели бы незаметно. Операции записи захватывают
+    исключительную блокировку с самого начала
+    """
+    key = (threading.get_ident(), path)
+    with _guard:
+        entry = _held.get(key)
+        if entry is not None:
+            if exclusive and not entry[1]:
+                raise RuntimeError(f"Блокировка {path} удерживается для \
+чтения: блокировку для записи нужно захватывать с самого начала")
+            entry[2] += 1
+    if entry is not None:
+        try:
+            yield
+        finally:
+            with _guard:
+                entry[2] -= 1
+        return
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    except BaseException:
+        os.close(fd)
+        raise
+    with _guard:
+        _held[key] = [fd, exclusive, 1]
+    try:
+        yield
+    finally:
+        with _guard:
+            del _held[key]
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+def table_lock(table_name, exclusive=False, data_dir="data"):
+    """
+    Блокировка таблицы: читатели работают параллельно,
+    запись в таблицу выполняется одним процессом
+    """
+    return file_lock(os.path.join(data_dir, f"{table_name}.lock"), exclusive)
+
+def metadata_lock(filepath="db_meta.json"):
+    """
+    Исключительная блокировка файла метаданных на время
+    чтения-изменения-записи
+    """
+    return file_lock(filepath + ".lock", exclusive=True)
+
+def locked_table(exclusive=False):
+    """
+    Декоратор операции над таблицей: на время вызова захватывает
+    блокировку таблицы, имя которой - второй аргумент (после метаданных)
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(metadata, table_name, *args, **kwargs):
+            with table_lock(table_name, exclusive):
+                return func(metadata, table_name, *args, **kwargs)
+        return wrapper
+    return decorator
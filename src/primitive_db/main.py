@@ -1,10 +1,26 @@
 #!/usr/bin/env python3
+import argparse
+
 from src.primitive_db.engine import run
+from src.primitive_db.server import DEFAULT_HOST, DEFAULT_PORT, serve
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="project")
+    commands = parser.add_subparsers(dest="mode")
+    server = commands.add_parser("serve", help="запустить сервер базы данных")
+    server.add_argument("--host", default=DEFAULT_HOST)
+    server.add_argument("--port", type=int, default=DEFAULT_PORT)
+    return parser.parse_args(argv)
 
 
 def main():
+    args = parse_args()
+    if args.mode == "serve":
+        serve(args.host, args.port)
+        return
     print("DB project is running!")
     run()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,134 @@
+import json
+import math
+import os
+import threading
+from collections import deque
+
+# сколько последних замеров операции хранится для процентилей
+HISTOGRAM_SAMPLES = 4096
+
+# процентили времени выполнения в статистике
+PERCENTILES = (50, 95, 99)
+
+# счетчики: записи, просмотренные при фильтрации, отданные
+# запросом и записанные; записи, выгруженные на диск при hash join;
+# байты, прочитанные из файлов таблиц при промахе кэша и записанные
+# в файлы таблиц и журнал WAL; сбросы журнала WAL на диск (fsync);
+# попадания и промахи кэша таблиц
+COUNTERS = ("rows_scanned", "rows_returned", "rows_written", "rows_spilled",
+            "bytes_read", "bytes_written", "wal_syncs", "cache_hits",
+            "cache_misses")
+
+# сбор метрик включен, если PRIMITIVE_DB_METRICS не "0";
+# переключается командой stats on|off
+_state = {"enabled": os.environ.get("PRIMITIVE_DB_METRICS", "1") != "0"}
+_lock = threading.Lock()
+_counters = dict.fromkeys(COUNTERS, 0)
+_histograms = {}
+# дополнительные источники статистики {имя: функция}, например кэши
+_sources = {}
+
+
+class Histogram:
+    """
+    Время выполнения операции: количество вызовов, сумма и максимум
+    по всем вызовам, процентили - по последним HISTOGRAM_SAMPLES
+    замерам
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=HISTOGRAM_SAMPLES)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.samples.append(seconds)
+
+    def summary(self):
+        """
+        Возвращает словарь со временем в миллисекундах
+        """
+        samples = sorted(self.samples)
+        result = {"count": self.count,
+                  "mean_ms": round(self.total / self.count * 1000, 3)}
+        for percentile in PERCENTILES:
+            # ближайший ранг: наименьшее значение, не меньшее
+            # заданной доли замеров
+            rank = max(math.ceil(percentile / 100 * len(samples)), 1)
+            result[f"p{percentile}_ms"] = round(samples[rank - 1] * 1000, 3)
+        result["max_ms"] = round(self.max * 1000, 3)
+        return result
+
+
+def is_enabled():
+    return _state["enabled"]
+
+def set_enabled(enabled):
+    """
+    Включает или выключает сбор метрик. Выключенный сбор
+    сводится к одной проверке флага на вызов
+    """
+    _state["enabled"] = bool(enabled)
+
+def count(name, value=1):
+    """
+    Увеличивает счетчик name на value
+    """
+    if not _state["enabled"] or not value:
+        return
+    with _lock:
+        _counters[name] += value
+
+def observe(operation, seconds):
+    """
+    Добавляет замер времени выполнения операции
+    """
+    with _lock:
+        histogram = _histograms.get(operation)
+        if histogram is None:
+            histogram = _histograms[operation] = Histogram()
+        histogram.add(seconds)
+
+def register_source(name, stats_func):
+    """
+    Добавляет в статистику результат stats_func() под именем name
+    (вызывается только при запросе статистики)
+    """
+    _sources[name] = stats_func
+
+def reset():
+    """
+    Обнуляет счетчики и замеры времени
+    """
+    with _lock:
+        _counters.update(dict.fromkeys(COUNTERS, 0))
+        _histograms.clear()
+
+def snapshot():
+    """
+    Возвращает статистику: включен ли сбор, время операций,
+    счетчики и статистику зарегистрированных источников
+    """
+    with _lock:
+        operations = {operation: histogram.summary()
+                      for operation, histogram in sorted(_histograms.items())}
+        counters = dict(_counters)
+    return {"enabled": _state["enabled"], "operations": operations,
+            "counters": counters,
+            **{name: stats_func() for name, stats_func in _sources.items()}}
+
+def dump_json(filepath=None):
+    """
+    Возвращает статистику в формате JSON и, если задан
+    filepath, записывает ее в файл
+    """
+    text = json.dumps(snapshot(), ensure_ascii=False, indent=2)
+    if filepath is not None:
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    return text
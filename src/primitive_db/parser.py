@@ -1,22 +1,54 @@
-def parse_where_clause(args):
+import re
+
+from src.primitive_db.aggregate import AGGREGATE_FUNCTIONS
+from src.primitive_db.errors import ValidationError
+
+# операторы сравнения условия where (двухсимвольные идут первыми)
+COMPARISON_OPERATORS = (">=", "<=", "!=", "=", ">", "<")
+
+# лексемы команды: строка в кавычках, оператор сравнения, скобка или
+# запятая, параметр ? и слово (имя, ключевое слово или значение без кавычек)
+TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<string>"[^"]*"|'[^']*')
+      | (?P<op>>=|<=|!=|=|>|<)
+      | (?P<punct>[(),])
+      | (?P<param>\?)
+      | (?P<word>(?:[^\s"'(),=!<>?]|!(?!=))+)
+    )""", re.VERBOSE)
+
+# начало команды insert до значений
+INSERT_PATTERN = re.compile(r"\s*insert\s+\S+\s+\S+\s+values\b", re.IGNORECASE)
+
+# группа значений insert: открывающая скобка, значения в кавычках
+# или без них через запятую, закрывающая скобка
+GROUP_START_PATTERN = re.compile(r"\s*\(")
+GROUP_SEPARATOR_PATTERN = re.compile(r"\s*,")
+VALUE_PATTERN = re.compile(r"""
+    \s*(?:(?P<quoted>"[^"]*"|'[^']*')\s*|(?P<raw>[^,()"']*))(?P<end>[,)])
+    """, re.VERBOSE)
+
+# ключевые слова, на которых заканчивается значение без кавычек
+# из нескольких слов (name = Sergei Ivanov where ...)
+VALUE_TERMINATORS = frozenset(
+    ("and", "or", "where", "group", "order", "limit", "offset", "to", "set"))
+
+# после этих слов идет значение
+VALUE_KEYWORDS = frozenset(("limit", "offset"))
+
+
+def normalize_value(value_str):
     """
-    Парсит условие where из списка аргументов args
-    Возвращает словарь {column: value}
+    Приводит значение из условия к строковому виду,
+    в котором значения хранятся в таблице
     """
-    if not args:
-        return None
-    
-    where_col = args[0]
-    where_condition_value = args[2]
+    value_str = value_str.strip()
 
-    column = where_col.strip()
-    value_str = where_condition_value.strip()
-    
     # убираем кавычки если есть
-    if (value_str.startswith('"') and value_str.endswith('"')) or \
-       (value_str.startswith("'") and value_str.endswith("'")):
-        value = value_str[1:-1]
-    
+    if len(value_str) > 1 and value_str[0] == value_str[-1] \
+            and value_str[0] in ('"', "'"):
+        return value_str[1:-1]
+
     # пытаемся определить тип
     try:
         if '.' in value_str:
@@ -25,76 +57,420 @@ def parse_where_clause(args):
             value = int(value_str)
     except ValueError:
         if value_str.lower() == 'true':
-                value = "True"
+            value = "True"
         elif value_str.lower() == 'false':
             value = "False"
         else:
             value = value_str
-            
-    return {column: str(value)}
 
-def parse_set_clause(args):
+    return str(value)
+
+def tokenize(text):
     """
-    Парсит условие set из списка аргументов args"
-    Возвращает словарь {column: value}
+    Разбивает команду на лексемы (вид, значение).
+    У строки в кавычках значение - текст без кавычек
     """
-    if not args:
-        return None
+    tokens = []
+    text = text.rstrip()
+    position = 0
+    while position < len(text):
+        match = TOKEN_PATTERN.match(text, position)
+        if match is None:
+            rest = text[position:].lstrip()
+            if rest[0] in ('"', "'"):
+                raise ValidationError("Незакрытая кавычка в команде")
+            raise ValidationError(f"Неожиданный символ '{rest[0]}' в команде")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "string":
+            value = value[1:-1]
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
 
-    set_col = args[3]
-    set_condition_value = args[5]
-    
-    set_clause = {}
-        
-    column = set_col.strip()
-    value_str = set_condition_value.strip()
-        
-    # убираем лишние кавычки если есть
-    if (value_str.startswith('"') and value_str.endswith('"')) or \
-        (value_str.startswith("'") and value_str.endswith("'")):
-        value = value_str[1:-1]
-    else:
-        # пытаемся определить тип
-        try:
-            if '.' in value_str:
-                value = float(value_str)
+def extract_literals(tokens):
+    """
+    Заменяет значения (литералы) команды параметрами. Возвращает
+    шаблон - лексемы (вид, значение), где значение параметра - его
+    номер, - и список значений параметров (текст, в кавычках ли).
+    Значения - строки в кавычках и слова после оператора сравнения,
+    between/and и limit/offset. В условии соединения on после
+    оператора сравнения идет столбец, а не значение.
+    Параметр ? в тексте команды значения не получает (None)
+    """
+    template = []
+    params = []
+    expect_value = False
+    in_between = False
+    in_join_on = False
+    i = 0
+    while i < len(tokens):
+        kind, value = tokens[i]
+        if kind == "string" or (kind == "word" and expect_value):
+            j = i + 1
+            if kind == "string":
+                params.append((value, True))
             else:
-                value = int(value_str)
-        except ValueError:
-            if value_str.lower() == 'true':
-                value = "True"
-            elif value_str.lower() == 'false':
-                value = "False"
+                # значение без кавычек может состоять из нескольких слов
+                while j < len(tokens) and tokens[j][0] == "word" \
+                        and tokens[j][1].lower() not in VALUE_TERMINATORS:
+                    j += 1
+                params.append((" ".join(token[1] for token in tokens[i:j]),
+                               False))
+            template.append(("param", len(params) - 1))
+            expect_value = False
+            i = j
+            continue
+
+        if kind == "param":
+            params.append(None)
+            template.append(("param", len(params) - 1))
+            expect_value = False
+        elif kind == "op":
+            template.append((kind, value))
+            expect_value = not in_join_on
+            in_join_on = False
+        else:
+            template.append((kind, value))
+            word = value.lower()
+            if word == "between":
+                expect_value = in_between = True
+            elif word == "and" and in_between:
+                expect_value = True
+                in_between = False
+            elif word in VALUE_KEYWORDS:
+                expect_value = True
+            elif word == "on":
+                in_join_on = True
+        i += 1
+    return template, params
+
+def split_values(text):
+    """
+    Для команды insert возвращает позицию начала значений
+    (после values), для остальных команд - None
+    """
+    match = INSERT_PATTERN.match(text)
+    return match.end() if match else None
+
+def scan_values(text, position=0):
+    """
+    Разбирает группы значений "(значение1, значение2), (...)" начиная
+    с позиции position. Запятые и скобки внутри кавычек считаются частью
+    значения. Возвращает список записей - списков значений (текст,
+    в кавычках ли); параметр ? без кавычек значения не получает (None)
+    """
+    rows = []
+    while True:
+        match = GROUP_START_PATTERN.match(text, position)
+        if match is None:
+            rest = text[position:].strip()
+            if not rest and rows:
+                return rows
+            if not rest:
+                raise ValidationError("Не переданы значения")
+            raise ValidationError(
+                f"Неожиданный символ '{rest[0]}' между группами значений")
+        position = match.end()
+        row = []
+        while True:
+            match = VALUE_PATTERN.match(text, position)
+            if match is None:
+                raise ValidationError("Незакрытая кавычка или скобка в значениях")
+            quoted = match.group("quoted")
+            if quoted is not None:
+                row.append((quoted[1:-1], True))
             else:
-                value = value_str
-    
-    set_clause[column] = str(value)
-    
-    return set_clause
-
-def parse_values(values_str):
-    """
-    Парсит значения в формате "("значение1", "значение2", ...)"
-    Возвращает список значений
-    """
-    if values_str[0] != "(" or values_str[-1] != ")":
-        print(
-'Неправильный формат переданных значений. ' \
-'Правильный формат:')
-        print(
-'<command> insert into <имя_таблицы>' \
-' values (<значение1>, <значение2>, ...)')
+                value = match.group("raw").strip()
+                row.append(None if value == "?" else (value, False))
+            position = match.end()
+            if match.group("end") == ")":
+                break
+        rows.append(row)
+        match = GROUP_SEPARATOR_PATTERN.match(text, position)
+        if match is not None:
+            position = match.end()
+
+def statement_key(template):
+    """
+    Нормализованный текст команды: значения заменены на ?
+    """
+    return " ".join("?" if kind == "param" else value
+                    for kind, value in template)
+
+
+class TokenStream:
+    """
+    Последовательный разбор шаблона команды
+    """
+
+    def __init__(self, template, statement):
+        self.template = template
+        self.statement = statement
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.template):
+            return self.template[self.position]
+        return (None, None)
+
+    def at_word(self, *words):
+        kind, value = self.peek()
+        return kind == "word" and value.lower() in words
+
+    def next(self):
+        token = self.peek()
+        if token[0] is None:
+            raise self.error("команда оборвана")
+        self.position += 1
+        return token
+
+    def expect_word(self, *words):
+        kind, value = self.next()
+        if kind != "word" or value.lower() not in words:
+            raise self.error(f"ожидается {' или '.join(words)}")
+        return value.lower()
+
+    def name(self, what):
+        kind, value = self.next()
+        if kind != "word":
+            raise self.error(f"ожидается {what}")
+        return value
+
+    def value(self):
+        kind, value = self.next()
+        if kind != "param":
+            raise self.error("ожидается значение")
+        return value
+
+    def done(self):
+        return self.position >= len(self.template)
+
+    def finish(self):
+        if not self.done():
+            kind, value = self.peek()
+            raise self.error(f"лишнее '{'?' if kind == 'param' else value}'")
+
+    def error(self, message):
+        return ValidationError(
+            f"Неверный формат команды {self.statement}: {message}")
+
+
+def parse_condition(stream):
+    """
+    Условие "<столбец> <оператор> <значение>"
+    или "<столбец> between <значение> and <значение>"
+    """
+    column = stream.name("столбец условия")
+    if stream.at_word("between"):
+        stream.next()
+        low = stream.value()
+        stream.expect_word("and")
+        return {"column": column, "operator": "between",
+                "value": (low, stream.value())}
+    kind, operator = stream.next()
+    if kind != "op":
+        raise stream.error(
+            f"ожидается оператор {', '.join(COMPARISON_OPERATORS)} или between")
+    return {"column": column, "operator": operator, "value": stream.value()}
+
+def parse_term(stream):
+    """
+    Условие или выражение в скобках. Возвращает список
+    условий, соединенных and
+    """
+    if stream.peek() != ("punct", "("):
+        return [parse_condition(stream)]
+    stream.next()
+    conditions = parse_where(stream)
+    if stream.next() != ("punct", ")"):
+        raise stream.error("ожидается )")
+    return conditions
+
+def parse_conjunction(stream):
+    """
+    Условия, соединенные and
+    """
+    conditions = parse_term(stream)
+    while stream.at_word("and"):
+        stream.next()
+        conditions += parse_term(stream)
+    return conditions
+
+def parse_where(stream):
+    """
+    Условие после where: условия, соединенные and и or (and связывает
+    сильнее or), с группировкой скобками. Возвращает список условий,
+    соединенных and; условия, соединенные or, - группа
+    {"or": [список условий, ...]} в этом списке
+    """
+    branches = []
+    while True:
+        conditions = parse_conjunction(stream)
+        if len(conditions) == 1 and "or" in conditions[0]:
+            # (a or b) or c - одна группа из трех вариантов
+            branches += conditions[0]["or"]
+        else:
+            branches.append(conditions)
+        if not stream.at_word("or"):
+            break
+        stream.next()
+    return branches[0] if len(branches) == 1 else [{"or": branches}]
+
+def parse_select_item(stream):
+    """
+    Столбец или агрегат "<функция>(<столбец>|*)" - пара (функция, столбец)
+    """
+    column = stream.name("столбец")
+    if stream.peek() != ("punct", "("):
+        return column
+    function = column.lower()
+    if function not in AGGREGATE_FUNCTIONS:
+        raise stream.error(f"неизвестная функция {column}, допустимые: \
+{', '.join(AGGREGATE_FUNCTIONS)}")
+    stream.next()
+    column = stream.name("столбец или *")
+    if stream.next() != ("punct", ")"):
+        raise stream.error("ожидается )")
+    return (function, column)
+
+def parse_names(stream, parse_item):
+    """
+    Элементы через запятую
+    """
+    items = [parse_item(stream)]
+    while stream.peek() == ("punct", ","):
+        stream.next()
+        items.append(parse_item(stream))
+    return items
+
+def parse_columns(stream):
+    """
+    Список столбцов и агрегатов select через запятую;
+    * - все столбцы (None)
+    """
+    if stream.peek() == ("word", "*"):
+        stream.next()
         return None
-    
-    # убираем скобки
-    values_str = values_str[1:-1].strip()
-    
-    # простой split по запятым
-    values = []
-    parts = values_str.split(',')
-    
-    for part in parts:
-        part = part.strip()   
-        values.append(part)
-    
-    return values
\ No newline at end of file
+    return parse_names(stream, parse_select_item)
+
+def parse_join(stream):
+    """
+    Соединение "[inner] join <таблица> on <столбец> = <столбец>",
+    столбцы - с таблицей через точку (users.ID) или без нее
+    """
+    if stream.at_word("inner"):
+        stream.next()
+    stream.expect_word("join")
+    table = stream.name("имя таблицы соединения")
+    stream.expect_word("on")
+    left = stream.name("столбец соединения")
+    if stream.next() != ("op", "="):
+        raise stream.error("ожидается on <столбец> = <столбец>")
+    return {"table": table, "on": (left, stream.name("столбец соединения"))}
+
+def parse_select(stream):
+    # select [<столбец>|<функция>(<столбец>|*), ... | *] from <таблица>
+    # [[inner] join <таблица> on <столбец> = <столбец>] [where ...]
+    # [group by <столбец>, ...] [order by <столбец> [asc|desc]]
+    # [limit <n>] [offset <m>]
+    columns = None if stream.at_word("from") else parse_columns(stream)
+    stream.expect_word("from")
+    node = {"type": "select", "table": stream.name("имя таблицы"),
+            "columns": columns, "join": None, "where": None, "group_by": None,
+            "order_by": None, "limit": None, "offset": None}
+    if stream.at_word("inner", "join"):
+        node["join"] = parse_join(stream)
+    if stream.at_word("where"):
+        stream.next()
+        node["where"] = parse_where(stream)
+    if stream.at_word("group"):
+        stream.next()
+        stream.expect_word("by")
+        node["group_by"] = parse_names(
+            stream, lambda stream: stream.name("столбец группировки"))
+    if stream.at_word("order"):
+        stream.next()
+        stream.expect_word("by")
+        column = parse_select_item(stream)
+        descending = False
+        if stream.at_word("asc", "desc"):
+            descending = stream.next()[1].lower() == "desc"
+        node["order_by"] = (column, descending)
+    if stream.at_word("limit"):
+        stream.next()
+        node["limit"] = stream.value()
+    if stream.at_word("offset"):
+        stream.next()
+        node["offset"] = stream.value()
+    return node
+
+def parse_insert(stream):
+    # insert into <таблица> values ... - значения разбирает scan_values
+    stream.expect_word("into")
+    node = {"type": "insert", "table": stream.name("имя таблицы")}
+    stream.expect_word("values")
+    return node
+
+def parse_update(stream):
+    # update <таблица> set <столбец> = <значение>[, ...] where <условие>
+    node = {"type": "update", "table": stream.name("имя таблицы"), "set": []}
+    stream.expect_word("set")
+    while True:
+        column = stream.name("столбец")
+        if stream.next() != ("op", "="):
+            raise stream.error("ожидается <столбец> = <значение>")
+        node["set"].append((column, stream.value()))
+        if stream.peek() != ("punct", ","):
+            break
+        stream.next()
+    stream.expect_word("where")
+    node["where"] = parse_where(stream)
+    return node
+
+def parse_delete(stream):
+    # delete from <таблица> where <условие>
+    stream.expect_word("from")
+    node = {"type": "delete", "table": stream.name("имя таблицы")}
+    stream.expect_word("where")
+    node["where"] = parse_where(stream)
+    return node
+
+def parse_export(stream):
+    # export <таблица> [where <условие>] to <файл>
+    node = {"type": "export", "table": stream.name("имя таблицы"),
+            "where": None}
+    if stream.at_word("where"):
+        stream.next()
+        node["where"] = parse_where(stream)
+    stream.expect_word("to")
+    # имя файла с пробелами передается в кавычках (параметром)
+    kind, value = stream.next()
+    if kind not in ("word", "param"):
+        raise stream.error("ожидается имя файла")
+    node["file"] = value
+    return node
+
+STATEMENT_PARSERS = {
+    "select": parse_select,
+    "insert": parse_insert,
+    "update": parse_update,
+    "delete": parse_delete,
+    "export": parse_export,
+}
+
+def parse_statement(template):
+    """
+    Строит дерево разбора (AST) команды по ее шаблону.
+    Значения в дереве - номера параметров (int) или
+    постоянные строки (пустое значение в values)
+    """
+    stream = TokenStream(template, template[0][1] if template else "")
+    kind, statement = stream.next()
+    parse = STATEMENT_PARSERS.get(statement.lower()) if kind == "word" else None
+    if parse is None:
+        raise ValidationError(f'Функции "{statement}" нет.')
+    stream.statement = statement.lower()
+    node = parse(stream)
+    stream.finish()
+    return node
@@ -0,0 +1,254 @@
+from src.decorators import create_cacher
+from src.primitive_db import metrics
+from src.primitive_db.aggregate import aggregate_label
+from src.primitive_db.errors import ValidationError
+from src.primitive_db.parser import (
+    STATEMENT_PARSERS,
+    extract_literals,
+    normalize_value,
+    parse_statement,
+    scan_values,
+    split_values,
+    statement_key,
+    tokenize,
+)
+
+# сколько планов команд хранится в кэше
+PLAN_CACHE_SIZE = 256
+
+# команды, выполняемые через план (остальные разбираются в engine)
+STATEMENT_TYPES = tuple(STATEMENT_PARSERS)
+
+plan_cacher = create_cacher(max_size=PLAN_CACHE_SIZE)
+metrics.register_source("plan_cache", plan_cacher.stats)
+
+
+def condition_value(param):
+    """
+    Значение условия или set: без кавычек приводится к
+    строковому виду, в котором значения хранятся в таблице
+    """
+    text, quoted = param
+    return text if quoted else normalize_value(text)
+
+def file_value(param):
+    """
+    Имя файла - как записано
+    """
+    return param[0]
+
+def limit_value(param):
+    text, quoted = param
+    if quoted or not text.isdigit():
+        raise ValidationError("Ожидается limit <число>")
+    return int(text)
+
+def offset_value(param):
+    text, quoted = param
+    if quoted or not text.isdigit():
+        raise ValidationError("Ожидается offset <число>")
+    return int(text)
+
+
+class Plan:
+    """
+    Исполняемый план команды: вид команды, таблица, столбцы, на которые
+    ссылается команда, и функция bind, которая приводит значения
+    параметров и собирает из них запрос для функций core. Параметры
+    insert - записи (списки значений), остальных команд - плоский
+    список значений
+    """
+
+    def __init__(self, kind, table, bind, columns=()):
+        self.kind = kind
+        self.table = table
+        self.bind = bind
+        self.columns = columns
+
+
+def bind_params(converters, build):
+    """
+    Функция bind для плоского списка параметров: каждый параметр
+    приводится своим способом, затем собирается запрос
+    """
+    def bind(params):
+        if len(params) != len(converters):
+            raise ValidationError(f"Ожидается значений параметров: \
+{len(converters)}, передано: {len(params)}")
+        values = []
+        for convert, param in zip(converters, params):
+            if param is None:
+                raise ValidationError("Не задано значение параметра ?")
+            values.append(convert(param))
+        return build(values)
+    return bind
+
+def resolve(ref, values):
+    """
+    Значение из дерева разбора: номер параметра или постоянная строка
+    """
+    return values[ref] if ref.__class__ is int else ref
+
+def bind_condition(condition, values):
+    """
+    Условие (column, operator, value) или группа
+    {"or": [список условий, ...]} со значениями параметров
+    """
+    if "or" in condition:
+        return {"or": [bind_where(branch, values)
+                       for branch in condition["or"]]}
+    if condition["operator"] == "between":
+        return (condition["column"], "between",
+                tuple(values[ref] for ref in condition["value"]))
+    return (condition["column"], condition["operator"],
+            values[condition["value"]])
+
+def bind_where(conditions, values):
+    if conditions is None:
+        return None
+    return [bind_condition(condition, values) for condition in conditions]
+
+def item_label(item):
+    """
+    Название столбца результата: имя столбца или агрегата
+    """
+    return aggregate_label(*item) if isinstance(item, tuple) else item
+
+def plan_select(node, converters):
+    table, where, order_by, limit, offset = (
+        node["table"], node["where"], node["order_by"], node["limit"],
+        node["offset"])
+    items, group_by, join = node["columns"], node["group_by"], node["join"]
+    if limit is not None:
+        converters[limit] = limit_value
+    if offset is not None:
+        converters[offset] = offset_value
+
+    # запрос с агрегатами или group by: aggregates - список пар
+    # (функция, столбец), columns - названия столбцов результата
+    aggregates = None
+    if group_by is not None \
+            or any(isinstance(item, tuple) for item in items or ()):
+        if items is None:
+            raise ValidationError(
+                "Для group by нужно перечислить столбцы и агрегаты select")
+        if join is not None:
+            raise ValidationError(
+                "Агрегаты и group by для соединения таблиц не поддерживаются")
+        aggregates = [item for item in items or () if isinstance(item, tuple)]
+        group_by = group_by or []
+    columns = None if items is None else [item_label(item) for item in items]
+    if order_by is not None:
+        order_by = (item_label(order_by[0]), order_by[1])
+
+    def build(values):
+        return {"table": table, "columns": columns, "join": join,
+                "aggregates": aggregates, "group_by": group_by,
+                "where": bind_where(where, values),
+                "order_by": order_by,
+                "limit": None if limit is None else values[limit],
+                "offset": None if offset is None else values[offset]}
+    return build
+
+def bind_rows(table):
+    """
+    Функция bind для insert: значения записей берутся как записаны
+    """
+    def bind(rows):
+        try:
+            return {"table": table,
+                    "rows": [[text for text, _ in row] for row in rows]}
+        except TypeError:
+            raise ValidationError("Не задано значение параметра ?")
+    return bind
+
+def plan_update(node, converters):
+    table, assignments, where = node["table"], node["set"], node["where"]
+
+    def build(values):
+        return {"table": table,
+                "set": {column: values[ref] for column, ref in assignments},
+                "where": bind_where(where, values)}
+    return build
+
+def plan_delete(node, converters):
+    table, where = node["table"], node["where"]
+
+    def build(values):
+        return {"table": table, "where": bind_where(where, values)}
+    return build
+
+def plan_export(node, converters):
+    table, where, file = node["table"], node["where"], node["file"]
+    if file.__class__ is int:
+        converters[file] = file_value
+
+    def build(values):
+        return {"table": table, "where": bind_where(where, values),
+                "file": resolve(file, values)}
+    return build
+
+PLANNERS = {
+    "select": plan_select,
+    "update": plan_update,
+    "delete": plan_delete,
+    "export": plan_export,
+}
+
+def condition_columns(conditions):
+    """
+    Столбцы условий where, включая условия групп or
+    """
+    for condition in conditions:
+        if "or" in condition:
+            for branch in condition["or"]:
+                yield from condition_columns(branch)
+        else:
+            yield condition["column"]
+
+def statement_columns(node):
+    """
+    Столбцы, на которые ссылается команда (столбцы select,
+    условия, set, order by). Столбцы соединения двух таблиц
+    проверяются при его выполнении (см. core.resolve_join)
+    """
+    if node.get("join") is not None:
+        return ()
+    items = list(node.get("columns") or ())
+    items += node.get("group_by") or ()
+    if node.get("order_by"):
+        items.append(node["order_by"][0])
+    # у агрегата - его столбец (count(*) столбца не требует)
+    columns = [item[1] if isinstance(item, tuple) else item for item in items]
+    columns += condition_columns(node.get("where") or ())
+    columns += [column for column, _ in node.get("set", ())]
+    return tuple(column for column in dict.fromkeys(columns) if column != "*")
+
+def plan_statement(node, param_count):
+    """
+    Строит план по дереву разбора команды
+    """
+    if node["type"] == "insert":
+        return Plan("insert", node["table"], bind_rows(node["table"]))
+    converters = [condition_value] * param_count
+    build = PLANNERS[node["type"]](node, converters)
+    return Plan(node["type"], node["table"], bind_params(converters, build),
+                statement_columns(node))
+
+def compile_statement(text):
+    """
+    Возвращает план команды и значения ее параметров. Значения
+    команды заменяются параметрами, поэтому повторные команды,
+    отличающиеся только значениями, берут готовый план из кэша
+    без разбора и планирования. Значения insert разбираются
+    отдельно и в ключ плана не входят
+    """
+    values_start = split_values(text)
+    head = text if values_start is None else text[:values_start]
+    template, params = extract_literals(tokenize(head))
+    if values_start is not None:
+        params = scan_values(text, values_start)
+    plan = plan_cacher(
+        statement_key(template),
+        lambda: plan_statement(parse_statement(template), len(params)))
+    return plan, params
@@ -0,0 +1,167 @@
+from src.primitive_db.errors import (
+    ColumnNotFoundError,
+    TableNotFoundError,
+    ValidationError,
+)
+from src.primitive_db.planner import compile_statement
+from src.primitive_db.utils import get_column_types
+
+
+def to_param(value):
+    """
+    Приводит значение параметра к виду (текст, в кавычках ли).
+    Значения из Python подставляются как есть, как строки в кавычках:
+    5 -> "5", True -> "True". Пара (текст, в кавычках ли) - значение,
+    уже разобранное из текста команды execute
+    """
+    if isinstance(value, tuple):
+        return value
+    if value is None:
+        raise ValidationError("Значение параметра не может быть None")
+    return (str(value), True)
+
+def validate_plan(metadata, plan, params):
+    """
+    Проверяет команду по схеме таблицы: таблица существует,
+    столбцы условий, set и order by есть в таблице, у записей
+    insert столько значений, сколько столбцов без ID
+    """
+    if plan.table not in metadata:
+        raise TableNotFoundError(f"Таблица '{plan.table}' не существует")
+    column_types = get_column_types(metadata, plan.table)
+    for column in plan.columns:
+        if column not in column_types:
+            raise ColumnNotFoundError(
+                f"В таблице '{plan.table}' отсутствует столбец '{column}'")
+    if plan.kind == "insert":
+        expected = len(column_types) - 1
+        for row in params:
+            if len(row) != expected:
+                raise ValidationError(f"Ожидается значений в записи: {expected}, \
+передано: {len(row)}")
+
+
+def run_select(db, query, force=None):
+    if query["aggregates"] is not None:
+        return db.aggregate(query["table"], query["aggregates"],
+                            query["group_by"], query["where"],
+                            query["order_by"], query["limit"],
+                            query["offset"], query["columns"])
+    if query.get("join") is not None:
+        join = query["join"]
+        return db.join(query["table"], join["table"], join["on"],
+                       query["where"], query["order_by"], query["limit"],
+                       query["offset"], query["columns"])
+    return db.select(query["table"], query["where"], query["order_by"],
+                     query["limit"], query["offset"], query["columns"])
+
+def run_insert(db, query, force=None):
+    if len(query["rows"]) == 1:
+        return db.insert(query["table"], query["rows"][0])
+    return db.insert_many(query["table"], query["rows"])
+
+def run_update(db, query, force=None):
+    return db.update(query["table"], query["set"], query["where"])
+
+def run_delete(db, query, force=None):
+    return db.delete(query["table"], query["where"], force)
+
+def run_export(db, query, force=None):
+    return db.export_table(query["table"], query["file"], query["where"])
+
+# выполнение запроса методами Database по виду команды
+QUERY_RUNNERS = {
+    "select": run_select,
+    "insert": run_insert,
+    "update": run_update,
+    "delete": run_delete,
+    "export": run_export,
+}
+
+
+class PreparedStatement:
+    """
+    Подготовленная команда с параметрами ?:
+
+        stmt = db.prepare("select from users where age > ?")
+        stmt.execute((30,))
+        stmt = db.prepare("insert into users values (?, ?)")
+        stmt.executemany([("Sergei", 28), ("Anna", 31)])
+
+    Команда разбирается, планируется и проверяется по схеме
+    таблицы один раз, при выполнении подставляются только значения
+    """
+
+    def __init__(self, statement, db):
+        self.statement = statement
+        self.db = db
+        self.plan, self._params = compile_statement(statement)
+        validate_plan(db.metadata, self.plan, self._params)
+        # позиции параметров ? в списке параметров (у insert - в записях)
+        if self.plan.kind == "insert":
+            self._slots = [(i, j) for i, row in enumerate(self._params)
+                           for j, param in enumerate(row) if param is None]
+        else:
+            self._slots = [i for i, param in enumerate(self._params)
+                           if param is None]
+
+    @property
+    def kind(self):
+        return self.plan.kind
+
+    @property
+    def param_count(self):
+        return len(self._slots)
+
+    def bind(self, values=()):
+        """
+        Подставляет значения параметров и возвращает запрос
+        для функций core
+        """
+        values = list(values)
+        if len(values) != len(self._slots):
+            raise ValidationError(f"Ожидается значений параметров: \
+{len(self._slots)}, передано: {len(values)}")
+        if self.plan.kind == "insert":
+            params = [list(row) for row in self._params]
+            for (i, j), value in zip(self._slots, values):
+                params[i][j] = to_param(value)
+        else:
+            params = list(self._params)
+            for i, value in zip(self._slots, values):
+                params[i] = to_param(value)
+        return self.plan.bind(params)
+
+    def execute(self, values=(), force=None):
+        """
+        Выполняет команду с одним набором значений и возвращает
+        результат метода Database (записи select, ID вставки и т.д.)
+        """
+        query = self.bind(values)
+        return QUERY_RUNNERS[self.plan.kind](self.db, query, force)
+
+    def executemany(self, rows, force=None):
+        """
+        Выполняет команду для каждого набора значений rows одним
+        пакетом: insert - одной пакетной вставкой, update и delete -
+        в одной транзакции (все или ничего, удаление подтверждается
+        один раз), select и export - по очереди. Возвращает результат
+        пакета (для insert) или список результатов
+        """
+        db = self.db
+        queries = [self.bind(values) for values in rows]
+        if not queries:
+            return None if self.plan.kind == "insert" else []
+        if self.plan.kind == "insert":
+            batch = [row for query in queries for row in query["rows"]]
+            return db.insert_many(self.plan.table, batch)
+
+        run = QUERY_RUNNERS[self.plan.kind]
+        if self.plan.kind == "delete":
+            # удаление подтверждается один раз для всего пакета
+            db.confirm("Удаление значений", force)
+            force = True
+        if self.plan.kind not in ("update", "delete") or db.in_transaction():
+            return [run(db, query, force) for query in queries]
+        with db.transaction():
+            return [run(db, query, force) for query in queries]
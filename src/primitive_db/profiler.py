@@ -0,0 +1,93 @@
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from time import perf_counter
+
+# этапы выполнения запроса в порядке вывода: разбор и планирование,
+# загрузка таблицы, фильтрация, сортировка, подготовка строк вывода,
+# вывод таблицы, сохранение изменений
+STAGES = ("plan", "load", "filter", "sort", "project", "render", "save")
+
+# профиль выполняемого запроса (команда profile),
+# None - запрос не профилируется
+_profile = ContextVar("profile", default=None)
+
+# этап без профилирования ничего не замеряет
+_NO_STAGE = nullcontext()
+
+
+class QueryProfile:
+    """
+    Профиль запроса: описание плана (см. Database.explain),
+    фактическое количество записей и время этапов выполнения.
+    Время этапа не включает время вложенных в него этапов
+    """
+
+    def __init__(self, plan=None):
+        self.plan = plan or {}
+        self.actual_rows = None
+        self.stages = {}
+        self._running = []
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def total(self):
+        return sum(self.stages.values())
+
+    def as_dict(self):
+        """
+        Возвращает профиль словарем со временем этапов в миллисекундах
+        """
+        return {**self.plan, "actual_rows": self.actual_rows,
+                "stages_ms": {name: round(seconds * 1000, 3)
+                              for name, seconds in self.stages.items()},
+                "total_ms": round(self.total() * 1000, 3)}
+
+
+class _Stage:
+    """
+    Замер одного этапа: время вложенных этапов
+    вычитается из времени объемлющего
+    """
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+        self.nested = 0.0
+
+    def __enter__(self):
+        self.profile._running.append(self)
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = perf_counter() - self.start
+        running = self.profile._running
+        running.pop()
+        if running:
+            running[-1].nested += elapsed
+        self.profile.add(self.name, elapsed - self.nested)
+
+
+@contextmanager
+def profiling(profile=None):
+    """
+    Профилирует запросы внутри блока. Возвращает профиль
+    (новый или переданный, чтобы дополнить его этапами)
+    """
+    profile = profile or QueryProfile()
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+
+def stage(name):
+    """
+    Контекст замера этапа name текущего запроса. Если запрос
+    не профилируется, замер не выполняется
+    """
+    profile = _profile.get()
+    if profile is None:
+        return _NO_STAGE
+    return _Stage(profile, name)
@@ -0,0 +1,205 @@
+from collections.abc import Mapping
+from itertools import repeat
+from operator import itemgetter
+
+# хранимые строки логических значений
+BOOL_VALUES = {"True": True, "False": False}
+
+# классы строк по схемам таблиц: {((столбец, тип), ...): класс}
+_row_types = {}
+
+
+class Row(tuple):
+    """
+    Запись таблицы в памяти: значения столбцов в порядке схемы
+    таблицы в кортеже, без словаря на каждую запись. Доступ к
+    значениям - как у словаря {столбец: значение} (row["age"],
+    row.get("age"), items()), запись неизменяема. Значения int и bool
+    хранятся в своих типах (см. native_value). Классы строк
+    создаются для схемы таблицы функцией row_type
+    """
+    __slots__ = ()
+    _columns = ()
+    _positions = {}
+    # позиции столбцов int и bool, кроме ID: их значения хранятся строками
+    _stored = ()
+
+    def __getitem__(self, column):
+        return tuple.__getitem__(self, self._positions[column])
+
+    def get(self, column, default=None):
+        position = self._positions.get(column)
+        if position is None:
+            return default
+        return tuple.__getitem__(self, position)
+
+    def __contains__(self, column):
+        return column in self._positions
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def keys(self):
+        return self._columns
+
+    def values(self):
+        return tuple.__iter__(self)
+
+    def items(self):
+        return zip(self._columns, tuple.__iter__(self))
+
+    def copy(self):
+        """
+        Возвращает изменяемую копию записи - словарь
+        """
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, Row):
+            return self._columns == other._columns \
+                and tuple.__eq__(self, other)
+        if isinstance(other, Mapping):
+            return self.copy() == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+Mapping.register(Row)
+
+
+def column_values(records, column, *default):
+    """
+    Возвращает список значений столбца записей. У строк одной схемы
+    значение берется по позиции столбца в кортеже, без вызова
+    методов записи на Python. Если у какой-то записи нет столбца,
+    берется default, а без него выбрасывается KeyError
+    """
+    if records and isinstance(records[0], Row):
+        position = records[0]._positions.get(column)
+        if position is not None:
+            try:
+                return list(map(tuple.__getitem__, records, repeat(position)))
+            except TypeError:
+                # среди строк есть записи-словари (см. row_factory)
+                pass
+    if default:
+        return [record.get(column, default[0]) for record in records]
+    return list(map(itemgetter(column), records))
+
+def native_value(value, column_type):
+    """
+    Приводит хранимое значение к значению в памяти: строку столбца
+    int - к int, столбца bool - к bool, если строка - точная запись
+    значения ("42", "True"). Остальные значения (и значения столбцов
+    str) не меняются, поэтому сравнение на равенство дает тот же
+    результат, что и сравнение хранимых строк, а stored_value
+    восстанавливает хранимую строку
+    """
+    if value.__class__ is not str:
+        return value
+    if column_type == "int":
+        try:
+            number = int(value)
+        except ValueError:
+            return value
+        return number if str(number) == value else value
+    if column_type == "bool":
+        return BOOL_VALUES.get(value, value)
+    return value
+
+def stored_value(value):
+    """
+    Значение в том виде, в котором оно хранится в файле таблицы:
+    int и bool - строкой
+    """
+    if value.__class__ is int or value.__class__ is bool:
+        return str(value)
+    return value
+
+def stored_record(record):
+    """
+    Запись-словарь для записи в файл: значения int и bool
+    (кроме ID) - строками, как их хранит таблица
+    """
+    if isinstance(record, Row):
+        values = list(tuple.__iter__(record))
+        for position in record._stored:
+            value = values[position]
+            if value.__class__ is int or value.__class__ is bool:
+                values[position] = str(value)
+        return dict(zip(record._columns, values))
+    return {column: value if column == "ID" else stored_value(value)
+            for column, value in record.items()}
+
+def row_type(column_types):
+    """
+    Возвращает класс строк для схемы {столбец: тип}.
+    Класс создается один раз на схему
+    """
+    schema = tuple(column_types.items())
+    row_class = _row_types.get(schema)
+    if row_class is None:
+        columns = tuple(column_types)
+        row_class = _row_types[schema] = type("Row", (Row,), {
+            "__slots__": (), "_columns": columns,
+            "_positions": {column: i for i, column in enumerate(columns)},
+            "_stored": tuple(position for position, (column, column_type)
+                             in enumerate(column_types.items())
+                             if column != "ID"
+                             and column_type in ("int", "bool"))})
+    return row_class
+
+def row_factory(column_types):
+    """
+    Строит функцию приведения записи-словаря к строке схемы
+    {столбец: тип} со значениями в типах столбцов. Строки этой
+    схемы возвращаются как есть. Запись с другим набором столбцов
+    (файл таблицы правили вручную) остается словарем, значения
+    которого тоже приводятся к типам столбцов
+    """
+    row_class = row_type(column_types)
+    columns = row_class._columns
+    typed = [(position, column_type) for position, column_type
+             in enumerate(column_types.values())
+             if column_type in ("int", "bool")]
+    # значения всех столбцов записи одним вызовом (кортежем)
+    get_values = itemgetter(*columns) if len(columns) > 1 \
+        else lambda record: (record[columns[0]],)
+
+    def make_row(record):
+        if record.__class__ is row_class:
+            return record
+        try:
+            values = get_values(record)
+        except KeyError:
+            values = None
+        if values is None or len(record) != len(columns):
+            return {column: native_value(value, column_types.get(column))
+                    for column, value in record.items()}
+        if typed:
+            values = list(values)
+            for position, column_type in typed:
+                values[position] = native_value(values[position], column_type)
+        return row_class(values)
+    return make_row
+
+def convert_records(records, column_types):
+    """
+    Заменяет записи списка records строками схемы column_types
+    на месте (см. row_factory) и возвращает список. Без схемы
+    (таблицы нет в метаданных) записи не меняются
+    """
+    if not column_types:
+        return records
+    make_row = row_factory(column_types)
+    for position, record in enumerate(records):
+        records[position] = make_row(record)
+    return records
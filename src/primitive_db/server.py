@@ -0,0 +1,214 @@
+import asyncio
+import contextvars
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from src.decorators import confirm_answer, describe_error
+from src.primitive_db.engine import (
+    new_session,
+    perform_command,
+    recover_database,
+)
+from src.primitive_db.rows import Row
+from src.primitive_db.utils import (
+    checkpoint_wal,
+    in_transaction,
+    release_ids,
+    rollback_transaction,
+)
+
+# Протокол: клиент отправляет команды по одной в строке - текстом команды,
+# как в интерактивном режиме, или объектом JSON
+# {"command": "<команда>", "confirm": true|false, "text": true|false}.
+# Опасные команды (delete, drop_table) выполняются только с "confirm": true.
+# На каждую команду сервер отвечает одной строкой JSON
+# {"ok": true, "result": <результат>, "closed": false}: результат -
+# значение, которое вернул метод Database (записи select - объектами,
+# ID записей insert, update и delete, количества записей), или null.
+# Текст результата, как в интерактивном режиме, добавляется полем
+# "output", если запрос - текст команды или в нем "text": true.
+# Ошибка команды - {"ok": false, "error": "<сообщение>",
+# "error_type": "<класс ошибки>", "closed": false} (с текстовым выводом
+# в "output" - сообщение, как в интерактивном режиме), ошибка протокола -
+# {"ok": false, "error": "<описание>"}.
+# "closed": true означает, что сервер закрывает соединение (команда exit)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# наибольшая длина строки запроса (пакетные вставки бывают большими)
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+
+# сколько команд выполняется одновременно
+MAX_WORKERS = int(os.environ.get("PRIMITIVE_DB_SERVER_WORKERS", "8"))
+
+_encoder = json.JSONEncoder(ensure_ascii=False)
+
+
+def parse_request(line):
+    """
+    Разбирает строку запроса: возвращает команду, ответ на запросы
+    подтверждения ("y" или "n") и признак текстового вывода.
+    Подтверждение дается только явным "confirm": true, текстовая
+    команда и запрос без "confirm" получают отказ. Текстовая
+    команда получает текстовый вывод, запрос JSON - только
+    с "text": true
+    """
+    text = line.strip()
+    if not text.startswith("{"):
+        return text, "n", True
+    try:
+        request = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Некорректный JSON: {e}")
+    if not isinstance(request, dict) or not isinstance(request.get("command"), str):
+        raise ValueError('Ожидается объект с полем "command"')
+    return (request["command"].strip(),
+            "y" if request.get("confirm") is True else "n",
+            request.get("text") is True)
+
+
+def plain_result(value):
+    """
+    Приводит результат команды к значениям JSON:
+    записи (rows.Row) - к словарям
+    """
+    if isinstance(value, Row):
+        return value.copy()
+    if isinstance(value, (list, tuple)):
+        return [plain_result(item) for item in value]
+    if isinstance(value, dict):
+        return {key: plain_result(item) for key, item in value.items()}
+    return value
+
+
+class Connection:
+    """
+    Соединение с клиентом: свой сеанс (настройки, транзакция)
+    и свой контекст, в котором выполняются его команды
+    """
+
+    def __init__(self):
+        self.session = new_session(interactive=False)
+        # транзакция хранится в контекстной переменной, поэтому
+        # команды соединения выполняются в одном и том же контексте
+        self.context = contextvars.copy_context()
+
+    def execute(self, command, confirm, text=False):
+        """
+        Выполняет команду и возвращает ответ сервера (словарь).
+        Вызывается в потоке исполнителя
+        """
+        return self.context.run(self._execute, command, confirm, text)
+
+    def _execute(self, command, confirm, text):
+        confirm_answer.set(confirm)
+        lines = []
+        self.session["echo"] = (lambda line: lines.append(str(line))) \
+            if text else None
+        if not command:
+            result, keep_open = None, True
+        else:
+            try:
+                result, keep_open = perform_command(command, self.session)
+            except Exception as e:
+                response = {"ok": False, "error": str(e),
+                            "error_type": type(e).__name__, "closed": False}
+                if text:
+                    response["output"] = describe_error(e) + "\n"
+                return response
+        response = {"ok": True, "result": plain_result(result),
+                    "closed": not keep_open}
+        if text:
+            response["output"] = "".join(line + "\n" for line in lines)
+        return response
+
+    def close(self):
+        """
+        Отменяет незафиксированную транзакцию соединения
+        """
+        self.context.run(self._close)
+
+    def _close(self):
+        if in_transaction():
+            rollback_transaction()
+
+
+async def handle_client(reader, writer, executor):
+    """
+    Обслуживает одно соединение: читает команды построчно
+    и выполняет их в пуле потоков, не блокируя цикл событий
+    """
+    loop = asyncio.get_running_loop()
+    connection = Connection()
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            except (asyncio.LimitOverrunError, ValueError):
+                response = {"ok": False, "error": "Слишком длинный запрос"}
+                writer.write((_encoder.encode(response) + "\n").encode("utf-8"))
+                break
+            if not line:
+                break
+            try:
+                command, confirm, text = parse_request(line.decode("utf-8"))
+            except (UnicodeDecodeError, ValueError) as e:
+                response = {"ok": False, "error": str(e)}
+            else:
+                response = await loop.run_in_executor(
+                    executor, connection.execute, command, confirm, text)
+            writer.write((_encoder.encode(response) + "\n").encode("utf-8"))
+            await writer.drain()
+            if response.get("closed"):
+                break
+    except ConnectionError:
+        pass
+    finally:
+        await loop.run_in_executor(executor, connection.close)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def start_server(host=DEFAULT_HOST, port=DEFAULT_PORT, executor=None):
+    """
+    Запускает сервер и возвращает объект asyncio.Server.
+    Таблицы остаются в общем кэше процесса между запросами
+    всех соединений, чтения разных соединений идут параллельно
+    """
+    executor = executor or ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+    async def handle(reader, writer):
+        await handle_client(reader, writer, executor)
+
+    return await asyncio.start_server(handle, host, port,
+                                      limit=MAX_REQUEST_BYTES)
+
+
+async def _serve(host, port):
+    server = await start_server(host, port)
+    addresses = ", ".join(f"{sock.getsockname()[0]}:{sock.getsockname()[1]}"
+                          for sock in server.sockets)
+    print(f"Сервер базы данных слушает {addresses}.")
+    async with server:
+        await server.serve_forever()
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    Запускает сервер базы данных и обслуживает соединения
+    до прерывания (Ctrl+C)
+    """
+    recover_database()
+    try:
+        asyncio.run(_serve(host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        release_ids()
+        checkpoint_wal()
+        print("Сервер остановлен.")
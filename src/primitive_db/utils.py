@@ -1,49 +1,1179 @@
+import csv
 import json
 import os
+import shutil
+import threading
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+from itertools import count
 
+from src.primitive_db import columnar, metrics
+from src.primitive_db.cache import file_signature, table_cache
+from src.primitive_db.errors import (
+    ConflictError,
+    TableExistsError,
+    TransactionError,
+    ValidationError,
+)
+from src.primitive_db.locks import (
+    metadata_lock,
+    table_lock,
+)
+from src.primitive_db.rows import column_values, convert_records, stored_record
+from src.primitive_db.wal import CHECKPOINT_BYTES, get_wal
+
+# допустимые форматы хранения таблиц:
+# json - весь список записей в одном JSON-файле (перезаписывается целиком)
+# log - журнал операций в формате JSON Lines (запись только дописывается)
+# columnar - типизированные файлы столбцов, читаемые через mmap
+STORAGE_FORMATS = ("json", "log", "columnar")
+
+# общий кодировщик строк журнала (не создается заново на каждую запись)
+LOG_ENCODER = json.JSONEncoder(ensure_ascii=False)
+
+# сколько новых ID резервируется в метаданных за одну запись файла
+ID_BLOCK = 1000
+
+# ID, зарезервированные этим процессом и еще не выданные:
+# (файл метаданных, таблица) -> [следующий ID, граница блока]
+_reserved_ids = {}
+_reserved_lock = threading.Lock()
+
+# файл записей WAL, которые не удалось применить при восстановлении
+REJECTED_WAL_FILE = "wal.rejected.jsonl"
+
+# ошибки применения записи WAL, из-за которых запись откладывается
+# (ошибки ввода-вывода прерывают восстановление)
+REPLAY_ERRORS = (ValueError, TypeError, KeyError, ValidationError)
+
+# до скольких удаляемых записей они ищутся двоичным поиском,
+# а не полным просмотром списка записей
+MAX_POINT_DELETES = 32
+
+# активная транзакция: {"id": номер, "tables": {(каталог, таблица): изменения}}.
+# Хранится в контекстной переменной, поэтому у каждого потока
+# и задачи asyncio своя транзакция
+_transaction = ContextVar("transaction", default=None)
+_transaction_ids = count(1)
+
+
+def normalize_metadata(data):
+    """
+    Приводит метаданные к текущему формату
+    {таблица: {"columns": [...], "next_id": ...}}.
+    В старом формате описание таблицы - просто список столбцов
+    """
+    return {table_name: {"columns": table_meta} if isinstance(table_meta, list)
+            else table_meta
+            for table_name, table_meta in (data or {}).items()}
 
 def load_metadata(filepath="db_meta.json"):
     """
-    Загружает метаданные из JSON-файла
+    Загружает метаданные из JSON-файла. Повторные чтения
+    неизмененного файла обслуживаются из кэша
     """
-    try:
+    def read_metadata():
         with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
+            return normalize_metadata(json.load(f))
+
+    try:
+        # копия описаний таблиц: вызывающий код меняет их на месте
+        return {table_name: dict(table_meta) for table_name, table_meta
+                in table_cache.get(filepath, read_metadata).items()}
     except FileNotFoundError:
         return {}
 
-def save_metadata(data, filepath="db_meta.json"):
+def get_metadata_version(filepath="db_meta.json"):
+    """
+    Возвращает версию файла метаданных (подпись файла).
+    Ее нужно получить до load_metadata и передать в save_metadata
+    """
+    return file_signature(filepath)
+
+def check_metadata_version(expected_version, filepath="db_meta.json"):
+    """
+    Проверяет, что файл метаданных не менялся с момента чтения
+    (оптимистичная проверка версии)
+    """
+    if expected_version is not None \
+            and file_signature(filepath) != expected_version:
+        raise ConflictError(
+            "Метаданные изменены другим процессом. Повторите команду.")
+
+def save_metadata(data, filepath="db_meta.json", expected_version=None):
+    """
+    Сохраняет метаданные в JSON-файл. Запись идет во временный
+    файл, который сбрасывается на диск и затем атомарно подменяет
+    файл метаданных. Если передана expected_version, метаданные
+    сохраняются, только если файл не менялся с момента чтения
+    """
+    with metadata_lock(filepath):
+        check_metadata_version(expected_version, filepath)
+        tmp_path = filepath + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+            metrics.count("bytes_written", f.tell())
+        os.replace(tmp_path, filepath)
+        table_cache.put(filepath, {table_name: dict(table_meta)
+                                   for table_name, table_meta in data.items()})
+
+def allocate_ids(metadata, table_name, count=1, filepath="db_meta.json"):
+    """
+    Выделяет блок из count новых ID. ID резервируются в метаданных
+    блоками по ID_BLOCK (или count, если он больше): счетчик таблицы
+    сохраняется в файле до записи самих данных, поэтому ID
+    не используются повторно даже после удаления последних записей
+    или сбоя, а файл метаданных перезаписывается один раз на блок,
+    а не на каждую вставку. Счетчик читается и сохраняется под
+    блокировкой метаданных, поэтому процессы не выдают одинаковые ID.
+    Неиспользованные ID блока возвращает release_ids, после сбоя
+    они остаются пропуском. Возвращает первый ID блока
+    """
+    key = (os.path.abspath(filepath), table_name)
+    with _reserved_lock:
+        reserved = _reserved_ids.get(key)
+        if reserved is not None and reserved[0] + count <= reserved[1]:
+            stored_meta = load_metadata(filepath).get(table_name, {})
+            # счетчик меньше границы блока - таблицу пересоздали
+            if stored_meta.get("next_id", -1) >= reserved[1]:
+                first_id = reserved[0]
+                reserved[0] += count
+                return first_id
+        first_id, limit = _reserve_ids(
+            metadata, table_name, max(count, ID_BLOCK), filepath)
+        _reserved_ids[key] = [first_id + count, limit]
+        return first_id
+
+def _reserve_ids(metadata, table_name, count, filepath):
+    """
+    Резервирует count ID в счетчике таблицы в файле метаданных.
+    Возвращает первый ID и границу блока
+    """
+    table_meta = metadata[table_name]
+    with metadata_lock(filepath):
+        stored = load_metadata(filepath)
+        stored_meta = stored.get(table_name, table_meta)
+
+        candidates = [meta["next_id"] for meta in (table_meta, stored_meta)
+                      if "next_id" in meta]
+        if candidates:
+            first_id = max(candidates)
+        else:
+            # метаданные старого формата: продолжаем после максимального ID
+            table_data = load_table_data(table_name)
+            first_id = max((record["ID"] for record in table_data),
+                           default=-1) + 1
+
+        table_meta["next_id"] = first_id + count
+        stored[table_name] = dict(stored_meta, next_id=first_id + count)
+        save_metadata(stored, filepath)
+    return first_id, first_id + count
+
+def release_ids(filepath="db_meta.json"):
+    """
+    Возвращает в счетчики таблиц неиспользованные ID, зарезервированные
+    этим процессом, если после него другие процессы ID не резервировали
+    (иначе остается пропуск)
+    """
+    path = os.path.abspath(filepath)
+    with _reserved_lock:
+        keys = [key for key in _reserved_ids if key[0] == path]
+        if not keys:
+            return
+        with metadata_lock(filepath):
+            stored = load_metadata(filepath)
+            changed = False
+            for key in keys:
+                next_id, limit = _reserved_ids.pop(key)
+                table_meta = stored.get(key[1])
+                if table_meta is not None and next_id < limit \
+                        and table_meta.get("next_id") == limit:
+                    table_meta["next_id"] = next_id
+                    changed = True
+            if changed:
+                save_metadata(stored, filepath)
+
+def get_table_columns(metadata, table_name):
+    """
+    Возвращает список столбцов таблицы в формате ["ID:int", "name:str"]
+    """
+    return metadata[table_name]["columns"]
+
+def get_column_types(metadata, table_name):
+    """
+    Возвращает словарь {столбец: тип} по метаданным таблицы
+    """
+    return dict(column.split(":", 1)
+                for column in get_table_columns(metadata, table_name))
+
+def get_table_types(table_name, data_dir="data"):
+    """
+    Возвращает схему {столбец: тип} таблицы для записей в памяти:
+    у колоночной таблицы - из ее описания, у остальных - из
+    метаданных. Для таблицы, которой нет в метаданных, - пустой словарь
+    """
+    if detect_storage(table_name, data_dir) == "columnar":
+        return columnar.read_meta(
+            get_table_path(table_name, "columnar", data_dir))["columns"]
+    metadata = load_metadata()
+    if table_name not in metadata:
+        return {}
+    return get_column_types(metadata, table_name)
+
+def convert_value(value, column_type):
+    """
+    Приводит хранимое значение к типу столбца для сравнений
+    и сортировки. Если значение не приводится к типу, возвращает
+    None. Значения записей в памяти уже имеют тип столбца
+    (см. rows.native_value) и возвращаются без разбора
+    """
+    if column_type == "int":
+        if value.__class__ is int:
+            return value
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    if column_type == "bool":
+        if value.__class__ is bool:
+            return value
+        if str(value).lower() in ("true", "false"):
+            return str(value).lower() == "true"
+        return None
+    return value
+
+def get_table_path(table_name, storage="json", data_dir="data"):
+    """
+    Возвращает путь к файлу данных таблицы для указанного формата
+    (для колоночного формата - путь к каталогу столбцов)
+    """
+    extension = {"log": "jsonl", "columnar": "col"}.get(storage, "json")
+    return os.path.join(data_dir, f"{table_name}.{extension}")
+
+def get_signature_path(table_name, storage="json", data_dir="data"):
+    """
+    Возвращает путь к файлу, по подписи которого определяется
+    версия данных таблицы. У колоночной таблицы это файл описания,
+    он перезаписывается при каждом изменении
+    """
+    table_path = get_table_path(table_name, storage, data_dir)
+    if storage == "columnar":
+        return columnar.get_meta_path(table_path)
+    return table_path
+
+def get_index_path(table_name, data_dir="data"):
+    """
+    Возвращает путь к файлу индексов таблицы
+    """
+    return os.path.join(data_dir, f"{table_name}.idx.json")
+
+def get_row_count_path(table_name, data_dir="data"):
+    """
+    Возвращает путь к файлу с количеством записей таблицы
+    """
+    return os.path.join(data_dir, f"{table_name}.rows.json")
+
+def detect_storage(table_name, data_dir="data"):
+    """
+    Определяет формат хранения таблицы по существующему файлу данных
+    """
+    if os.path.exists(get_table_path(table_name, "log", data_dir)):
+        return "log"
+    if os.path.isdir(get_table_path(table_name, "columnar", data_dir)):
+        return "columnar"
+    return "json"
+
+def get_table_signature(table_name, data_dir="data"):
+    """
+    Возвращает подпись (время изменения, размер) файла данных таблицы,
+    по которой определяется, менялась ли таблица на диске
+    """
+    staged = get_staged_table(table_name, data_dir)
+    if staged is not None:
+        # версия данных с изменениями транзакции
+        return ("transaction", staged["transaction"], staged["version"])
+    storage = detect_storage(table_name, data_dir)
+    return file_signature(get_signature_path(table_name, storage, data_dir))
+
+def init_table_storage(table_name, storage="json", data_dir="data",
+                       column_types=None):
+    """
+    Подготавливает хранилище новой таблицы. Для журнального формата
+    создается пустой файл журнала, для колоночного - пустые файлы
+    столбцов column_types, по которым определяется формат таблицы
+    """
+    if storage not in STORAGE_FORMATS:
+        raise ValidationError(f'Некорректный формат хранения: {storage}. \
+Допустимые форматы: {", ".join(STORAGE_FORMATS)}')
+
+    if storage == "log":
+        os.makedirs(data_dir, exist_ok=True)
+        open(get_table_path(table_name, "log", data_dir), 'a').close()
+    elif storage == "columnar":
+        os.makedirs(data_dir, exist_ok=True)
+        columnar.write_table(get_table_path(table_name, "columnar", data_dir),
+                             column_types, [])
+
+def remove_table_data(table_name, data_dir="data", keep_indexes=False):
     """
-    Сохраняет метаданные в JSON-файл
+    Удаляет файлы данных и индексов таблицы
+    (с keep_indexes - только файлы данных)
     """
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    for storage in STORAGE_FORMATS:
+        table_path = get_table_path(table_name, storage, data_dir)
+        if os.path.isdir(table_path):
+            shutil.rmtree(table_path)
+        elif os.path.exists(table_path):
+            os.remove(table_path)
+        table_cache.invalidate(get_signature_path(table_name, storage, data_dir))
+    row_count_path = get_row_count_path(table_name, data_dir)
+    if os.path.exists(row_count_path):
+        os.remove(row_count_path)
+    if not keep_indexes:
+        index_path = get_index_path(table_name, data_dir)
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        table_cache.invalidate(index_path)
 
 def save_table_data(table_name, data, data_dir="data"):
     """
     Сохраняет данные таблицы в JSON-файл, удаляет таблицу,
-    если запрос с пустыми данными (все удалены)
+    если запрос с пустыми данными (все удалены).
+    Для журнального формата журнал перезаписывается
+    в сжатом виде (одна запись на строку таблицы),
+    колоночная таблица перезаписывается целиком
     """
+    storage = detect_storage(table_name, data_dir)
+    if storage == "log":
+        write_table_log(table_name, data, data_dir)
+        return
+    if storage == "columnar":
+        write_table_columns(table_name, data, data_dir=data_dir)
+        return
+
     if not data:
         # удаляем файл, если пришел запрос с пустыми данными
-        file_path = f"data/{table_name}.json"
+        file_path = get_table_path(table_name, "json", data_dir)
         if os.path.exists(file_path):
             os.remove(file_path)
+        table_cache.invalidate(file_path)
     else:
         if not os.path.exists(data_dir):
             os.makedirs(data_dir)
-        
-        filepath = os.path.join(data_dir, f"{table_name}.json")
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+
+        # пишем во временный файл и подменяем им файл таблицы,
+        # чтобы сбой во время записи не оставил файл обрезанным
+        filepath = get_table_path(table_name, "json", data_dir)
+        tmp_path = filepath + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump([stored_record(record) for record in data], f,
+                      indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+            metrics.count("bytes_written", f.tell())
+        os.replace(tmp_path, filepath)
+        table_cache.put(filepath, convert_records(
+            data, get_table_types(table_name, data_dir)))
+        save_row_count(table_name, filepath, len(data), data_dir)
 
 def load_table_data(table_name, data_dir="data"):
     """
-    Загружает данные таблицы из JSON-файла
+    Загружает данные таблицы из JSON-файла, журнала или файлов
+    столбцов. Записи при загрузке приводятся к строкам схемы таблицы
+    со значениями в типах столбцов (см. rows.Row). Если файл
+    не менялся с прошлого чтения, записи берутся из кэша без разбора
+    JSON. Внутри транзакции возвращаются записи с ее изменениями.
+    Возвращаемый список нельзя изменять на месте
+    """
+    staged = get_staged_table(table_name, data_dir)
+    if staged is not None:
+        return staged["records"]
+
+    storage = detect_storage(table_name, data_dir)
+    if storage == "log":
+        filepath = get_table_path(table_name, "log", data_dir)
+
+        def read_log_counted():
+            records = read_table_log(table_name, data_dir)
+            save_row_count(table_name, filepath, len(records), data_dir)
+            return convert_records(
+                records, get_table_types(table_name, data_dir))
+
+        return table_cache.get(filepath, read_log_counted)
+    if storage == "columnar":
+        table_dir = get_table_path(table_name, "columnar", data_dir)
+        return table_cache.get(
+            columnar.get_meta_path(table_dir),
+            lambda: columnar.ColumnarReader(table_dir).records(),
+            weight=columnar.table_size(table_dir))
+
+    filepath = get_table_path(table_name, "json", data_dir)
+
+    def read_table_json():
+        with open(filepath, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        save_row_count(table_name, filepath, len(records), data_dir)
+        return convert_records(records, get_table_types(table_name, data_dir))
+
+    try:
+        return table_cache.get(filepath, read_table_json)
+    except FileNotFoundError:
+        return []
+
+def read_table_log(table_name, data_dir="data"):
+    """
+    Восстанавливает записи таблицы, последовательно применяя
+    операции из журнала. Оборванная последняя строка
+    (незавершенная запись) игнорируется
     """
-    filepath = os.path.join(data_dir, f"{table_name}.json")
+    filepath = get_table_path(table_name, "log", data_dir)
+    records = {}
     try:
         with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if entry["op"] == "del":
+                    records.pop(entry["ID"], None)
+                else:
+                    # обновление сохраняет исходную позицию записи
+                    records[entry["row"]["ID"]] = entry["row"]
     except FileNotFoundError:
-        return []
\ No newline at end of file
+        return []
+    return list(records.values())
+
+def append_table_log(table_name, records=(), deleted_ids=(), data_dir="data"):
+    """
+    Дописывает в журнал таблицы новые или измененные записи
+    и удаления, не перечитывая и не перезаписывая файл
+    """
+    lines = [format_log_put(record) for record in records]
+    lines.extend(json.dumps({"op": "del", "ID": record_id})
+                 for record_id in deleted_ids)
+    if not lines:
+        return
+
+    os.makedirs(data_dir, exist_ok=True)
+    filepath = get_table_path(table_name, "log", data_dir)
+    # закэшированное состояние до дописывания
+    cached = table_cache.peek(filepath)
+    with open(filepath, 'a', encoding='utf-8') as f:
+        start = f.tell()
+        f.write("\n".join(lines) + "\n")
+        metrics.count("bytes_written", f.tell() - start)
+
+    if cached is None:
+        table_cache.invalidate(filepath)
+    else:
+        # список из кэша мог быть возвращен select, поэтому
+        # изменения применяются к копии
+        data = apply_log_changes(
+            list(cached),
+            convert_records(list(records), get_table_types(table_name, data_dir)),
+            deleted_ids)
+        table_cache.put(filepath, data)
+        save_row_count(table_name, filepath, len(data), data_dir)
+
+def format_log_put(record):
+    """
+    Возвращает строку журнала для добавления или изменения записи
+    """
+    return LOG_ENCODER.encode({"op": "put", "row": stored_record(record)})
+
+def append_table_log_file(table_name, source_path, data_dir="data"):
+    """
+    Дописывает в журнал таблицы заранее подготовленный файл
+    со строками журнала одной операцией записи и сбрасывает
+    журнал на диск
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    filepath = get_table_path(table_name, "log", data_dir)
+    with open(source_path, 'rb') as source, open(filepath, 'ab') as target:
+        start = target.tell()
+        shutil.copyfileobj(source, target, 1024 * 1024)
+        target.flush()
+        os.fsync(target.fileno())
+        metrics.count("bytes_written", target.tell() - start)
+    table_cache.invalidate(filepath)
+
+def find_record_position(data, record_id):
+    """
+    Позиция записи с ID в списке записей таблицы двоичным поиском:
+    записи идут по возрастанию ID. Если записи на найденной позиции
+    нет (или порядок нарушен), возвращает None
+    """
+    try:
+        position = bisect_left(data, record_id, key=lambda row: row["ID"])
+    except TypeError:
+        return None
+    if position < len(data) and data[position]["ID"] == record_id:
+        return position
+    return None
+
+def apply_log_changes(data, records=(), deleted_ids=()):
+    """
+    Применяет дописанные в журнал операции к списку записей
+    в памяти. Новые и измененные записи применяются на месте,
+    при удалении возвращается новый список. Отдельные записи
+    находятся двоичным поиском по ID, полный просмотр списка
+    выполняется, только если поиск не нашел запись или удаляется
+    много записей
+    """
+    positions = None
+    for record in records:
+        # ID выдаются по возрастанию, поэтому новая запись идет в конец
+        if not data or record["ID"] > data[-1]["ID"]:
+            if positions is not None:
+                positions[record["ID"]] = len(data)
+            data.append(record)
+            continue
+        if positions is None:
+            position = find_record_position(data, record["ID"])
+            if position is not None:
+                data[position] = record
+                continue
+            positions = {record_id: i for i, record_id
+                         in enumerate(column_values(data, "ID"))}
+        if record["ID"] in positions:
+            data[positions[record["ID"]]] = record
+        else:
+            positions[record["ID"]] = len(data)
+            data.append(record)
+    if deleted_ids:
+        deleted_ids = set(deleted_ids)
+        if len(deleted_ids) <= MAX_POINT_DELETES:
+            found = [find_record_position(data, record_id)
+                     for record_id in deleted_ids]
+            if None not in found:
+                data = list(data)
+                for position in sorted(found, reverse=True):
+                    del data[position]
+                return data
+        data = [row for row, record_id in zip(data, column_values(data, "ID"))
+                if record_id not in deleted_ids]
+    return data
+
+def write_table_log(table_name, data, data_dir="data"):
+    """
+    Записывает журнал таблицы заново, по одной операции на запись.
+    Запись идет во временный файл, который затем атомарно
+    подменяет журнал
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    filepath = get_table_path(table_name, "log", data_dir)
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for record in data:
+            f.write(format_log_put(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+        metrics.count("bytes_written", f.tell())
+    os.replace(tmp_path, filepath)
+    table_cache.put(filepath, convert_records(
+        data, get_table_types(table_name, data_dir)))
+    save_row_count(table_name, filepath, len(data), data_dir)
+
+def compact_table_log(table_name, data_dir="data"):
+    """
+    Сжимает журнал таблицы: обновления и удаления сворачиваются,
+    в журнале остается по одной строке на актуальную запись.
+    Возвращает количество записей
+    """
+    with table_lock(table_name, exclusive=True, data_dir=data_dir):
+        if detect_storage(table_name, data_dir) != "log":
+            raise ValidationError(
+                f'Таблица "{table_name}" хранится не в журнальном формате.')
+        records = read_table_log(table_name, data_dir)
+        write_table_log(table_name, records, data_dir)
+    return len(records)
+
+def save_row_count(table_name, filepath, rows, data_dir="data"):
+    """
+    Запоминает количество записей таблицы вместе с подписью файла
+    данных filepath, для которой оно получено. Файл пишется без
+    сброса на диск: количество для другой подписи или из
+    поврежденного файла не используется
+    """
+    signature = file_signature(filepath)
+    if signature is None:
+        return
+    try:
+        with open(get_row_count_path(table_name, data_dir), 'w',
+                  encoding='utf-8') as f:
+            json.dump({"signature": signature, "rows": rows}, f)
+    except OSError:
+        pass
+
+def count_rows(table_name, data_dir="data"):
+    """
+    Возвращает количество записей таблицы без чтения записей:
+    из изменений транзакции, из кэша, из описания колоночной таблицы
+    или из сохраненного количества для текущей версии файла данных.
+    Если количество неизвестно, таблица загружается
+    """
+    staged = get_staged_table(table_name, data_dir)
+    if staged is not None:
+        return len(staged["records"])
+    storage = detect_storage(table_name, data_dir)
+    signature_path = get_signature_path(table_name, storage, data_dir)
+    cached = table_cache.peek(signature_path)
+    if cached is not None:
+        return len(cached)
+    if storage == "columnar":
+        return columnar.read_meta(
+            get_table_path(table_name, "columnar", data_dir))["rows"]
+
+    signature = file_signature(signature_path)
+    if signature is not None:
+        try:
+            with open(get_row_count_path(table_name, data_dir), 'r',
+                      encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = None
+        if isinstance(saved, dict) \
+                and saved.get("signature") == list(signature):
+            return saved["rows"]
+    return len(load_table_data(table_name, data_dir))
+
+def is_table_loaded(table_name, data_dir="data"):
+    """
+    Проверяет, есть ли в кэше актуальные записи таблицы
+    (или записи с изменениями транзакции)
+    """
+    if get_staged_table(table_name, data_dir) is not None:
+        return True
+    storage = detect_storage(table_name, data_dir)
+    return table_cache.peek(
+        get_signature_path(table_name, storage, data_dir)) is not None
+
+def apply_table_changes(table_name, records=(), deleted_ids=(),
+                        table_data=None, data_dir="data"):
+    """
+    Применяет к файлам таблицы новые и измененные записи и удаления.
+    Журнальная таблица дописывается, в колоночную новые записи
+    дописываются в конец, в остальных случаях таблица перезаписывается.
+    Повторное применение тех же изменений ничего не меняет
+    """
+    storage = detect_storage(table_name, data_dir)
+    wal = get_wal(data_dir)
+    if storage == "log":
+        append_table_log(table_name, records, deleted_ids, data_dir)
+        wal.mark_dirty(get_table_path(table_name, "log", data_dir))
+        return
+    if storage == "columnar" and records and not deleted_ids:
+        last_ids = open_table_columns(table_name, data_dir).column("ID")
+        if not len(last_ids) or min(record["ID"] for record in records) \
+                > last_ids[len(last_ids) - 1]:
+            append_table_columns(table_name, records, data_dir)
+            wal.mark_dirty(get_table_path(table_name, "columnar", data_dir))
+            return
+
+    if table_data is None:
+        table_data = load_table_data(table_name, data_dir)
+    save_table_data(
+        table_name,
+        apply_log_changes(list(table_data), records, deleted_ids), data_dir)
+
+def check_table_changes(table_name, records, data_dir="data"):
+    """
+    Проверяет новые и измененные записи до записи в WAL: значения
+    колоночной таблицы должны кодироваться в типы ее столбцов,
+    иначе изменение нельзя было бы применить и при восстановлении.
+    Выбрасывает ValidationError
+    """
+    if not records or detect_storage(table_name, data_dir) != "columnar":
+        return
+    meta = columnar.read_meta(get_table_path(table_name, "columnar", data_dir))
+    try:
+        columnar.check_records(meta["columns"], records)
+    except ValueError as e:
+        raise ValidationError(str(e))
+
+def commit_table_changes(table_name, records=(), deleted_ids=(),
+                         table_data=None, data_dir="data"):
+    """
+    Фиксирует изменения таблицы: сначала они дописываются в журнал
+    упреждающей записи (WAL), затем применяются к файлам данных
+    (когда запись сбрасывается на диск, см. wal.WriteAheadLog).
+    Если сбой произошел до применения, изменения будут применены
+    при следующем запуске. Записи
+    проверяются до записи в журнал (см. check_table_changes).
+    Внутри транзакции изменения только накапливаются в памяти
+    """
+    records = list(records)
+    check_table_changes(table_name, records, data_dir)
+    if _transaction.get() is not None:
+        stage_table_changes(table_name, records, deleted_ids, table_data,
+                            data_dir)
+        return
+
+    wal = get_wal(data_dir)
+    with wal.lock():
+        wal.commit({"table": table_name,
+                    "put": [stored_record(record) for record in records],
+                    "del": list(deleted_ids)})
+        apply_table_changes(
+            table_name, records, deleted_ids, table_data, data_dir)
+    maybe_checkpoint_wal(data_dir)
+
+def commit_table_log_file(table_name, source_path, data_dir="data"):
+    """
+    Фиксирует дописывание подготовленного файла строк журнала
+    в журнальную таблицу. В WAL записывается ссылка на файл,
+    поэтому файл удаляется только после применения
+    (под блокировкой журнала, чтобы восстановление в другом
+    процессе не применило его повторно)
+    """
+    wal = get_wal(data_dir)
+    with open(source_path, 'rb') as f:
+        os.fsync(f.fileno())
+    with wal.lock():
+        wal.commit({"table": table_name, "append_file": source_path})
+        append_table_log_file(table_name, source_path, data_dir)
+        os.remove(source_path)
+    maybe_checkpoint_wal(data_dir)
+
+def begin_transaction():
+    """
+    Начинает транзакцию: изменения таблиц накапливаются
+    в памяти до commit_transaction
+    """
+    if _transaction.get() is not None:
+        raise TransactionError("Транзакция уже начата")
+    _transaction.set({"id": next(_transaction_ids), "tables": {}})
+
+def in_transaction():
+    """
+    Проверяет, начата ли транзакция
+    """
+    return _transaction.get() is not None
+
+def get_staged_table(table_name, data_dir="data"):
+    """
+    Возвращает накопленные транзакцией изменения таблицы
+    или None, если транзакция таблицу не меняла
+    """
+    transaction = _transaction.get()
+    if transaction is None:
+        return None
+    return transaction["tables"].get((data_dir, table_name))
+
+def stage_table_changes(table_name, records=(), deleted_ids=(),
+                        table_data=None, data_dir="data"):
+    """
+    Применяет изменения к копии записей таблицы в транзакции
+    и запоминает их для записи при фиксации
+    """
+    transaction = _transaction.get()
+    staged = get_staged_table(table_name, data_dir)
+    if staged is None:
+        # версия файла, от которой считаются изменения транзакции
+        base = get_table_signature(table_name, data_dir)
+        if table_data is None:
+            table_data = load_table_data(table_name, data_dir)
+        staged = {"transaction": transaction["id"], "version": 0, "base": base,
+                  "records": list(table_data), "put": {}, "deleted": set()}
+        transaction["tables"][(data_dir, table_name)] = staged
+
+    # записи транзакции могли быть возвращены select внутри нее
+    staged["records"] = apply_log_changes(
+        list(staged["records"]),
+        convert_records(list(records), get_table_types(table_name, data_dir)),
+        deleted_ids)
+    for record in records:
+        staged["put"][record["ID"]] = record
+    for record_id in deleted_ids:
+        staged["put"].pop(record_id, None)
+        staged["deleted"].add(record_id)
+    staged["version"] += 1
+
+def commit_transaction():
+    """
+    Фиксирует транзакцию: изменения всех таблиц записываются в WAL
+    одной записью (все или ничего), затем каждая измененная таблица
+    записывается один раз. Таблицы блокируются на запись; если другой
+    процесс изменил таблицу после ее первого изменения в транзакции,
+    транзакция отменяется с ConflictError.
+    Возвращает список измененных таблиц
+    """
+    transaction = _transaction.get()
+    if transaction is None:
+        raise TransactionError("Транзакция не начата")
+    # дальше работаем с файлами таблиц, а не с копиями транзакции
+    _transaction.set(None)
+
+    changes = {}
+    for (data_dir, table_name), staged in transaction["tables"].items():
+        changes.setdefault(data_dir, []).append({
+            "table": table_name,
+            "put": [stored_record(record) for record in staged["put"].values()],
+            "del": sorted(staged["deleted"])})
+
+    with ExitStack() as stack:
+        # блокируем в одном порядке во всех процессах
+        for data_dir, table_name in sorted(transaction["tables"]):
+            stack.enter_context(
+                table_lock(table_name, exclusive=True, data_dir=data_dir))
+        for (data_dir, table_name), staged in transaction["tables"].items():
+            if get_table_signature(table_name, data_dir) != staged["base"]:
+                raise ConflictError(f"Таблица '{table_name}' изменена другим \
+процессом во время транзакции. Транзакция отменена.")
+            check_table_changes(table_name, list(staged["put"].values()),
+                                data_dir)
+
+        for data_dir, tables in changes.items():
+            wal = get_wal(data_dir)
+            with wal.lock():
+                # сбрасываем сразу: иначе после отключения питания
+                # на диске могла бы остаться только часть таблиц
+                wal.commit({"transaction": tables}, sync=True)
+                for change in tables:
+                    apply_table_changes(change["table"], change["put"],
+                                        change["del"], data_dir=data_dir)
+    for data_dir in changes:
+        maybe_checkpoint_wal(data_dir)
+    return [table_name for _, table_name in transaction["tables"]]
+
+def rollback_transaction():
+    """
+    Отменяет транзакцию, отбрасывая накопленные изменения.
+    Возвращает список таблиц, изменения которых отброшены
+    """
+    transaction = _transaction.get()
+    if transaction is None:
+        raise TransactionError("Транзакция не начата")
+    _transaction.set(None)
+    return [table_name for _, table_name in transaction["tables"]]
+
+def create_table_storage(metadata, table_name, storage="json",
+                         expected_version=None, data_dir="data",
+                         filepath="db_meta.json"):
+    """
+    Создает хранилище новой таблицы и сохраняет метаданные с ней.
+    Если метаданные изменены другим процессом после чтения
+    (expected_version), выбрасывает ConflictError, ничего не создавая
+    """
+    with metadata_lock(filepath):
+        check_metadata_version(expected_version, filepath)
+        init_table_storage(table_name, storage, data_dir,
+                           get_column_types(metadata, table_name))
+        save_metadata(metadata, filepath)
+
+def commit_drop_table(metadata, table_name, expected_version=None,
+                      data_dir="data", filepath="db_meta.json"):
+    """
+    Фиксирует удаление таблицы: запись в WAL, затем сохранение
+    метаданных без таблицы и удаление файлов данных. Затем журнал
+    очищается, чтобы его старые записи не применились к новой
+    таблице с тем же именем. Если метаданные изменены другим
+    процессом после чтения (expected_version), выбрасывает ConflictError
+    """
+    wal = get_wal(data_dir)
+    with table_lock(table_name, exclusive=True, data_dir=data_dir), \
+            metadata_lock(filepath):
+        check_metadata_version(expected_version, filepath)
+        with wal.lock():
+            wal.commit({"table": table_name, "drop": True})
+            save_metadata(metadata, filepath)
+            remove_table_data(table_name, data_dir)
+        checkpoint_wal(data_dir)
+
+def expand_wal_entries(entries):
+    """
+    Разворачивает записи транзакций в записи отдельных таблиц
+    """
+    return [change for entry in entries
+            for change in entry.get("transaction", [entry])]
+
+def checkpoint_wal(data_dir="data"):
+    """
+    Контрольная точка WAL: файлы всех таблиц, упомянутых в журнале
+    (в том числе другими процессами), сбрасываются на диск,
+    после чего журнал очищается
+    """
+    wal = get_wal(data_dir)
+    with wal.lock(exclusive=True):
+        tables = {entry["table"]
+                  for entry in expand_wal_entries(wal.read_entries())}
+        wal.checkpoint([get_table_path(table_name, storage, data_dir)
+                        for table_name in tables for storage in STORAGE_FORMATS])
+
+def maybe_checkpoint_wal(data_dir="data"):
+    """
+    Выполняет контрольную точку, если журнал вырос больше CHECKPOINT_BYTES
+    """
+    if get_wal(data_dir).size() > CHECKPOINT_BYTES:
+        checkpoint_wal(data_dir)
+
+def get_rejected_wal_path(data_dir="data"):
+    """
+    Файл записей WAL, которые не удалось применить при восстановлении
+    """
+    return os.path.join(data_dir, REJECTED_WAL_FILE)
+
+def count_rejected_wal_entries(data_dir="data"):
+    """
+    Количество записей WAL, отложенных в файл get_rejected_wal_path
+    """
+    try:
+        with open(get_rejected_wal_path(data_dir), 'r', encoding='utf-8') as f:
+            return sum(1 for line in f if line.strip())
+    except FileNotFoundError:
+        return 0
+
+def reject_wal_entry(entry, error, data_dir="data"):
+    """
+    Откладывает запись WAL, которую нельзя применить, в отдельный
+    файл вместе с описанием ошибки, чтобы она не мешала запуску
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    with open(get_rejected_wal_path(data_dir), 'a', encoding='utf-8') as f:
+        f.write(LOG_ENCODER.encode({"entry": entry, "error": str(error)}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def replay_wal(data_dir="data", filepath="db_meta.json"):
+    """
+    Применяет к файлам данных изменения из WAL, оставшиеся
+    после прерванной работы, и очищает журнал. Изменения одной
+    таблицы применяются за одну запись. Запись журнала, которую
+    нельзя применить (например, значение не кодируется в тип
+    столбца), не прерывает восстановление: она откладывается
+    в файл get_rejected_wal_path. Возвращает количество
+    примененных записей журнала
+    """
+    wal = get_wal(data_dir)
+    with metadata_lock(filepath), wal.lock(exclusive=True):
+        columnar.recover_tables(data_dir)
+        return _replay_entries(
+            wal, expand_wal_entries(wal.read_entries()), data_dir, filepath)
+
+def merge_wal_changes(entries):
+    """
+    Объединяет изменения записей WAL одной таблицы в пару
+    (новые и измененные записи, ID удаленных записей)
+    """
+    records = []
+    deleted_ids = []
+    for entry in entries:
+        deleted = set(entry["del"])
+        if deleted:
+            # удаление отменяет ранее накопленные изменения записей
+            records[:] = [record for record in records
+                          if record["ID"] not in deleted]
+        records.extend(entry["put"])
+        deleted_ids.extend(entry["del"])
+    return records, deleted_ids
+
+def _replay_entries(wal, entries, data_dir, filepath):
+    pending = {}
+    rejected = 0
+
+    def apply(table_name, changes):
+        records, deleted_ids = merge_wal_changes(changes)
+        apply_table_changes(table_name, records, deleted_ids, data_dir=data_dir)
+
+    def flush(table_name):
+        nonlocal rejected
+        changes = pending.pop(table_name)
+        try:
+            apply(table_name, changes)
+            return
+        except REPLAY_ERRORS:
+            pass
+        # применяем записи по одной, откладывая те, что не применяются
+        for change in changes:
+            try:
+                apply(table_name, [change])
+            except REPLAY_ERRORS as e:
+                reject_wal_entry(change, e, data_dir)
+                rejected += 1
+
+    for entry in entries:
+        table_name = entry["table"]
+        if entry.get("drop"):
+            pending.pop(table_name, None)
+            metadata = load_metadata(filepath)
+            if metadata.pop(table_name, None) is not None:
+                save_metadata(metadata, filepath)
+            remove_table_data(table_name, data_dir)
+        elif "append_file" in entry:
+            if table_name in pending:
+                flush(table_name)
+            if os.path.exists(entry["append_file"]):
+                append_table_log_file(table_name, entry["append_file"], data_dir)
+                os.remove(entry["append_file"])
+        else:
+            pending.setdefault(table_name, []).append(entry)
+    for table_name in list(pending):
+        flush(table_name)
+
+    for table_name in {entry["table"] for entry in entries}:
+        for storage in STORAGE_FORMATS:
+            wal.mark_dirty(get_table_path(table_name, storage, data_dir))
+    wal.checkpoint()
+    return len(entries) - rejected
+
+def open_table_columns(table_name, data_dir="data"):
+    """
+    Открывает колоночную таблицу для чтения отдельных столбцов
+    """
+    return columnar.ColumnarReader(
+        get_table_path(table_name, "columnar", data_dir))
+
+def write_table_columns(table_name, data, column_types=None, data_dir="data"):
+    """
+    Записывает колоночную таблицу заново. Если типы столбцов
+    не переданы, они берутся из описания существующей таблицы
+    """
+    table_dir = get_table_path(table_name, "columnar", data_dir)
+    if column_types is None:
+        column_types = columnar.read_meta(table_dir)["columns"]
+    os.makedirs(data_dir, exist_ok=True)
+    columnar.write_table(table_dir, column_types, data)
+    size = columnar.table_size(table_dir)
+    metrics.count("bytes_written", size)
+    table_cache.put(columnar.get_meta_path(table_dir),
+                    convert_records(data, column_types), weight=size)
+
+def append_table_columns(table_name, records, data_dir="data"):
+    """
+    Дописывает новые записи в конец файлов столбцов таблицы
+    """
+    table_dir = get_table_path(table_name, "columnar", data_dir)
+    meta_path = columnar.get_meta_path(table_dir)
+    # закэшированное состояние до дописывания
+    cached = table_cache.peek(meta_path)
+    # размер файлов до дописывания считается только для статистики
+    size = columnar.table_size(table_dir) if metrics.is_enabled() else None
+    columnar.append_rows(table_dir, records)
+    if size is not None:
+        metrics.count("bytes_written", columnar.table_size(table_dir) - size)
+    if cached is None:
+        table_cache.invalidate(meta_path)
+    else:
+        records = convert_records(list(records),
+                                  columnar.read_meta(table_dir)["columns"])
+        # список из кэша мог быть возвращен select
+        table_cache.put(meta_path, apply_log_changes(list(cached), records),
+                        weight=columnar.table_size(table_dir))
+
+def convert_table_storage(table_name, storage, column_types, data_dir="data"):
+    """
+    Переводит данные таблицы в другой формат хранения.
+    Индексы сохраняются и перестраиваются при следующем обращении.
+    Возвращает количество записей
+    """
+    if storage not in STORAGE_FORMATS:
+        raise ValidationError(f'Некорректный формат хранения: {storage}. \
+Допустимые форматы: {", ".join(STORAGE_FORMATS)}')
+    if detect_storage(table_name, data_dir) == storage:
+        raise TableExistsError(
+            f'Таблица "{table_name}" уже хранится в формате {storage}.')
+
+    data = list(load_table_data(table_name, data_dir))
+    if storage == "columnar":
+        # проверяем значения до удаления прежних файлов
+        tmp_dir = get_table_path(table_name, "columnar", data_dir) + ".new"
+        columnar.write_table(tmp_dir, column_types, data)
+        remove_table_data(table_name, data_dir, keep_indexes=True)
+        os.rename(tmp_dir, get_table_path(table_name, "columnar", data_dir))
+        return len(data)
+
+    remove_table_data(table_name, data_dir, keep_indexes=True)
+    if storage == "log":
+        write_table_log(table_name, data, data_dir)
+    else:
+        save_table_data(table_name, data, data_dir)
+    return len(data)
+
+def read_import_rows(filepath, columns):
+    """
+    Построчно читает файл импорта и возвращает генератор списков
+    значений в порядке столбцов columns (без ID).
+    Формат определяется по расширению: .csv (первая строка
+    может быть заголовком с именами столбцов, столбец ID
+    пропускается) или .jsonl
+    (каждая строка - объект {столбец: значение} или список значений)
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension not in (".csv", ".jsonl"):
+        raise ValidationError(
+            f"Неподдерживаемый формат файла: {filepath}. Ожидается .csv или .jsonl")
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"Файл {filepath} не найден")
+
+    def read_csv():
+        with open(filepath, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                return
+            names = [name.strip() for name in header]
+            # заголовок выгрузки может содержать ID - он назначается заново
+            if set(names) - {"ID"} == set(columns):
+                order = [names.index(column) for column in columns]
+                for row in reader:
+                    if row:
+                        yield [row[i] if i < len(row) else "" for i in order]
+            else:
+                yield header
+                yield from (row for row in reader if row)
+
+    def read_jsonl():
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if isinstance(item, dict):
+                    missing = [column for column in columns if column not in item]
+                    if missing:
+                        raise ValidationError(f"Строка {line_number}: нет значений \
+для столбцов {', '.join(missing)}")
+                    yield [item[column] for column in columns]
+                else:
+                    yield list(item)
+
+    return read_csv() if extension == ".csv" else read_jsonl()
+
+def write_export_rows(filepath, column_types, rows):
+    """
+    Записывает записи в файл CSV или JSONL по мере их получения
+    из итератора rows. В JSONL значения int и bool записываются
+    в своих типах. Возвращает количество записанных записей
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension not in (".csv", ".jsonl"):
+        raise ValidationError(
+            f"Неподдерживаемый формат файла: {filepath}. Ожидается .csv или .jsonl")
+
+    columns = list(column_types)
+    count = 0
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        if extension == ".csv":
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for record in rows:
+                writer.writerow([record.get(column, '') for column in columns])
+                count += 1
+        else:
+            for record in rows:
+                item = {}
+                for column in columns:
+                    value = record.get(column)
+                    typed = convert_value(value, column_types[column])
+                    item[column] = value if typed is None else typed
+                f.write(LOG_ENCODER.encode(item) + "\n")
+                count += 1
+    os.replace(tmp_path, filepath)
+    return count
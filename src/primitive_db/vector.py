@@ -0,0 +1,136 @@
+import threading
+from array import array
+from collections import OrderedDict
+from functools import partial
+from itertools import compress
+from operator import eq, ge, gt, le, lt, ne
+
+from src.primitive_db.rows import column_values
+
+try:
+    import numpy as np
+except ImportError:  # NumPy не обязателен, без него работают ядра на array
+    np = None
+
+# сколько столбцов-пачек хранится в памяти между запросами
+MAX_CACHED_BATCHES = 32
+
+# проверка "значение <оператор> expected" как "expected <обратный
+# оператор> значение" - функцией operator с подставленным expected,
+# вызываемой в map без промежуточной функции на Python. В отличие
+# от метода expected (expected.__eq__), значение другого типа дает
+# False, а не NotImplemented
+REFLECTED_OPERATORS = {"=": eq, "!=": ne, ">": lt, ">=": le, "<": gt, "<=": ge}
+
+NUMPY_OPERATORS = {"=": eq, "!=": ne, ">": gt, ">=": ge, "<": lt, "<=": le}
+
+BOOL_VALUES = {"true": True, "false": False}
+
+_batch_cache = OrderedDict()
+_batch_lock = threading.Lock()
+
+
+def typed_batch(values, column_type):
+    """
+    Приводит значения столбца к типу столбца целиком: int - массив
+    int64, bool - массив флагов, str - список строк. Если хотя бы
+    одно значение не приводится к типу, возвращает None
+    """
+    try:
+        if column_type == "int":
+            batch = array('q', map(int, values))
+            return np.frombuffer(batch, dtype=np.int64) if np else batch
+        if column_type == "bool":
+            flags = [BOOL_VALUES[str(value).lower()] for value in values]
+            return np.array(flags, dtype=bool) if np else flags
+    except (KeyError, TypeError, ValueError, OverflowError):
+        return None
+    return values if isinstance(values, list) else list(values)
+
+def column_batch(values, column_type):
+    """
+    Возвращает пачку значений столбца колоночной таблицы:
+    массив int64 отображается без копирования
+    """
+    if column_type == "int" and np is not None:
+        if not len(values):
+            return np.array([], dtype=np.int64)
+        return np.frombuffer(values, dtype=np.int64)
+    if column_type == "bool" and np is not None:
+        return np.array(list(values), dtype=bool)
+    return list(values)
+
+def row_batch(records, column, column_type=None):
+    """
+    Собирает столбец из записей. Без column_type возвращает
+    значения записей, иначе - приведенные к типу.
+    Если у какой-то записи нет столбца, возвращает None
+    """
+    try:
+        values = column_values(records, column)
+    except KeyError:
+        return None
+    if column_type is None:
+        return values
+    return typed_batch(values, column_type)
+
+def cached_batch(key, version, build):
+    """
+    Возвращает пачку из кэша, если она построена для той же
+    версии данных, иначе строит ее через build()
+    """
+    with _batch_lock:
+        entry = _batch_cache.get(key)
+        if entry is not None and entry[0] == version:
+            _batch_cache.move_to_end(key)
+            return entry[1]
+    batch = build()
+    with _batch_lock:
+        _batch_cache[key] = (version, batch)
+        _batch_cache.move_to_end(key)
+        while len(_batch_cache) > MAX_CACHED_BATCHES:
+            _batch_cache.popitem(last=False)
+    return batch
+
+def compare(batch, operator, expected, positions=None):
+    """
+    Сравнивает значения пачки с expected и возвращает позиции
+    подходящих значений. Если переданы positions, проверяются
+    только они (результат предыдущих условий)
+    """
+    if np is not None and isinstance(batch, np.ndarray):
+        if positions is None:
+            return np.flatnonzero(NUMPY_OPERATORS[operator](batch, expected))
+        positions = np.asarray(positions, dtype=np.intp)
+        mask = NUMPY_OPERATORS[operator](batch[positions], expected)
+        return positions[mask]
+
+    test = partial(REFLECTED_OPERATORS[operator], expected)
+    if positions is None:
+        return list(compress(range(len(batch)), map(test, batch)))
+    return list(compress(positions, map(test, map(batch.__getitem__, positions))))
+
+def union_positions(first, second):
+    """
+    Объединяет позиции двух условий (варианты группы or)
+    в возрастающем порядке
+    """
+    if not len(first):
+        return second
+    if not len(second):
+        return first
+    if np is not None and (isinstance(first, np.ndarray)
+                           or isinstance(second, np.ndarray)):
+        return np.union1d(first, second)
+    return sorted(set(first).union(second))
+
+def as_positions(positions, size):
+    """
+    Приводит результат сравнений к списку позиций
+    (None - условий не было, подходят все записи)
+    """
+    if positions is None:
+        return list(range(size))
+    if np is not None and isinstance(positions, np.ndarray):
+        return positions.tolist()
+    return positions
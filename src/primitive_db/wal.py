@@ -0,0 +1,253 @@
+import json
+import os
+import threading
+import time
+
+from src.primitive_db import metrics
+from src.primitive_db.locks import file_lock
+
+WAL_FILE = "wal.jsonl"
+
+# размер журнала, после которого изменения сбрасываются в файлы данных
+# и журнал очищается (контрольная точка)
+CHECKPOINT_BYTES = 16 * 1024 * 1024
+
+# когда записи журнала сбрасываются на диск (fsync):
+# "commit" - до возврата из каждой фиксации, "batch" - фиксация
+# возвращается, как только запись передана ОС, а fsync выполняется
+# не реже раза в SYNC_INTERVAL секунд или после SYNC_BYTES байтов
+SYNC_MODES = ("commit", "batch")
+SYNC_MODE = os.environ.get("PRIMITIVE_DB_WAL_SYNC", "batch")
+SYNC_INTERVAL = float(os.environ.get("PRIMITIVE_DB_WAL_SYNC_INTERVAL", "0.05"))
+SYNC_BYTES = int(os.environ.get("PRIMITIVE_DB_WAL_SYNC_BYTES", str(1024 * 1024)))
+
+# сколько ждать (в секундах) другие фиксации перед общим fsync
+# в режиме "commit", 0 - сбрасывать сразу, объединяя только
+# одновременные фиксации
+COMMIT_DELAY = float(os.environ.get("PRIMITIVE_DB_COMMIT_DELAY", "0"))
+
+_encoder = json.JSONEncoder(ensure_ascii=False)
+
+
+def fsync_path(path):
+    """
+    Сбрасывает на диск файл или все файлы каталога
+    """
+    if os.path.isdir(path):
+        for name in os.listdir(path):
+            fsync_path(os.path.join(path, name))
+        flags = os.O_RDONLY
+    elif os.path.exists(path):
+        flags = os.O_RDWR
+    else:
+        return
+    fd = os.open(path, flags)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    """
+    Журнал упреждающей записи: изменение дописывается в журнал
+    до того, как применяется к файлам данных. Записи пишет один
+    поток за раз: первый ожидающий поток дописывает записи всех
+    остальных одной операцией.
+
+    Режим sync_mode определяет цену надежности:
+    "commit" - каждая фиксация возвращается после fsync журнала
+    (одновременные фиксации объединяются в один fsync, commit_delay
+    задает, сколько ждать другие фиксации), зафиксированное
+    переживает и отключение питания, но последовательные
+    фиксации одного клиента стоят по fsync каждая;
+    "batch" - фиксация возвращается, как только запись передана ОС,
+    fsync выполняется фоновым таймером через sync_interval секунд
+    или сразу после sync_bytes несброшенных байтов. Зафиксированное
+    переживает аварийное завершение процесса, но при отключении
+    питания теряются фиксации последних sync_interval секунд.
+    Фиксация с sync=True (транзакции нескольких таблиц) сбрасывается
+    сразу в любом режиме.
+    Журнал каталога общий для всех процессов: фиксация вместе
+    с применением выполняется под разделяемой блокировкой журнала,
+    контрольная точка и восстановление - под исключительной
+    """
+
+    def __init__(self, data_dir="data", commit_delay=COMMIT_DELAY,
+                 sync_mode=SYNC_MODE, sync_interval=SYNC_INTERVAL,
+                 sync_bytes=SYNC_BYTES):
+        if sync_mode not in SYNC_MODES:
+            raise ValueError(f"Некорректный режим сброса журнала: \
+{sync_mode}. Допустимые режимы: {', '.join(SYNC_MODES)}")
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, WAL_FILE)
+        self.commit_delay = commit_delay
+        self.sync_mode = sync_mode
+        self.sync_interval = sync_interval
+        self.sync_bytes = sync_bytes
+        self._lock = threading.Lock()
+        self._flushed = threading.Condition(self._lock)
+        self._pending = []
+        self._next_seq = 0
+        # последние записи, переданные ОС и сброшенные на диск
+        self._written_seq = 0
+        self._durable_seq = 0
+        self._unsynced_bytes = 0
+        self._timer = None
+        self._flushing = False
+        # файлы, дописанные без fsync после последней контрольной точки
+        self._dirty_paths = set()
+
+    def commit(self, entry, sync=None):
+        """
+        Дописывает запись в журнал. Управление возвращается после
+        сброса записи на диск (режим "commit" или sync=True) или
+        после ее передачи ОС (режим "batch")
+        """
+        if sync is None:
+            sync = self.sync_mode == "commit"
+        with self._lock:
+            self._next_seq += 1
+            seq = self._next_seq
+            self._pending.append(_encoder.encode(entry) + "\n")
+        self._write(seq, sync)
+        return seq
+
+    def sync(self):
+        """
+        Сбрасывает на диск записи, дописанные без fsync
+        """
+        with self._lock:
+            self._timer = None
+            seq = self._written_seq
+        self._write(seq, True)
+
+    def _write(self, seq, sync):
+        with self._lock:
+            while (self._durable_seq if sync else self._written_seq) < seq:
+                if not self._flushing:
+                    break
+                self._flushed.wait()
+            else:
+                return
+            self._flushing = True
+
+        try:
+            self._flush(sync)
+        finally:
+            with self._lock:
+                self._flushing = False
+                self._flushed.notify_all()
+
+    def _flush(self, sync):
+        if sync and self.commit_delay:
+            time.sleep(self.commit_delay)
+        with self._lock:
+            lines, self._pending = self._pending, []
+            last_seq = self._next_seq
+            unsynced_bytes = self._unsynced_bytes
+        try:
+            os.makedirs(self.data_dir, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                start = f.tell()
+                f.write("".join(lines))
+                f.flush()
+                written = f.tell() - start
+                sync = sync or unsynced_bytes + written >= self.sync_bytes
+                if sync:
+                    os.fsync(f.fileno())
+        except BaseException:
+            with self._lock:
+                self._pending = lines + self._pending
+            raise
+        metrics.count("bytes_written", written)
+        if sync:
+            metrics.count("wal_syncs")
+        with self._lock:
+            self._written_seq = last_seq
+            if sync:
+                self._durable_seq = last_seq
+                self._unsynced_bytes = 0
+            else:
+                self._unsynced_bytes += written
+                self._schedule_sync()
+
+    def _schedule_sync(self):
+        # вызывается под self._lock
+        if self._timer is None:
+            self._timer = threading.Timer(self.sync_interval, self.sync)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def lock(self, exclusive=False):
+        """
+        Блокировка журнала между процессами
+        """
+        return file_lock(self.path + ".lock", exclusive)
+
+    def size(self):
+        """
+        Возвращает размер журнала в байтах
+        """
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def mark_dirty(self, path):
+        """
+        Запоминает файл, измененный без fsync: он будет
+        сброшен на диск в контрольной точке
+        """
+        with self._lock:
+            self._dirty_paths.add(path)
+
+    def read_entries(self):
+        """
+        Читает записи журнала. Оборванная последняя
+        строка (незавершенная запись) игнорируется
+        """
+        entries = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def checkpoint(self, paths=()):
+        """
+        Сбрасывает на диск измененные файлы данных (и файлы paths)
+        и очищает журнал: все его записи уже применены.
+        Вызывается под исключительной блокировкой журнала
+        """
+        with self._lock:
+            dirty_paths, self._dirty_paths = self._dirty_paths, set()
+        for path in dirty_paths | set(paths):
+            fsync_path(path)
+        if os.path.exists(self.path):
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.flush()
+                os.fsync(f.fileno())
+        # записи журнала больше не нужны: их изменения на диске
+        with self._lock:
+            self._durable_seq = max(self._durable_seq, self._written_seq)
+            self._unsynced_bytes = 0
+
+
+_logs = {}
+
+
+def get_wal(data_dir="data"):
+    """
+    Возвращает общий для процесса журнал каталога данных
+    """
+    if data_dir not in _logs:
+        _logs[data_dir] = WriteAheadLog(data_dir)
+    return _logs[data_dir]
@@ -0,0 +1,58 @@
+import pytest
+
+from src.primitive_db import database, index, utils, vector, wal
+from src.primitive_db.cache import table_cache
+from src.primitive_db.core import select_cacher
+from src.primitive_db.database import Database
+
+
+def reset_process_state():
+    """
+    Сбрасывает состояние процесса, привязанное к относительным путям
+    data/ и db_meta.json: каждый тест работает в своем каталоге
+    """
+    table_cache.clear()
+    select_cacher.invalidate()
+    vector._batch_cache.clear()
+    index._loaded_indexes.clear()
+    index._id_order_checked.clear()
+    utils._reserved_ids.clear()
+    wal._logs.clear()
+    database._recovered_dirs.clear()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Пустой рабочий каталог базы
+    """
+    monkeypatch.chdir(tmp_path)
+    reset_process_state()
+    yield tmp_path
+    reset_process_state()
+
+
+@pytest.fixture
+def db(workdir):
+    """
+    База в пустом каталоге, опасные операции без подтверждения
+    """
+    db = Database(force=True)
+    yield db
+    db.close()
+
+
+@pytest.fixture(params=utils.STORAGE_FORMATS)
+def storage(request):
+    return request.param
+
+
+@pytest.fixture
+def users(db, storage):
+    """
+    Таблица users в каждом формате хранения с тремя записями
+    """
+    db.create_table("users", ["name:str", "age:int", "is_active:bool"], storage)
+    db.insert_many("users", [["Anna", 31, True], ["Boris", 25, False],
+                             ["Vera", 40, True]])
+    return "users"
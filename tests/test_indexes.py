@@ -0,0 +1,84 @@
+import pytest
+
+from src.primitive_db.cache import table_cache
+
+
+def ids(records):
+    return [record["ID"] for record in records]
+
+
+def select_ids(db, table_name, column, value):
+    """
+    ID записей с column = value, найденных по индексу. Проверяет,
+    что полный просмотр всех записей дает то же самое
+    """
+    found = ids(db.select(table_name, [(column, "=", str(value))]))
+    assert found == [record["ID"] for record in db.select(table_name)
+                     if record[column] == value]
+    return found
+
+
+@pytest.fixture(params=["hash", "sorted"])
+def indexed(request, db, users):
+    db.create_index(users, "age", request.param)
+    db.create_index(users, "is_active", request.param)
+    return users
+
+
+def test_lookup_uses_index(db, indexed):
+    plan = db.explain(f"select from {indexed} where age = 25")
+    assert plan["access"].startswith("индекс")
+    assert ids(db.select(indexed, [("age", "=", "25")])) == [1]
+
+
+def test_insert_updates_index(db, indexed):
+    db.insert(indexed, ["Gleb", 25, True])
+    db.insert_many(indexed, [["Dina", 25, False], ["Egor", 50, True]])
+
+    assert select_ids(db, indexed, "age", 25) == [1, 3, 4]
+    assert select_ids(db, indexed, "age", 50) == [5]
+
+
+def test_update_moves_index_entries(db, indexed):
+    db.update(indexed, {"age": 40, "is_active": False},
+              [("name", "=", "Anna")])
+
+    assert select_ids(db, indexed, "age", 31) == []
+    assert select_ids(db, indexed, "age", 40) == [0, 2]
+    assert select_ids(db, indexed, "is_active", True) == [2]
+
+
+def test_delete_removes_index_entries(db, indexed):
+    db.delete(indexed, [("age", "=", "40")])
+
+    assert select_ids(db, indexed, "age", 40) == []
+    assert select_ids(db, indexed, "is_active", True) == [0]
+
+
+def test_index_survives_reload(db, indexed):
+    db.insert(indexed, ["Gleb", 25, True])
+    table_cache.clear()
+
+    assert ids(db.select(indexed, [("age", "=", "25")])) == [1, 3]
+    assert db.info(indexed)["indexes"]["age"] in ("hash", "sorted")
+
+
+@pytest.mark.parametrize("value", ["true", "True", "TRUE", True])
+def test_bool_equality_matches_with_and_without_index(db, users, value):
+    where = [("is_active", "=", value)]
+    without_index = ids(db.select(users, where))
+    db.create_index(users, "is_active")
+
+    assert without_index == [0, 2]
+    assert ids(db.select(users, where)) == without_index
+
+
+def test_sorted_index_range(db, users):
+    db.create_index(users, "age", "sorted")
+    where = [("age", "between", ("25", "31"))]
+
+    assert db.explain(f"select from {users} where age between 25 and 31")[
+        "access"].startswith("индекс")
+    assert ids(db.select(users, where)) == [0, 1]
+    db.update(users, {"age": 28}, [("name", "=", "Vera")])
+    assert ids(db.select(users, where)) == [0, 1, 2]
@@ -0,0 +1,60 @@
+from src.primitive_db.cache import table_cache
+from src.primitive_db.utils import get_table_path, read_table_log
+
+
+def log_lines(table_name):
+    with open(get_table_path(table_name, "log"), encoding="utf-8") as f:
+        return [line for line in f if line.strip()]
+
+
+def reload(db, table_name):
+    """
+    Читает таблицу заново из файла, минуя кэш
+    """
+    table_cache.clear()
+    return [record.copy() for record in db.select(table_name)]
+
+
+def test_insert_appends_one_line_per_record(db):
+    db.create_table("events", ["name:str"], "log")
+    for i in range(5):
+        db.insert("events", [f"e{i}"])
+
+    assert len(log_lines("events")) == 5
+    assert [record["name"] for record in reload(db, "events")] == \
+        ["e0", "e1", "e2", "e3", "e4"]
+
+
+def test_update_and_delete_are_replayed(db):
+    db.create_table("events", ["name:str", "size:int"], "log")
+    db.insert_many("events", [["a", 1], ["b", 2], ["c", 3]])
+    db.update("events", {"size": 20}, [("name", "=", "b")])
+    db.delete("events", [("name", "=", "a")])
+
+    # вставка, обновление и удаление только дописываются в журнал
+    assert len(log_lines("events")) == 5
+    assert reload(db, "events") == [{"ID": 1, "name": "b", "size": 20},
+                                    {"ID": 2, "name": "c", "size": 3}]
+
+
+def test_compaction_keeps_one_line_per_record(db):
+    db.create_table("events", ["name:str", "size:int"], "log")
+    db.insert_many("events", [["a", 1], ["b", 2], ["c", 3]])
+    for size in range(10):
+        db.update("events", {"size": size}, [("name", "=", "c")])
+    db.delete("events", [("name", "=", "a")])
+    before = reload(db, "events")
+
+    assert db.compact_table("events") == 2
+    assert len(log_lines("events")) == 2
+    assert reload(db, "events") == before
+
+
+def test_torn_last_line_is_ignored(db):
+    db.create_table("events", ["name:str"], "log")
+    db.insert_many("events", [["a"], ["b"]])
+    with open(get_table_path("events", "log"), "a", encoding="utf-8") as f:
+        f.write('{"op": "put", "row": {"ID": 2, "na')
+
+    assert [record["ID"] for record in read_table_log("events")] == [0, 1]
+    assert len(reload(db, "events")) == 2
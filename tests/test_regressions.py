@@ -0,0 +1,60 @@
+import pytest
+
+from src.primitive_db.errors import ColumnNotFoundError, ValidationError
+from src.primitive_db.utils import get_wal
+
+
+def snapshot(db, table_name):
+    return [record.copy() for record in db.select(table_name)]
+
+
+@pytest.mark.parametrize("values", [
+    {"age": "abc"}, {"is_active": "maybe"}, {"age": 31.5}])
+def test_update_rejects_values_of_wrong_type(db, users, values):
+    before = snapshot(db, users)
+    wal_size = get_wal().size()
+
+    with pytest.raises(ValidationError):
+        db.update(users, values, [("name", "=", "Anna")])
+    # значение отклонено до записи в WAL и в файлы таблицы
+    assert get_wal().size() == wal_size
+    assert snapshot(db, users) == before
+
+
+def test_update_converts_values_to_column_type(db, users):
+    db.update(users, {"age": "32", "is_active": "false"},
+              [("name", "=", "Anna")])
+
+    record = db.select(users, [("name", "=", "Anna")])[0]
+    assert record["age"] == 32
+    assert record["is_active"] is False
+
+
+def test_update_rejects_unknown_column(db, users):
+    with pytest.raises(ColumnNotFoundError):
+        db.update(users, {"salary": "100"}, [("name", "=", "Anna")])
+
+
+def test_select_result_is_not_changed_by_later_insert(db, users):
+    selected = db.select(users)
+    db.insert(users, ["Gleb", 19, False])
+
+    assert [record["name"] for record in selected] == ["Anna", "Boris", "Vera"]
+    assert len(db.select(users)) == 4
+
+
+def test_select_result_is_not_changed_inside_transaction(db, users):
+    selected = db.select(users)
+    with db.transaction():
+        db.insert(users, ["Gleb", 19, False])
+        db.delete(users, [("name", "=", "Anna")])
+        assert len(selected) == 3
+
+    assert [record["name"] for record in selected] == ["Anna", "Boris", "Vera"]
+
+
+def test_changing_selected_record_copy_does_not_change_table(db, users):
+    record = db.select(users, [("name", "=", "Anna")])[0].copy()
+    record["age"] = 99
+
+    assert db.select(users, [("name", "=", "Anna")])[0]["age"] == 31
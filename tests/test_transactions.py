@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from src.primitive_db.errors import ConflictError, TransactionError
+
+
+def names(db, table_name="users"):
+    return [record["name"] for record in db.select(table_name)]
+
+
+def in_other_thread(func):
+    """
+    Выполняет func вне транзакции (транзакция хранится
+    в контекстной переменной потока), как другой процесс
+    """
+    thread = threading.Thread(target=func)
+    thread.start()
+    thread.join()
+
+
+def test_commit_applies_changes(db, users):
+    with db.transaction():
+        db.insert(users, ["Gleb", 19, False])
+        db.update(users, {"age": 26}, [("name", "=", "Boris")])
+        db.delete(users, [("name", "=", "Anna")])
+        # изменения видны внутри транзакции
+        assert names(db) == ["Boris", "Vera", "Gleb"]
+
+    assert names(db) == ["Boris", "Vera", "Gleb"]
+    assert db.select(users, [("name", "=", "Boris")])[0]["age"] == 26
+
+
+def test_changes_are_invisible_outside_until_commit(db, users):
+    db.begin()
+    db.insert(users, ["Gleb", 19, False])
+    seen = []
+    in_other_thread(lambda: seen.extend(names(db)))
+    assert seen == ["Anna", "Boris", "Vera"]
+
+    db.commit()
+    seen.clear()
+    in_other_thread(lambda: seen.extend(names(db)))
+    assert seen == ["Anna", "Boris", "Vera", "Gleb"]
+
+
+def test_rollback_discards_changes(db, users):
+    db.begin()
+    db.insert(users, ["Gleb", 19, False])
+    db.delete(users, [("name", "=", "Anna")])
+    assert db.rollback() == [users]
+
+    assert names(db) == ["Anna", "Boris", "Vera"]
+    assert not db.in_transaction()
+
+
+def test_exception_in_block_rolls_back(db, users):
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.insert(users, ["Gleb", 19, False])
+            raise RuntimeError("сбой")
+
+    assert names(db) == ["Anna", "Boris", "Vera"]
+
+
+def test_concurrent_change_conflicts(db, users):
+    db.begin()
+    db.update(users, {"age": 32}, [("name", "=", "Anna")])
+    in_other_thread(lambda: db.insert(users, ["Gleb", 19, False]))
+
+    with pytest.raises(ConflictError):
+        db.commit()
+    assert not db.in_transaction()
+    # изменение транзакции не записано, изменение другого процесса сохранено
+    assert names(db) == ["Anna", "Boris", "Vera", "Gleb"]
+    assert db.select(users, [("name", "=", "Anna")])[0]["age"] == 31
+
+
+def test_commit_without_begin_fails(db):
+    with pytest.raises(TransactionError):
+        db.commit()
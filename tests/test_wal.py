@@ -0,0 +1,103 @@
+import json
+import os
+
+from src.primitive_db import database, metrics
+from src.primitive_db.database import Database
+from src.primitive_db.utils import (
+    checkpoint_wal,
+    count_rejected_wal_entries,
+    get_wal,
+)
+from src.primitive_db.wal import WriteAheadLog
+
+
+def crash_after_wal_commit(entry):
+    """
+    Имитирует сбой после записи в WAL, но до применения к файлам данных
+    """
+    get_wal().commit(entry, sync=True)
+
+
+def test_replay_applies_committed_changes(db):
+    db.create_table("users", ["name:str", "age:int"], "json")
+    db.insert("users", ["Anna", 31])
+    checkpoint_wal()
+    crash_after_wal_commit({"table": "users",
+                            "put": [{"ID": 7, "name": "Boris", "age": "25"}],
+                            "del": [0]})
+
+    assert Database.recover() == 1
+    assert [record.copy() for record in db.select("users")] == \
+        [{"ID": 7, "name": "Boris", "age": 25}]
+    assert get_wal().size() == 0
+
+
+def test_partial_last_entry_is_dropped(db):
+    db.create_table("users", ["name:str"], "log")
+    crash_after_wal_commit({"table": "users", "put": [{"ID": 0, "name": "a"}],
+                            "del": []})
+    # сбой посреди записи следующей фиксации
+    with open(get_wal().path, "a", encoding="utf-8") as f:
+        f.write('{"table": "users", "put": [{"ID": 1, "na')
+
+    assert Database.recover() == 1
+    assert [record["name"] for record in db.select("users")] == ["a"]
+
+
+def test_first_database_of_process_replays_wal(db):
+    db.create_table("users", ["name:str"], "json")
+    crash_after_wal_commit({"table": "users", "put": [{"ID": 0, "name": "a"}],
+                            "del": []})
+    database._recovered_dirs.clear()
+
+    # новый процесс (первый объект Database) восстанавливает изменения
+    restarted = Database(force=True)
+    assert [record["name"] for record in restarted.select("users")] == ["a"]
+    restarted.close()
+
+
+def test_unappliable_entry_is_rejected(db):
+    db.create_table("points", ["x:int"], "columnar")
+    crash_after_wal_commit({"table": "points", "put": [{"ID": 0, "x": "abc"}],
+                            "del": []})
+    crash_after_wal_commit({"table": "points", "put": [{"ID": 1, "x": "5"}],
+                            "del": []})
+
+    assert Database.recover() == 1
+    assert count_rejected_wal_entries() == 1
+    assert [record.copy() for record in db.select("points")] == \
+        [{"ID": 1, "x": 5}]
+
+
+def test_commit_mode_syncs_every_commit(tmp_path):
+    log = WriteAheadLog(str(tmp_path), sync_mode="commit")
+    metrics.reset()
+    for i in range(3):
+        log.commit({"n": i})
+    assert metrics.snapshot()["counters"]["wal_syncs"] == 3
+
+
+def test_batch_mode_defers_fsync(tmp_path):
+    log = WriteAheadLog(str(tmp_path), sync_mode="batch", sync_interval=60)
+    metrics.reset()
+    for i in range(5):
+        log.commit({"n": i})
+
+    # записи уже переданы ОС и видны другим процессам
+    with open(os.path.join(tmp_path, "wal.jsonl"), encoding="utf-8") as f:
+        assert [json.loads(line)["n"] for line in f] == [0, 1, 2, 3, 4]
+    assert metrics.snapshot()["counters"]["wal_syncs"] == 0
+
+    log.sync()
+    assert metrics.snapshot()["counters"]["wal_syncs"] == 1
+    log.commit({"n": 5}, sync=True)
+    assert metrics.snapshot()["counters"]["wal_syncs"] == 2
+
+
+def test_batch_mode_syncs_after_size_limit(tmp_path):
+    log = WriteAheadLog(str(tmp_path), sync_mode="batch", sync_interval=60,
+                        sync_bytes=100)
+    metrics.reset()
+    for i in range(20):
+        log.commit({"n": i})
+    assert 1 <= metrics.snapshot()["counters"]["wal_syncs"] < 20
@@ -0,0 +1,54 @@
+import pytest
+
+from src.primitive_db.errors import ValidationError
+from src.primitive_db.planner import compile_statement
+
+
+def parse_where(condition):
+    plan, params = compile_statement(f"select from users where {condition}")
+    return plan.bind(params)["where"]
+
+
+def test_and_conditions():
+    assert parse_where('age > 30 and name = "Anna Petrova"') == \
+        [("age", ">", "30"), ("name", "=", "Anna Petrova")]
+
+
+def test_and_binds_tighter_than_or():
+    assert parse_where("a = 1 or b = 2 and c = 3") == \
+        [{"or": [[("a", "=", "1")], [("b", "=", "2"), ("c", "=", "3")]]}]
+
+
+def test_parentheses_group_or():
+    assert parse_where("(age > 30 or age < 10) and is_active = true") == \
+        [{"or": [[("age", ">", "30")], [("age", "<", "10")]]},
+         ("is_active", "=", "True")]
+
+
+def test_redundant_parentheses():
+    assert parse_where("((a = 1))") == [("a", "=", "1")]
+
+
+def test_between():
+    assert parse_where("age between 20 and 30 or name = Bob") == \
+        [{"or": [[("age", "between", ("20", "30"))], [("name", "=", "Bob")]]}]
+
+
+def test_unquoted_value_of_several_words():
+    assert parse_where("name = Anna Petrova and age >= 18") == \
+        [("name", "=", "Anna Petrova"), ("age", ">=", "18")]
+
+
+@pytest.mark.parametrize("condition", [
+    "(a = 1", "a = 1)", "a =", "a between 1", "a = 1 and", "or a = 1"])
+def test_malformed_condition(condition):
+    with pytest.raises(ValidationError):
+        parse_where(condition)
+
+
+def test_parsed_conditions_select_records(db, users):
+    found = db.execute(
+        "select from users where (age < 30 or name = Vera) and is_active = true")
+    assert [record["name"] for record in found] == ["Vera"]
+    found = db.execute("select from users where age between 25 and 31")
+    assert [record["name"] for record in found] == ["Anna", "Boris"]